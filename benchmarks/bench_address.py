@@ -0,0 +1,322 @@
+"""Address normalization: speed and accuracy against the examples golden sets.
+
+    python -m benchmarks.bench_address                                     # stub backends, all *_fixed.json
+    python -m benchmarks.bench_address --stub_llm_ms 800 --stub_http_ms 60 --batch_size 10
+    python -m benchmarks.bench_address --backend replay --cassette runs/addr.jsonl.gz
+    python -m benchmarks.bench_address --backend live --cassette runs/addr.jsonl.gz   # record one
+    python -m benchmarks.bench_address --out after.json --baseline before.json
+
+Every raw of `examples/**/*_fixed.json` goes through `normalize_record`
+(fields extracted `--batch_size` records per LLM call first when > 1) and
+the resolved (province, district, commune) IDs are compared with the
+stored `top1_result`.
+
+Backends:
+- stub: the LLM answers with the golden `top1` fields and PosCake resolves
+  names from a gazetteer built from the golden IDs (admin prefixes are
+  stripped, so the fallback chains still run). Offline and deterministic;
+  --stub_llm_ms/--stub_http_ms add fixed latency. The gazetteer cannot
+  guess a commune the golden top1 left empty (the real API sometimes
+  does), so stub accuracy is a fixed reference for deltas, not the
+  production success rate.
+- replay: responses recorded with the cassette layer (CASSETTE_LATENCY or
+  --latency to inject the recorded latency).
+- live: real Gemini/PosCake (needs GOOGLE_API_KEY and POSCAKE_BASE); with
+  --cassette the run is recorded for later replays.
+
+The JSON report has records/sec, per-record p50/p99, LLM and HTTP calls
+per record, cache hit rates, and accuracy vs the golden IDs; --baseline
+adds the change against an earlier report.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional, Tuple
+
+from product_qa import cassette, textnorm
+from product_qa.address_normalizer import (
+    BATCH_PROMPT_TEMPLATE,
+    SYSTEM_PROMPT_TEMPLATE,
+    _normalize_for_match,
+    clean_admin_input_names,
+    evaluate_result_item,
+    extract_address_fields_batch,
+    normalize_record,
+    summarize_poscake_calls,
+)
+from product_qa.metrics import LLM_CALLS
+
+
+LEVELS = ("province", "district", "commune")
+
+
+def load_golden(pattern: str) -> List[Dict[str, Any]]:
+    items: List[Dict[str, Any]] = []
+    seen = set()
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for it in data if isinstance(data, list) else []:
+            raw = it.get("raw") if isinstance(it, dict) else None
+            if raw and raw not in seen:
+                seen.add(raw)
+                items.append(it)
+    return items
+
+
+def _ids(block: Optional[Dict[str, Any]]) -> Tuple[Optional[str], ...]:
+    block = block or {}
+    return tuple(str(block[f"{lv}_id"]) if block.get(f"{lv}_id") is not None else None for lv in LEVELS)
+
+
+def _admin_key(name: Optional[str]) -> str:
+    if not name:
+        return ""
+    stripped = clean_admin_input_names(name, None, None)[0] or name
+    stripped = clean_admin_input_names(None, stripped, None)[1] or stripped
+    stripped = clean_admin_input_names(None, None, stripped)[2] or stripped
+    # "Phường 5": the number alone is not a name
+    key = textnorm.match_key(stripped)
+    return textnorm.match_key(name) if key.isdigit() else key
+
+
+class StubBackend:
+    """LLM answers from golden top1 fields, PosCake geo answers from a gazetteer of golden IDs."""
+
+    mode = "replay"
+
+    def __init__(self, golden: List[Dict[str, Any]], llm_ms: float = 0.0, http_ms: float = 0.0) -> None:
+        self.llm_ms = llm_ms
+        self.http_ms = http_ms
+        self.fields = {it["raw"]: it.get("top1") or {} for it in golden}
+        self.calls = {"generate": 0, "http": 0}
+        self.provinces: Dict[str, Tuple[str, str]] = {}
+        self.districts: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        self.communes: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        for it in golden:
+            res = it.get("top1_result") or {}
+            pid, did, cid = _ids(res)
+            if pid:
+                self.provinces.setdefault(_admin_key(res.get("province_name")), (pid, res.get("province_name")))
+            if pid and did:
+                self.districts.setdefault((pid, _admin_key(res.get("district_name"))), (did, res.get("district_name")))
+            if did and cid:
+                self.communes.setdefault((did, _admin_key(res.get("commune_name"))), (cid, res.get("commune_name")))
+        self._single = SYSTEM_PROMPT_TEMPLATE.split("{RAW}")
+        self._batch = BATCH_PROMPT_TEMPLATE.split("{RAWS}")
+
+    def call(self, kind, payload, hint, fn, encode=None, decode=None) -> Any:
+        if kind == "generate":
+            self.calls["generate"] += 1
+            time.sleep(self.llm_ms / 1000.0)
+            return self._generate(payload["prompt"])
+        if kind == "http":
+            self.calls["http"] += 1
+            time.sleep(self.http_ms / 1000.0)
+            return {"status": 200, "text": json.dumps(self._geo(payload["params"]), ensure_ascii=False)}
+        raise cassette.CassetteMiss(f"Stub backend has no {kind} responses")
+
+    def _generate(self, prompt: str) -> Dict[str, Any]:
+        head, tail = self._batch
+        if prompt.startswith(head):
+            raws = json.loads(prompt[len(head):len(prompt) - len(tail)])
+            return {"items": [dict(self.fields.get(raw, {}), index=i) for i, raw in raws.items()]}
+        head, tail = self._single
+        return dict(self.fields.get(prompt[len(head):len(prompt) - len(tail)], {}))
+
+    def _geo(self, params: Dict[str, str]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        prov = self.provinces.get(_admin_key(params.get("province_name")))
+        if prov is None:
+            return out
+        out.update(province_id=prov[0], province_name=prov[1])
+        dist_key = _admin_key(params.get("district_name"))
+        comm_key = _admin_key(params.get("commune_name"))
+        dist = self.districts.get((prov[0], dist_key)) if dist_key else None
+        if dist is None and not dist_key and comm_key:
+            # Tỉnh + xã: suy ra huyện khi tên xã chỉ có ở một huyện của tỉnh
+            owners = [d for (p, k), d in self.districts.items() if p == prov[0] and (d[0], comm_key) in self.communes]
+            dist = owners[0] if len(owners) == 1 else None
+        if dist is None:
+            return out
+        out.update(district_id=dist[0], district_name=dist[1])
+        comm = self.communes.get((dist[0], comm_key)) if comm_key else None
+        if comm is not None:
+            out.update(commune_id=comm[0], commune_name=comm[1])
+        return out
+
+
+def _cache_snapshot() -> Dict[str, Tuple[int, int]]:
+    snap = {name: (info["hits"], info["misses"]) for name, info in textnorm.cache_info().items()}
+    info = _normalize_for_match.cache_info()
+    snap["normalize_for_match"] = (info.hits, info.misses)
+    replayed = cassette.CASSETTE_REQUESTS
+    snap["cassette"] = (
+        int(sum(replayed.value(kind=k, result="replayed") for k in ("generate", "http", "embed"))),
+        int(sum(replayed.value(kind=k, result="miss") for k in ("generate", "http", "embed"))),
+    )
+    return snap
+
+
+def _cache_rates(before: Dict[str, Tuple[int, int]], after: Dict[str, Tuple[int, int]]) -> Dict[str, Any]:
+    out = {}
+    for name, (hits, misses) in after.items():
+        h = hits - before.get(name, (0, 0))[0]
+        m = misses - before.get(name, (0, 0))[1]
+        out[name] = {"hits": h, "misses": m, "hit_rate": round(h / (h + m), 4) if h + m else None}
+    return out
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2) if ordered else 0.0
+
+
+def accuracy(golden: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    golden_ok = sum(1 for g in golden if (g.get("top1_result") or {}).get("success"))
+    run_ok = sum(1 for r in results if (r.get("top1_result") or {}).get("success"))
+    exact = 0
+    regressions: List[str] = []
+    improvements: List[str] = []
+    for g, r in zip(golden, results):
+        g_ids, r_ids = _ids(g.get("top1_result")), _ids(r.get("top1_result"))
+        g_success = bool((g.get("top1_result") or {}).get("success"))
+        r_success = bool((r.get("top1_result") or {}).get("success"))
+        if g_ids == r_ids:
+            exact += 1
+        elif g_success:
+            regressions.append(g["raw"])
+        elif r_success:
+            improvements.append(g["raw"])
+    n = len(golden)
+    return {
+        "records": n,
+        "golden_success": golden_ok,
+        "run_success": run_ok,
+        "success_delta": run_ok - golden_ok,
+        "ids_match": exact,
+        "ids_match_percent": round(exact / n * 100.0, 2) if n else 0.0,
+        "evaluate_ok": sum(1 for r in results if evaluate_result_item(r)),
+        "regressions": len(regressions),
+        "improvements": len(improvements),
+        "regression_raws": regressions[:10],
+    }
+
+
+def run(golden: List[Dict[str, Any]], batch_size: int) -> Tuple[List[Dict[str, Any]], List[float], float]:
+    results: List[Dict[str, Any]] = []
+    per_record: List[float] = []
+    t_start = time.perf_counter()
+    for start in range(0, len(golden), batch_size):
+        chunk = [g["raw"] for g in golden[start:start + batch_size]]
+        extract_ms = 0.0
+        extracted: List[Optional[Dict[str, Any]]] = [None] * len(chunk)
+        if batch_size > 1:
+            t0 = time.perf_counter()
+            extracted = list(extract_address_fields_batch(chunk, batch_size))
+            # Thời gian trích xuất theo lô chia đều cho các record của lô
+            extract_ms = (time.perf_counter() - t0) * 1000.0 / len(chunk)
+        for raw, top1 in zip(chunk, extracted):
+            t0 = time.perf_counter()
+            try:
+                results.append(normalize_record(raw, None, top1=top1))
+            except cassette.CassetteMiss as e:
+                results.append({"raw": raw, "error": str(e)})
+            per_record.append((time.perf_counter() - t0) * 1000.0 + extract_ms)
+    return results, per_record, time.perf_counter() - t_start
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    def ratio(a: float, b: float) -> Optional[float]:
+        return round(a / b, 3) if b else None
+
+    return {
+        "records_per_sec_ratio": ratio(report["records_per_sec"], baseline.get("records_per_sec", 0)),
+        "p50_ms_delta": round(report["latency_ms"]["p50"] - baseline.get("latency_ms", {}).get("p50", 0), 2),
+        "p99_ms_delta": round(report["latency_ms"]["p99"] - baseline.get("latency_ms", {}).get("p99", 0), 2),
+        "llm_calls_per_record_delta": round(report["llm_calls_per_record"] - baseline.get("llm_calls_per_record", 0), 3),
+        "http_calls_per_record_delta": round(report["http_calls_per_record"] - baseline.get("http_calls_per_record", 0), 3),
+        "ids_match_delta": report["accuracy"]["ids_match"] - baseline.get("accuracy", {}).get("ids_match", 0),
+        "success_delta": report["accuracy"]["run_success"] - baseline.get("accuracy", {}).get("run_success", 0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--golden", default="examples/**/*_fixed.json", help="Glob of golden result files")
+    parser.add_argument("--backend", choices=("stub", "replay", "live"), default="stub")
+    parser.add_argument("--cassette", help="Cassette file: read with --backend replay, written with --backend live")
+    parser.add_argument("--latency", type=float, default=None, help="Replay: recorded-latency factor (default CASSETTE_LATENCY or 0)")
+    parser.add_argument("--stub_llm_ms", type=float, default=0.0)
+    parser.add_argument("--stub_http_ms", type=float, default=0.0)
+    parser.add_argument("--batch_size", type=int, default=1, help="Records per LLM extraction call (1 = inside normalize_record)")
+    parser.add_argument("--limit", type=int, default=0, help="Use only the first N golden records (0 = all)")
+    parser.add_argument("--out", help="Also write the JSON report here")
+    parser.add_argument("--baseline", help="Earlier report to compare with")
+    args = parser.parse_args()
+
+    golden = load_golden(args.golden)
+    if args.limit:
+        golden = golden[: args.limit]
+    if not golden:
+        raise SystemExit(f"No golden records match {args.golden}")
+    if args.backend in ("stub", "replay"):
+        # Replay keys ignore the host; any base turns the PosCake path on
+        os.environ.setdefault("POSCAKE_BASE", "http://poscake.invalid")
+    if args.backend == "replay" and not args.cassette:
+        raise SystemExit("--backend replay needs --cassette")
+
+    with ExitStack() as stack:
+        stub = None
+        if args.backend == "stub":
+            stub = stack.enter_context(cassette.use_backend(StubBackend(golden, args.stub_llm_ms, args.stub_http_ms)))
+        elif args.cassette:
+            latency = args.latency if args.latency is not None else float(os.getenv("CASSETTE_LATENCY", "0") or 0)
+            mode = "replay" if args.backend == "replay" else "record"
+            stack.enter_context(cassette.use_cassette(args.cassette, mode, latency))
+        caches_before = _cache_snapshot()
+        llm_before = LLM_CALLS.value(kind="generate")
+        results, per_record, elapsed = run(golden, max(1, args.batch_size))
+        llm_calls = LLM_CALLS.value(kind="generate") - llm_before
+        caches = _cache_rates(caches_before, _cache_snapshot())
+
+    n = len(results)
+    poscake = summarize_poscake_calls(results) or {}
+    report: Dict[str, Any] = {
+        "backend": args.backend,
+        "golden": args.golden,
+        "records": n,
+        "batch_size": args.batch_size,
+        "seconds": round(elapsed, 3),
+        "records_per_sec": round(n / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(per_record), 2),
+            "p50": _percentile(per_record, 0.5),
+            "p99": _percentile(per_record, 0.99),
+            "max": round(max(per_record), 2),
+        },
+        "llm_calls_per_record": round(llm_calls / n, 3),
+        "http_calls_per_record": poscake.get("calls_per_record", 0.0),
+        "poscake": poscake,
+        "caches": caches,
+        "errors": sum(1 for r in results if "error" in r),
+        "accuracy": accuracy(golden, results),
+    }
+    if stub is not None:
+        report["stub_calls"] = stub.calls
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["vs_baseline"] = compare(report, json.load(f))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Single-record vs batched LLM address extraction: prompt tokens, calls and throughput.
+
+    python -m benchmarks.bench_address_batch                          # offline: prompt tokens and call counts
+    python -m benchmarks.bench_address_batch --live --limit 40        # also run both paths against the LLM
+    python -m benchmarks.bench_address_batch --batch_size 20 --input "examples/failed_addresses (2).json"
+
+Only the extraction step is measured (no PosCake / admin lookups). With
+--live, records/sec, LLM calls and the number of batch elements that had to
+be retried alone are reported for each path.
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+from product_qa.address_normalizer import (
+    ADDRESS_EXTRACTIONS,
+    SYSTEM_PROMPT_TEMPLATE,
+    build_batch_prompt,
+    extract_address_fields,
+    extract_address_fields_batch,
+)
+from product_qa.compaction import estimate_tokens
+from product_qa.metrics import LLM_CALLS
+
+
+def _load_raws(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        data: Any = json.load(f)
+    raws: List[str] = []
+    for it in data if isinstance(data, list) else []:
+        raw = it if isinstance(it, str) else (it.get("raw") if isinstance(it, dict) else None)
+        if raw:
+            raws.append(str(raw))
+    return raws
+
+
+def _prompt_tokens(raws: List[str], batch_size: int) -> Dict[str, float]:
+    single = sum(estimate_tokens(SYSTEM_PROMPT_TEMPLATE.replace("{RAW}", r)) for r in raws)
+    batched = sum(
+        estimate_tokens(build_batch_prompt(raws[i:i + batch_size])) for i in range(0, len(raws), batch_size)
+    )
+    return {
+        "single_total": single,
+        "batched_total": batched,
+        "single_per_record": round(single / len(raws), 1),
+        "batched_per_record": round(batched / len(raws), 1),
+        "reduction_percent": round((1 - batched / single) * 100.0, 1) if single else 0.0,
+    }
+
+
+def _run(fn) -> Dict[str, float]:
+    calls0 = LLM_CALLS.value(kind="generate")
+    retried0 = ADDRESS_EXTRACTIONS.value(mode="retried")
+    t0 = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - t0
+    return {
+        "records": len(out),
+        "seconds": round(elapsed, 2),
+        "records_per_sec": round(len(out) / elapsed, 2) if elapsed else 0.0,
+        "llm_calls": int(LLM_CALLS.value(kind="generate") - calls0),
+        "retried": int(ADDRESS_EXTRACTIONS.value(mode="retried") - retried0),
+        "with_province": sum(1 for r in out if r.get("province_name")),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default="examples/final_addresses.json")
+    parser.add_argument("--batch_size", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=0, help="Use only the first N records (0 = all)")
+    parser.add_argument("--live", action="store_true", help="Call the LLM with both paths")
+    args = parser.parse_args()
+
+    raws = _load_raws(args.input)
+    if args.limit:
+        raws = raws[: args.limit]
+    report: Dict[str, Any] = {
+        "input": args.input,
+        "records": len(raws),
+        "batch_size": args.batch_size,
+        "llm_calls_expected": {"single": len(raws), "batched": -(-len(raws) // args.batch_size)},
+        "prompt_tokens": _prompt_tokens(raws, args.batch_size),
+    }
+    if args.live:
+        report["single"] = _run(lambda: [extract_address_fields(r) for r in raws])
+        report["batched"] = _run(lambda: extract_address_fields_batch(raws, args.batch_size))
+        if report["single"]["seconds"]:
+            report["speedup"] = round(report["single"]["seconds"] / max(report["batched"]["seconds"], 1e-9), 2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Micro-benchmark: dict merge vs array fusion as retrievers and keywords grow.
+
+    python -m benchmarks.bench_fusion
+    python -m benchmarks.bench_fusion --rows 100000 --repeat 200
+
+Hits are synthetic (random rows, sorted scores) so only the merge step is
+timed, not the retrievers themselves. Each cell is R retrievers x (1 + K)
+queries of top_k hits.
+"""
+import argparse
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from product_qa.fusion import Hits, Retriever, fuse
+from product_qa.store import ProductStore
+
+
+class _Named(Retriever):
+    def __init__(self, i: int) -> None:
+        self.name = f"r{i}"
+        self.score_key = f"r{i}_score"
+
+    def search(self, text: str, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Chỉ dùng tên/score_key; hits được sinh sẵn trong benchmark
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+
+# Cách cũ (_merge_candidates trước khi có fusion.py): dict theo display_id + sort_key Python
+def old_merge(bag: List[Dict], top_k: int, preferred_ids: Optional[set]) -> List[Dict]:
+    combined: Dict[str, Dict] = {}
+    for r in bag:
+        did = r["display_id"]
+        score_key = r["source"] + "_score"
+        if did not in combined:
+            combined[did] = r
+            r[score_key] = r["score"]
+        else:
+            combined[did][score_key] = max(combined[did].get(score_key, 0.0), r["score"])
+            combined[did]["score"] = max(combined[did]["score"], r["score"])
+            combined[did]["priority"] = min(combined[did].get("priority", 1_000_000), r.get("priority", 1_000_000))
+
+    def sort_key(item: Dict):
+        pref_flag = 0 if (preferred_ids and item.get("display_id") in preferred_ids) else 1
+        return (pref_flag, int(item.get("priority", 1_000_000)), -float(item.get("score", 0.0)))
+
+    return sorted(combined.values(), key=sort_key)[:top_k]
+
+
+def _lists(rng: np.random.RandomState, rows: int, retrievers: int, keywords: int, top_k: int):
+    per_kw = max(5, top_k // keywords if keywords else top_k)
+    # Hit tập trung vào một nhóm dòng nhỏ để các retriever trùng nhau như thực tế
+    pool = rng.choice(rows, size=min(rows, 4 * top_k), replace=False)
+    out = []
+    for r in range(retrievers):
+        for q in range(1 + keywords):
+            k = top_k if q == 0 else per_kw
+            out.append((r, q, rng.choice(pool, size=k, replace=False), np.sort(rng.rand(k))[::-1]))
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=300)
+    args = parser.parse_args()
+
+    store = ProductStore([f"P{i}" for i in range(args.rows)], [f"san pham {i}" for i in range(args.rows)], np.arange(args.rows))
+    rng = np.random.RandomState(0)
+    preferred = {store.ids[0], store.ids[7]}
+    report: Dict[str, Dict] = {"rows": args.rows, "top_k": args.top_k, "cells": {}}
+    for n_ret in (1, 2, 3, 5):
+        retrievers = [_Named(i) for i in range(n_ret)]
+        for n_kw in (1, 3, 6):
+            lists = _lists(rng, args.rows, n_ret, n_kw, args.top_k)
+            t0 = time.perf_counter()
+            for _ in range(args.repeat):
+                bag = [store.record(int(i), s, f"r{r}") for r, _, rows, scores in lists for i, s in zip(rows, scores)]
+                old = old_merge(bag, args.top_k, preferred)
+            old_ms = (time.perf_counter() - t0) * 1000.0 / args.repeat
+            t0 = time.perf_counter()
+            for _ in range(args.repeat):
+                new = fuse(store, Hits.from_lists(lists), retrievers, top_k=args.top_k, preferred_ids=preferred)
+            new_ms = (time.perf_counter() - t0) * 1000.0 / args.repeat
+            report["cells"][f"R={n_ret},K={n_kw}"] = {
+                "hits": sum(len(x[2]) for x in lists),
+                "dict_merge_ms": round(old_ms, 3),
+                "array_fusion_ms": round(new_ms, 3),
+                # Thứ tự (preferred, priority) giống hệt cách cũ
+                "same_order": [c["display_id"] for c in old] == [c["display_id"] for c in new],
+            }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
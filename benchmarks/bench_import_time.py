@@ -0,0 +1,87 @@
+"""Cold-start import time of the service entry points, in fresh interpreters.
+
+    python -m benchmarks.bench_import_time                    # ship_fee.api + run_demo, 5 runs each
+    python -m benchmarks.bench_import_time --runs 10 --top 15 --module product_qa.address_normalizer
+
+Each run spawns `python -X importtime -c "import <module>"` (what a worker
+respawn pays) and reports wall time, the slowest imports by cumulative time
+and which heavy dependencies got pulled in.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+
+DEFAULT_MODULES = ["ship_fee.api", "run_demo"]
+HEAVY = ["pandas", "numpy", "sklearn", "rapidfuzz", "google.generativeai", "fastapi", "redis"]
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int]]:
+    # Dòng dạng: "import time:  self [us] | cumulative | imported package"
+    rows: List[Tuple[str, int]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            rows.append((parts[2].strip(), int(parts[1].strip())))
+        except ValueError:
+            continue
+    return rows
+
+
+def measure(module: str, runs: int, top: int) -> Dict:
+    walls: List[float] = []
+    rows: List[Tuple[str, int]] = []
+    probe = "import sys; import {m}; print(','.join(h for h in {heavy!r} if h in sys.modules))".format(m=module, heavy=HEAVY)
+    loaded = ""
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", probe],
+            capture_output=True,
+            text=True,
+        )
+        walls.append((time.perf_counter() - t0) * 1000.0)
+        if proc.returncode != 0:
+            return {"module": module, "error": proc.stderr.strip().splitlines()[-1:]}
+        rows = _parse_importtime(proc.stderr)
+        loaded = proc.stdout.strip()
+    ordered = sorted(walls)
+    return {
+        "module": module,
+        "runs": runs,
+        "wall_ms": {
+            "min": round(ordered[0], 1),
+            "p50": round(ordered[len(ordered) // 2], 1),
+            "mean": round(statistics.fmean(ordered), 1),
+        },
+        # Thời gian import (cumulative) của chính module, lần chạy cuối
+        "import_ms": round(next((us for name, us in rows if name == module), 0) / 1000.0, 1),
+        "heavy_deps_loaded": [h for h in loaded.split(",") if h],
+        "slowest": [
+            {"module": name, "cumulative_ms": round(us / 1000.0, 1)}
+            for name, us in sorted(rows, key=lambda r: -r[1])[:top]
+        ],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help="Module to import (repeatable)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    report = [measure(m, args.runs, args.top) for m in (args.module or DEFAULT_MODULES)]
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark: category-routed vs global fuzzy retrieval on a large synthetic catalog.
+
+    python -m benchmarks.bench_partitions
+    python -m benchmarks.bench_partitions --rows 50000 --repeat 3
+
+The sample CSV is replicated with model-code suffixes up to --rows products
+(head nouns, hence partitions, keep the real distribution). Reports rows
+scored per query, fuzzy latency, how often routing fell back to a global
+scan, and whether the best fuzzy score changed.
+"""
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from product_qa.categories import CategoryPartitions
+from product_qa.fusion import FuzzyRetriever
+from product_qa.store import ProductStore
+
+
+QUERIES = [
+    "nồi cơm điện", "chảo chống dính", "máy sấy tóc", "bếp từ", "ấm siêu tốc",
+    "nồi ủ chân không", "máy hút chân không", "quạt không cánh", "thớt gỗ", "cốc thủy tinh",
+    "máy xay sinh tố", "nước giặt xả", "ổ cắm điện", "dao inox", "khăn giấy",
+]
+
+
+def _catalog(csv_path: str, rows: int) -> ProductStore:
+    names = pd.read_csv(csv_path)["clean_name"].astype(str).tolist()
+    out: List[str] = []
+    i = 0
+    while len(out) < rows:
+        out.append(f"{names[i % len(names)]} M{i // len(names)}")
+        i += 1
+    return ProductStore([f"P{j}" for j in range(rows)], out, np.arange(rows))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="Current_product_names__with_clean_name_.csv")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    store = _catalog(args.csv, args.rows)
+    t0 = time.perf_counter()
+    partitions = CategoryPartitions(store)
+    build_ms = (time.perf_counter() - t0) * 1000.0
+    plain = FuzzyRetriever(store)
+    routed = FuzzyRetriever(store, partitions=partitions)
+
+    scanned: List[int] = []
+    fallbacks = 0
+    same_best = 0
+    timings: Dict[str, float] = {"global": 0.0, "routed": 0.0}
+    for q in QUERIES:
+        rows = partitions.rows_for(q)
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            _, g_scores = plain.search(q, args.limit)
+        timings["global"] += (time.perf_counter() - t0) * 1000.0 / args.repeat
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            _, r_scores = routed.search(q, args.limit)
+        timings["routed"] += (time.perf_counter() - t0) * 1000.0 / args.repeat
+        # Có phân vùng nhưng điểm yếu: đã chấm phân vùng rồi quét lại toàn bộ
+        routed_ok = rows is not None and len(r_scores) and r_scores[0] >= routed.min_score
+        if not routed_ok:
+            fallbacks += 1
+        scanned.append(len(store) + (len(rows) if rows is not None else 0) if not routed_ok else len(rows))
+        same_best += int(abs(float(g_scores[0]) - float(r_scores[0])) < 1e-9) if len(g_scores) and len(r_scores) else 0
+    report = {
+        "rows": len(store),
+        "partitions": partitions.stats(),
+        "partition_build_ms": round(build_ms, 1),
+        "queries": len(QUERIES),
+        "mean_rows_scored": {"global": len(store), "routed": int(np.mean(scanned))},
+        "fuzzy_ms_per_query": {k: round(v / len(QUERIES), 3) for k, v in timings.items()},
+        "fallback_or_unrouted": fallbacks,
+        "same_best_score": same_best,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Per-query result-building overhead and resident memory: DataFrame vs ProductStore.
+
+    python -m benchmarks.bench_product_store                  # 100k synthetic SKUs
+    python -m benchmarks.bench_product_store --skus 20000 --queries 500
+
+Both variants run the same rapidfuzz search; only how hits become result
+dicts (`df.iloc[i]` vs parallel arrays) and how the catalog is held differ.
+"""
+import argparse
+import gc
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from product_qa.pipeline import basic_normalize, fuzzy_candidates, load_products
+from product_qa.store import ProductStore
+
+
+def synthetic_catalog(csv_path: str, n: int, seed: int = 7) -> pd.DataFrame:
+    """Blow the real catalog up to `n` rows: real names + a model code and variant."""
+    base = load_products(csv_path)["clean_name"].astype(str).tolist()
+    rng = random.Random(seed)
+    colors = ["đen", "trắng", "xám", "hồng", "xanh", "vàng"]
+    names = [f"{rng.choice(base)} M{rng.randint(100, 9999)} {rng.choice(colors)}" for _ in range(n)]
+    df = pd.DataFrame({
+        "display_id": [f"S{i:06d}" for i in range(n)],
+        "clean_name": names,
+        "priority": np.arange(n, dtype=int),
+    })
+    df["clean_lower"] = df["clean_name"].str.lower()
+    return df
+
+
+def fuzzy_iloc(df: pd.DataFrame, query: str, limit: int = 20) -> List[Dict]:
+    # Cách cũ: tolist() mỗi lần gọi + df.iloc[i] cho từng kết quả
+    choices = df["clean_lower"].tolist()
+    results = process.extract(basic_normalize(query), choices, scorer=fuzz.token_set_ratio, limit=limit)
+    rows: List[Dict] = []
+    for _, score, idx in results:
+        r = df.iloc[idx]
+        rows.append({
+            "display_id": r["display_id"],
+            "clean_name": r["clean_name"],
+            "score": float(score) / 100.0,
+            "priority": int(r["priority"]),
+            "source": "fuzzy",
+        })
+    return rows
+
+
+def _time_ms(fn: Callable[[str], List[Dict]], queries: List[str]) -> List[float]:
+    out = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        out.append((time.perf_counter() - t0) * 1000.0)
+    return out
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+    }
+
+
+def _build_mb(build: Callable[[], object]) -> float:
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return round(current / 1e6, 1)
+
+
+def _records_overhead_ms(df: pd.DataFrame, store: ProductStore, hits: int, rounds: int) -> Dict[str, float]:
+    rows = list(range(0, len(store), max(1, len(store) // hits)))[:hits]
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for i in rows:
+            r = df.iloc[i]
+            {"display_id": r["display_id"], "clean_name": r["clean_name"], "priority": int(r["priority"])}
+    iloc_ms = (time.perf_counter() - t0) * 1000.0 / rounds
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        store.records(rows, [0.0] * len(rows), "fuzzy")
+    store_ms = (time.perf_counter() - t0) * 1000.0 / rounds
+    return {"iloc_ms": round(iloc_ms, 3), "store_ms": round(store_ms, 3)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="Current_product_names__with_clean_name_.csv")
+    parser.add_argument("--skus", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    df = synthetic_catalog(args.csv, args.skus)
+    store = ProductStore.from_frame(df)
+    rng = random.Random(11)
+    queries = [" ".join(rng.choice(store.names).split()[:3]) for _ in range(args.queries)]
+
+    iloc = _time_ms(lambda q: fuzzy_iloc(df, q, args.limit), queries)
+    columnar = _time_ms(lambda q: fuzzy_candidates(store, q, args.limit), queries)
+    report = {
+        "skus": args.skus,
+        "queries": args.queries,
+        "query_ms": {"dataframe_iloc": _summary(iloc), "product_store": _summary(columnar)},
+        # Chỉ phần dựng kết quả (không tính rapidfuzz), 1 truy vấn = `limit` hit
+        "result_building_per_query": _records_overhead_ms(df, store, args.limit, 200),
+        "resident_mb": {
+            "dataframe": _build_mb(lambda: synthetic_catalog(args.csv, args.skus)),
+            "product_store": _build_mb(lambda: ProductStore.from_frame(synthetic_catalog(args.csv, args.skus))),
+        },
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
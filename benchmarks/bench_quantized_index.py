@@ -0,0 +1,95 @@
+"""Memory, latency and recall@10 of float32 vs float16/int8 embedding storage.
+
+    python -m benchmarks.bench_quantized_index                     # 100k x 768 synthetic vectors
+    python -m benchmarks.bench_quantized_index --rows 20000 --shortlist 100
+    python -m benchmarks.bench_quantized_index --npy product_qa/.cache/<key>.npy
+
+Synthetic vectors are clustered (like product names of one category) so the
+coarse quantized ranking is not trivially easy. The float32 baseline is the
+current EmbeddingIndex.search (sklearn cosine over the whole matrix).
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from product_qa.quantize import QuantizedIndex
+
+
+def synthetic(rows: int, dim: int, clusters: int = 400, seed: int = 5) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    return (centers[labels] + 0.35 * rng.normal(size=(rows, dim))).astype(np.float32)
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--npy", help="Use a real cached embedding matrix instead of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top_k", type=int, default=10)
+    parser.add_argument("--shortlist", type=int, default=0, help="0 = PRODUCT_QA_EMBED_SHORTLIST / default")
+    args = parser.parse_args()
+
+    matrix = np.load(args.npy).astype(np.float32) if args.npy else synthetic(args.rows, args.dim)
+    rng = np.random.default_rng(9)
+    # Truy vấn = một dòng của ma trận + nhiễu (giống câu hỏi gần tên sản phẩm)
+    picks = rng.integers(0, len(matrix), size=args.queries)
+    queries = matrix[picks] + 0.3 * rng.normal(size=(args.queries, matrix.shape[1])).astype(np.float32)
+
+    truth: List[np.ndarray] = []
+    base_ms: List[float] = []
+    for q in queries:
+        t0 = time.perf_counter()
+        sims = cosine_similarity([q], matrix)[0]
+        top = np.argsort(-sims)[:args.top_k]
+        base_ms.append((time.perf_counter() - t0) * 1000.0)
+        truth.append(top)
+    report = {
+        "rows": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]),
+        "top_k": args.top_k,
+        "float32": {"resident_mb": round(matrix.nbytes / 2**20, 1), "search_ms": _summary(base_ms), "recall_at_k": 1.0},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "matrix.npy")
+        np.save(path, matrix)
+        mm = np.load(path, mmap_mode="r")
+        for dtype in ("float16", "int8"):
+            index = QuantizedIndex(mm, dtype)
+            times: List[float] = []
+            hits = 0
+            for q, expected in zip(queries, truth):
+                t0 = time.perf_counter()
+                got, _ = index.search(q, top_k=args.top_k, shortlist=args.shortlist or None)
+                times.append((time.perf_counter() - t0) * 1000.0)
+                hits += len(set(got.tolist()) & set(expected.tolist()))
+            report[dtype] = {
+                # float32 gốc chỉ được mmap (trang của shortlist được đọc khi cần), không tính vào RAM thường trú
+                "resident_mb": round(index.resident_nbytes / 2**20, 1),
+                "search_ms": _summary(times),
+                "recall_at_k": round(hits / (len(queries) * args.top_k), 4),
+            }
+            del index
+        del mm
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Prompt size (and optionally latency) of rerank_with_llm with and without compaction.
+
+    python -m benchmarks.bench_rerank_prompt                 # offline: prompt tokens only
+    python -m benchmarks.bench_rerank_prompt --live          # also time real LLM calls
+    python -m benchmarks.bench_rerank_prompt --top_k 40 --budget 500
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Dict, List
+
+from product_qa.compaction import estimate_tokens, get_rerank_token_budget
+from product_qa.pipeline import (
+    build_rerank_prompt,
+    call_llm_json,
+    load_api_key,
+    load_products,
+    retrieve_candidates,
+)
+from product_qa.store import ProductStore
+
+
+# Bộ truy vấn cố định: (câu hỏi, keywords như extract_keywords trả về)
+QUERIES: List[Dict] = [
+    {"q": "cho tôi nồi ủ, nồi cơm điện", "keywords": ["nồi ủ", "nồi cơm điện"]},
+    {"q": "nồi cơm điện loại nào tốt", "keywords": ["nồi cơm điện"]},
+    {"q": "chảo chống dính size 28 còn không", "keywords": ["chảo chống dính"]},
+    {"q": "bếp từ đơn với chảo inox", "keywords": ["bếp từ đơn", "chảo inox"]},
+    {"q": "máy hút chân không", "keywords": ["máy hút chân không"]},
+    {"q": "quần short gió nam", "keywords": ["quần short gió"]},
+    {"q": "bộ nồi amey 9 món", "keywords": ["bộ nồi amey"]},
+    {"q": "máy xay sinh tố cầm tay", "keywords": ["máy xay sinh tố"]},
+    {"q": "ấm siêu tốc với bình giữ nhiệt", "keywords": ["ấm siêu tốc", "bình giữ nhiệt"]},
+    {"q": "nước giặt xả bali", "keywords": ["nước giặt xả"]},
+    {"q": "máy hút bụi cầm tay kailer", "keywords": ["máy hút bụi cầm tay"]},
+    {"q": "nồi áp suất 6 lít", "keywords": ["nồi áp suất"]},
+]
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        "mean": round(statistics.fmean(ordered), 2),
+        "p50": round(ordered[len(ordered) // 2], 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="Current_product_names__with_clean_name_.csv")
+    parser.add_argument("--top_k", type=int, default=20)
+    parser.add_argument(
+        "--budget", type=int, default=None,
+        help="Token budget of the compacted prompt (default PRODUCT_QA_RERANK_TOKEN_BUDGET or 400, as at runtime)",
+    )
+    parser.add_argument("--live", action="store_true", help="Call the LLM to measure rerank latency")
+    args = parser.parse_args()
+    if args.budget is None:
+        args.budget = get_rerank_token_budget()
+
+    store = ProductStore.from_frame(load_products(args.csv))
+    if args.live:
+        load_api_key()
+    rows = []
+    for item in QUERIES:
+        cands = retrieve_candidates(store, None, item["keywords"], item["q"], top_k=args.top_k)
+        row = {"q": item["q"], "candidates": len(cands)}
+        for label, budget in (("full", 0), ("compact", args.budget)):
+            t0 = time.perf_counter()
+            prompt = build_rerank_prompt(item["q"], item["keywords"], cands, token_budget=budget)
+            row[f"{label}_build_ms"] = (time.perf_counter() - t0) * 1000.0
+            row[f"{label}_tokens"] = estimate_tokens(prompt)
+            if args.live:
+                t0 = time.perf_counter()
+                call_llm_json(prompt)
+                row[f"{label}_llm_ms"] = (time.perf_counter() - t0) * 1000.0
+        rows.append(row)
+
+    report = {"top_k": args.top_k, "budget": args.budget, "queries": len(rows)}
+    for key in ("full_tokens", "compact_tokens", "full_build_ms", "compact_build_ms", "full_llm_ms", "compact_llm_ms"):
+        vals = [r[key] for r in rows if key in r]
+        if vals:
+            report[key] = _summary(vals)
+    full = sum(r["full_tokens"] for r in rows)
+    compact = sum(r["compact_tokens"] for r in rows)
+    report["token_reduction_percent"] = round((1 - compact / full) * 100.0, 1) if full else 0.0
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Micro-benchmark: translation-table folding vs the NFD + category path.
+
+    python -m benchmarks.bench_textnorm
+    python -m benchmarks.bench_textnorm --repeat 20
+
+Corpus = product names from the CSV + admin-unit style strings. "cold" is
+one pass over distinct strings (no memoization benefit), "hot" repeats the
+same strings the way the address normalizer does for every record.
+"""
+import argparse
+import json
+import re
+import time
+import unicodedata
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+from product_qa.textnorm import fold, fold_many, match_key
+
+
+ADMIN_SAMPLES = [
+    "Thành phố Hà Nội", "Quận Đống Đa", "Phường Láng Thượng", "Tỉnh Bà Rịa - Vũng Tàu",
+    "Huyện Đức Trọng", "Thị xã Sơn Tây", "Xã Đông Hưng", "Thị trấn Phú Mỹ", "Quận Hà Đông",
+    "Thành phố Hồ Chí Minh", "Phường Bến Nghé", "Tỉnh Đắk Lắk", "Huyện Ứng Hòa",
+]
+
+
+# Cách cũ (address_normalizer trước khi dùng textnorm)
+def old_strip_diacritics(text: str) -> str:
+    if not isinstance(text, str):
+        return ""
+    norm = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in norm if unicodedata.category(ch) != "Mn")
+
+
+def old_basic_normalize(text: str) -> str:
+    text = str(text or "").strip().lower()
+    text = re.sub(r"[\.,;:!?()\[\]\"']", " ", text)
+    return re.sub(r"\s+", " ", text)
+
+
+def old_match(text: str) -> str:
+    return old_basic_normalize(old_strip_diacritics(text))
+
+
+def _bench(fn: Callable[[str], str], corpus: List[str], repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for s in corpus:
+            fn(s)
+    return (time.perf_counter() - t0) * 1e6 / (repeat * len(corpus))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="Current_product_names__with_clean_name_.csv")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    names = pd.read_csv(args.csv)["clean_name"].astype(str).tolist()
+    corpus = list(dict.fromkeys(names + ADMIN_SAMPLES))
+    match_key.cache_clear()
+
+    report: Dict[str, Dict[str, float]] = {"strings": {"distinct": len(corpus), "repeat": args.repeat}}
+    report["fold_us_per_string"] = {
+        "nfd_category": round(_bench(old_strip_diacritics, corpus, args.repeat), 3),
+        "translate_table": round(_bench(fold, corpus, args.repeat), 3),
+    }
+    cold = _bench(lambda s: match_key.__wrapped__(s), corpus, args.repeat)
+    hot = _bench(match_key, corpus, args.repeat)
+    report["match_key_us_per_string"] = {
+        "old_path": round(_bench(old_match, corpus, args.repeat), 3),
+        "cold_uncached": round(cold, 3),
+        "hot_memoized": round(hot, 3),
+    }
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        fold_many(corpus)
+    bulk = (time.perf_counter() - t0) * 1e6 / (args.repeat * len(corpus))
+    report["bulk_fold_many_us_per_string"] = {"fold_many": round(bulk, 3)}
+    # Kết quả phải trùng cách cũ, trừ đ→d (cách cũ giữ nguyên "đ") và khoảng trắng thừa cuối chuỗi
+    mismatches = [s for s in corpus if old_match(s).replace("đ", "d").strip() != match_key(s)]
+    report["equivalent_except_d"] = {"mismatches": len(mismatches)}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""Distributed address-normalization jobs on a Redis queue.
+
+`enqueue` stores every raw address of a job under its record hash (sha1 of
+the stripped raw) and pushes each new hash once onto the pending list. Any
+number of workers (`run_worker`, in this process or others sharing
+REDIS_URL) claim records in batches with RPOPLPUSH into a processing list
+plus a lease, extract fields with one batched LLM call, and ack each
+result. Results are written with HSETNX under the record hash, so a record
+redone after a lost ack keeps its first result. A record whose worker died
+is requeued when its lease expires; after `max_attempts` failures it is
+parked in the failed hash. `progress` and `results` read the shared state,
+so the reporter and the output writer can run anywhere.
+
+Without REDIS_URL (or without the redis package) the same queue lives in
+process (`_InMemoryJobs`): enough for tests and for worker threads.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import redis  # type: ignore
+except Exception:  # pragma: no cover
+    redis = None  # type: ignore
+
+from .address_normalizer import (
+    AdminApiClient,
+    _truncate_raw,
+    evaluate_result_item,
+    extract_address_fields_batch,
+    get_llm_batch_size,
+    normalize_record,
+)
+from .metrics import REDIS_ERRORS, REGISTRY
+
+
+JOB_RECORDS = REGISTRY.counter(
+    "address_job_records_total",
+    "Address job records by outcome (done, duplicate = already had a result, retried, failed).",
+    ["result"],
+)
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def record_hash(raw: str) -> str:
+    return hashlib.sha1(str(raw or "").strip().encode("utf-8")).hexdigest()
+
+
+class AddressJobQueue:
+    """Pending list, processing list + leases, and result/failure hashes of one job."""
+
+    def __init__(
+        self,
+        job_id: str,
+        redis_url: Optional[str] = None,
+        lease_s: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        ttl_s: Optional[float] = None,
+    ) -> None:
+        self.job_id = job_id
+        self.prefix = f"addr_job:{job_id}"
+        # Thời gian giữ một record; worker chết quá hạn này thì record được trả lại hàng đợi
+        self.lease_s = _env_number("ADDR_JOB_LEASE_S", 300) if lease_s is None else lease_s
+        self.max_attempts = max(1, int(_env_number("ADDR_JOB_MAX_ATTEMPTS", 3) if max_attempts is None else max_attempts))
+        self.ttl_s = _env_number("ADDR_JOB_TTL_S", 7 * 86400) if ttl_s is None else ttl_s
+        url = redis_url if redis_url is not None else os.getenv("REDIS_URL")
+        self.client = None
+        if url and redis is not None:
+            try:
+                self.client = redis.Redis.from_url(url, decode_responses=True)
+            except Exception:
+                self.client = None
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def _expire(self, pipe, *names: str) -> None:
+        for name in names:
+            pipe.expire(self._key(name), max(1, int(self.ttl_s)))
+
+    def enqueue(self, raws: List[str]) -> Tuple[int, int]:
+        """Add raws to the job; returns (records added to the output order, new records queued)."""
+        raws = [str(r) for r in raws if r and str(r).strip()]
+        if not raws:
+            return 0, 0
+        hashes = [record_hash(r) for r in raws]
+        if self.client is None:
+            return len(raws), _InMemoryJobs.enqueue(self.prefix, hashes, raws)
+        try:
+            pipe = self.client.pipeline()
+            pipe.rpush(self._key("order"), *hashes)
+            for h, raw in zip(hashes, raws):
+                pipe.hsetnx(self._key("raw"), h, raw)
+            flags = pipe.execute()[1:]
+            # HSETNX = 1 only for the first copy of a record, across every enqueuer
+            new = [h for h, added in zip(hashes, flags) if added]
+            pipe = self.client.pipeline()
+            if new:
+                # LPUSH + RPOPLPUSH: oldest at the right end, claimed first
+                pipe.lpush(self._key("pending"), *new)
+            self._expire(pipe, "order", "raw", "pending")
+            pipe.execute()
+        except Exception:
+            REDIS_ERRORS.inc(component="address_jobs", op="enqueue")
+            raise
+        return len(raws), len(new)
+
+    def claim(self, n: int) -> List[Tuple[str, str]]:
+        """Up to `n` (record hash, raw) pairs, leased to the caller for `lease_s`."""
+        if self.client is None:
+            return _InMemoryJobs.claim(self.prefix, n, time.time() + self.lease_s)
+        out: List[Tuple[str, str]] = []
+        try:
+            for _ in range(max(0, n)):
+                h = self.client.rpoplpush(self._key("pending"), self._key("processing"))
+                if h is None:
+                    break
+                pipe = self.client.pipeline()
+                pipe.hset(self._key("leases"), h, time.time() + self.lease_s)
+                pipe.hget(self._key("raw"), h)
+                pipe.hexists(self._key("results"), h)
+                _, raw, done = pipe.execute()
+                if done or raw is None:
+                    # Trả lại sau khi hết hạn lease mà kết quả đã có: chỉ cần gỡ khỏi processing
+                    self._release(h)
+                    continue
+                out.append((h, raw))
+        except Exception:
+            REDIS_ERRORS.inc(component="address_jobs", op="claim")
+            raise
+        return out
+
+    def _release(self, h: str) -> None:
+        pipe = self.client.pipeline()
+        pipe.lrem(self._key("processing"), 1, h)
+        pipe.hdel(self._key("leases"), h)
+        pipe.execute()
+
+    def ack(self, h: str, result: Dict[str, Any]) -> bool:
+        """Store the result of a claimed record; False if it already had one (nothing changes)."""
+        payload = json.dumps(result, ensure_ascii=False, default=str)
+        correct = evaluate_result_item(result)
+        if self.client is None:
+            stored = _InMemoryJobs.ack(self.prefix, h, payload, correct)
+        else:
+            try:
+                pipe = self.client.pipeline()
+                pipe.hsetnx(self._key("results"), h, payload)
+                pipe.lrem(self._key("processing"), 1, h)
+                pipe.hdel(self._key("leases"), h)
+                stored = bool(pipe.execute()[0])
+                pipe = self.client.pipeline()
+                if stored and correct:
+                    pipe.hincrby(self._key("stats"), "correct", 1)
+                self._expire(pipe, "results", "stats")
+                pipe.execute()
+            except Exception:
+                REDIS_ERRORS.inc(component="address_jobs", op="ack")
+                raise
+        JOB_RECORDS.inc(result="done" if stored else "duplicate")
+        return stored
+
+    def fail(self, h: str, error: str) -> bool:
+        """Give a claimed record back; True if it was requeued, False if parked as failed."""
+        if self.client is None:
+            retried = _InMemoryJobs.fail(self.prefix, h, error, self.max_attempts)
+        else:
+            try:
+                pipe = self.client.pipeline()
+                pipe.lrem(self._key("processing"), 1, h)
+                pipe.hdel(self._key("leases"), h)
+                removed, _ = pipe.execute()
+                if not removed:
+                    # Đã có tiến trình khác trả record này về (lease hết hạn): không đẩy lần hai
+                    return True
+                attempts = self.client.hincrby(self._key("attempts"), h, 1)
+                retried = attempts < self.max_attempts
+                pipe = self.client.pipeline()
+                if retried:
+                    pipe.lpush(self._key("pending"), h)
+                else:
+                    pipe.hset(self._key("failed"), h, error)
+                    self._expire(pipe, "failed")
+                self._expire(pipe, "attempts")
+                pipe.execute()
+            except Exception:
+                REDIS_ERRORS.inc(component="address_jobs", op="fail")
+                raise
+        JOB_RECORDS.inc(result="retried" if retried else "failed")
+        return retried
+
+    def requeue_expired(self) -> int:
+        """Requeue records whose lease ran out (worker died or hung); returns how many."""
+        if self.client is None:
+            expired = _InMemoryJobs.expired(self.prefix, time.time())
+        else:
+            try:
+                leases = self.client.hgetall(self._key("leases"))
+                in_flight = self.client.lrange(self._key("processing"), 0, -1)
+            except Exception:
+                REDIS_ERRORS.inc(component="address_jobs", op="requeue")
+                return 0
+            now = time.time()
+            expired = [h for h, deadline in leases.items() if float(deadline) <= now]
+            for h in in_flight:
+                if h not in leases:
+                    # Vừa RPOPLPUSH nhưng chưa kịp ghi lease: cho một lease mới thay vì coi là chết
+                    self.client.hsetnx(self._key("leases"), h, now + self.lease_s)
+        for h in expired:
+            self.fail(h, "lease expired")
+        return len(expired)
+
+    def progress(self) -> Dict[str, Any]:
+        if self.client is None:
+            counts = _InMemoryJobs.counts(self.prefix)
+        else:
+            try:
+                pipe = self.client.pipeline()
+                pipe.hlen(self._key("raw"))
+                pipe.hlen(self._key("results"))
+                pipe.hlen(self._key("failed"))
+                pipe.llen(self._key("pending"))
+                pipe.llen(self._key("processing"))
+                pipe.hget(self._key("stats"), "correct")
+                total, done, failed, pending, in_flight, correct = pipe.execute()
+            except Exception:
+                REDIS_ERRORS.inc(component="address_jobs", op="progress")
+                raise
+            counts = {
+                "total": int(total),
+                "done": int(done),
+                "failed": int(failed),
+                "pending": int(pending),
+                "in_flight": int(in_flight),
+                "correct": int(correct or 0),
+            }
+        counts["finished"] = counts["total"] > 0 and counts["done"] + counts["failed"] >= counts["total"]
+        return counts
+
+    def results(self) -> List[Dict[str, Any]]:
+        """One item per enqueued raw, in enqueue order; failed records carry `error` instead of a result."""
+        if self.client is None:
+            order, raws, payloads, failed = _InMemoryJobs.snapshot(self.prefix)
+        else:
+            try:
+                order = self.client.lrange(self._key("order"), 0, -1)
+                raws = self.client.hgetall(self._key("raw"))
+                payloads = self.client.hgetall(self._key("results"))
+                failed = self.client.hgetall(self._key("failed"))
+            except Exception:
+                REDIS_ERRORS.inc(component="address_jobs", op="results")
+                raise
+        out: List[Dict[str, Any]] = []
+        for h in order:
+            if h in payloads:
+                out.append(json.loads(payloads[h]))
+            elif h in failed:
+                out.append({"raw": raws.get(h), "error": failed[h]})
+        return out
+
+    def delete(self) -> None:
+        if self.client is None:
+            _InMemoryJobs.delete(self.prefix)
+            return
+        names = ("order", "raw", "pending", "processing", "leases", "results", "failed", "attempts", "stats")
+        try:
+            self.client.delete(*(self._key(n) for n in names))
+        except Exception:
+            REDIS_ERRORS.inc(component="address_jobs", op="delete")
+
+
+def run_worker(
+    queue: AddressJobQueue,
+    api_client: Optional[AdminApiClient] = None,
+    batch_size: Optional[int] = None,
+    wait: bool = False,
+    poll_s: float = 1.0,
+    stop: Optional[threading.Event] = None,
+) -> int:
+    """Claim, normalize and ack records until the job is drained; returns records acked.
+
+    wait=True keeps polling after the queue is empty until every record is
+    done or failed (records leased by dead workers come back on expiry).
+    """
+    batch_size = get_llm_batch_size() if batch_size is None else max(1, batch_size)
+    handled = 0
+    last_reap = 0.0
+    while stop is None or not stop.is_set():
+        if time.time() - last_reap >= max(1.0, queue.lease_s / 4):
+            queue.requeue_expired()
+            last_reap = time.time()
+        claimed = queue.claim(batch_size)
+        if not claimed:
+            state = queue.progress()
+            if state["finished"] or (not wait and state["in_flight"] == 0):
+                break
+            time.sleep(poll_s)
+            continue
+        try:
+            extracted = extract_address_fields_batch([raw for _, raw in claimed], batch_size)
+        except Exception as e:
+            for h, _ in claimed:
+                queue.fail(h, f"extract: {e}")
+            continue
+        for (h, raw), top1 in zip(claimed, extracted):
+            try:
+                result = normalize_record(raw, api_client, top1=top1)
+            except Exception as e:
+                print(f"[address_jobs] {_truncate_raw(raw)}: {e}")
+                queue.fail(h, str(e))
+                continue
+            queue.ack(h, result)
+            handled += 1
+    return handled
+
+
+def format_progress(state: Dict[str, Any], rate: Optional[float] = None) -> str:
+    finished = state["done"] + state["failed"]
+    ratio = (state["correct"] / state["done"] * 100.0) if state["done"] else 0.0
+    line = (
+        f"[{finished}/{state['total']}] {round(ratio, 2)}% ok | failed {state['failed']}"
+        f" | pending {state['pending']} | in flight {state['in_flight']}"
+    )
+    if rate is not None:
+        line += f" | {rate:.2f} rec/s"
+    return line
+
+
+def watch_progress(
+    queue: AddressJobQueue,
+    interval_s: float = 2.0,
+    stop: Optional[threading.Event] = None,
+    emit: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    """Print job progress every `interval_s` until it finishes (or `stop` is set); returns the last state."""
+    t0 = time.time()
+    start = queue.progress()
+    base = start["done"] + start["failed"]
+    last = None
+    while True:
+        state = queue.progress()
+        finished = state["done"] + state["failed"]
+        if last is None or finished != last:
+            elapsed = time.time() - t0
+            emit(format_progress(state, (finished - base) / elapsed if elapsed > 0 else None))
+            last = finished
+        if state["finished"] or (stop is not None and stop.is_set()):
+            return state
+        time.sleep(interval_s)
+
+
+def summarize_job(queue: AddressJobQueue) -> Dict[str, Any]:
+    state = queue.progress()
+    ratio = (state["correct"] / state["total"] * 100.0) if state["total"] else 0.0
+    return {
+        "correct": state["correct"],
+        "total": state["total"],
+        "ratio_percent": round(ratio, 2),
+        "failed": state["failed"],
+    }
+
+
+class _InMemoryJobs:
+    _jobs: Dict[str, Dict[str, Any]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _job(cls, prefix: str) -> Dict[str, Any]:
+        job = cls._jobs.get(prefix)
+        if job is None:
+            job = {
+                "order": [], "raw": {}, "pending": deque(), "leases": {},
+                "results": {}, "failed": {}, "attempts": {}, "correct": 0,
+            }
+            cls._jobs[prefix] = job
+        return job
+
+    @classmethod
+    def enqueue(cls, prefix: str, hashes: List[str], raws: List[str]) -> int:
+        with cls._lock:
+            job = cls._job(prefix)
+            job["order"].extend(hashes)
+            new = 0
+            for h, raw in zip(hashes, raws):
+                if h not in job["raw"]:
+                    job["raw"][h] = raw
+                    job["pending"].append(h)
+                    new += 1
+            return new
+
+    @classmethod
+    def claim(cls, prefix: str, n: int, deadline: float) -> List[Tuple[str, str]]:
+        with cls._lock:
+            job = cls._job(prefix)
+            out = []
+            while job["pending"] and len(out) < n:
+                h = job["pending"].popleft()
+                if h in job["results"]:
+                    continue
+                job["leases"][h] = deadline
+                out.append((h, job["raw"][h]))
+            return out
+
+    @classmethod
+    def ack(cls, prefix: str, h: str, payload: str, correct: bool) -> bool:
+        with cls._lock:
+            job = cls._job(prefix)
+            job["leases"].pop(h, None)
+            if h in job["results"]:
+                return False
+            job["results"][h] = payload
+            job["correct"] += int(correct)
+            return True
+
+    @classmethod
+    def fail(cls, prefix: str, h: str, error: str, max_attempts: int) -> bool:
+        with cls._lock:
+            job = cls._job(prefix)
+            if job["leases"].pop(h, None) is None:
+                return True
+            job["attempts"][h] = job["attempts"].get(h, 0) + 1
+            if job["attempts"][h] < max_attempts:
+                job["pending"].append(h)
+                return True
+            job["failed"][h] = error
+            return False
+
+    @classmethod
+    def expired(cls, prefix: str, now: float) -> List[str]:
+        with cls._lock:
+            return [h for h, deadline in cls._job(prefix)["leases"].items() if deadline <= now]
+
+    @classmethod
+    def counts(cls, prefix: str) -> Dict[str, Any]:
+        with cls._lock:
+            job = cls._job(prefix)
+            return {
+                "total": len(job["raw"]),
+                "done": len(job["results"]),
+                "failed": len(job["failed"]),
+                "pending": len(job["pending"]),
+                "in_flight": len(job["leases"]),
+                "correct": job["correct"],
+            }
+
+    @classmethod
+    def snapshot(cls, prefix: str) -> Tuple[List[str], Dict[str, str], Dict[str, str], Dict[str, str]]:
+        with cls._lock:
+            job = cls._job(prefix)
+            return list(job["order"]), dict(job["raw"]), dict(job["results"]), dict(job["failed"])
+
+    @classmethod
+    def delete(cls, prefix: str) -> None:
+        with cls._lock:
+            cls._jobs.pop(prefix, None)
@@ -1,22 +1,23 @@
 import os
 import re
 import json
-import unicodedata
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
 import sys
+import time
 
-import requests
 from rapidfuzz import fuzz, process
 
-from .pipeline import load_api_key, get_llm_model_name, call_llm_json
+from .cassette import http_get
+from .llm_client import load_api_key, get_llm_model_name, call_llm_json
+from .metrics import REGISTRY, stage
+from .textnorm import PUNCT_TABLE, fold, match_key
 
 
 # -----------------------------
 # Prompt template (from plan)
 # -----------------------------
-SYSTEM_PROMPT_TEMPLATE = (
-    "Bạn là trợ lý chuẩn hóa địa chỉ tiếng Việt. Nhiệm vụ: từ chuỗi “raw” (có thể chứa số điện thoại), "
-    "hãy TRẢ VỀ DUY NHẤT một JSON theo schema:\n"
+_PROMPT_SCHEMA = (
     "{\n"
     "  \"phone_number\": \"<string|null>\",\n"
     "  \"address\": \"<số nhà/ngõ/đường/thôn/xóm...>\",\n"
@@ -25,15 +26,51 @@ SYSTEM_PROMPT_TEMPLATE = (
     "  \"province_name\": \"<tỉnh/thành phố trực thuộc TW>\",\n"
     "  \"full_address\": \"<address + commune + district + province>\"\n"
     "}\n\n"
+)
+
+_PROMPT_RULES = (
     "YÊU CẦU:\n"
     "- Không bịa địa danh. Nếu không chắc, để null trường tương ứng.\n"
     "- Giữ đúng chính tả, thêm dấu tiếng Việt nếu có thể suy ra chắc chắn.\n"
     "- Đưa các thành phần chi tiết (số nhà, ngõ, ngách, hẻm, khu, tổ, thôn, xóm, ấp, bản, buôn) vào \"address\" (KHÔNG đưa các từ này vào \"commune_name\").\n"
     "- Cố gắng điền đủ \"commune_name\", \"district_name\", \"province_name\" bằng TRI THỨC SẴN CÓ về địa danh Việt Nam, kể cả khi người dùng không ghi rõ.\n"
     "- Nếu tên cấp xã có ≥ 3 từ do dính thôn/xóm, hãy loại bỏ từ thừa của thôn/xóm và giữ lõi 1–2 từ của xã/phường/thị trấn.\n"
-    "Đầu vào (raw): \"{RAW}\""
 )
 
+SYSTEM_PROMPT_TEMPLATE = (
+    "Bạn là trợ lý chuẩn hóa địa chỉ tiếng Việt. Nhiệm vụ: từ chuỗi “raw” (có thể chứa số điện thoại), "
+    "hãy TRẢ VỀ DUY NHẤT một JSON theo schema:\n"
+    + _PROMPT_SCHEMA
+    + _PROMPT_RULES
+    + "Đầu vào (raw): \"{RAW}\""
+)
+
+# Many addresses per call: same schema and rules, one element per input, correlated by "index"
+BATCH_PROMPT_TEMPLATE = (
+    "Bạn là trợ lý chuẩn hóa địa chỉ tiếng Việt. Nhiệm vụ: với MỖI chuỗi “raw” trong danh sách đầu vào "
+    "(có thể chứa số điện thoại), chuẩn hóa thành một object theo schema:\n"
+    + _PROMPT_SCHEMA
+    + _PROMPT_RULES
+    + "- Mỗi chuỗi được xử lý độc lập, không lấy địa danh của chuỗi này điền cho chuỗi khác.\n"
+    "TRẢ VỀ DUY NHẤT một JSON dạng {\"items\": [{\"index\": <số thứ tự đầu vào>, ...các trường schema...}, ...]}, "
+    "đúng một phần tử cho mỗi đầu vào, giữ nguyên \"index\".\n"
+    "Đầu vào (JSON, index -> raw): {RAWS}"
+)
+
+ADDRESS_EXTRACTIONS = REGISTRY.counter(
+    "address_llm_extract_total",
+    "Address field extractions by mode (single, batched, retried = malformed batch element redone alone).",
+    ["mode"],
+)
+
+POSCAKE_CALLS = REGISTRY.counter(
+    "address_poscake_calls_total",
+    "PosCake location lookups by fallback step (over_budget = refused by ADDR_POSCAKE_MAX_CALLS).",
+    ["step"],
+)
+
+_FIELD_KEYS = ("phone_number", "address", "commune_name", "district_name", "province_name", "full_address")
+
 
 # -----------------------------
 # Helpers
@@ -54,37 +91,37 @@ ADMIN_PREFIXES = [
 ]
 
 PROVINCE_PREFIX_PATTERN = re.compile(
-    r"^(?i)(tỉnh|thành phố|tp\.?|t\.p\.)\s+"
+    r"(?i)^(tỉnh|thành phố|tp\.?|t\.p\.)\s+"
 )
 
 DISTRICT_PREFIX_PATTERN = re.compile(
-    r"^(?i)(quận|huyện|thành phố|thị xã|tp\.?|t\.p\.)\s+"
+    r"(?i)^(quận|huyện|thành phố|thị xã|tp\.?|t\.p\.)\s+"
 )
 
 COMMUNE_PREFIX_PATTERN = re.compile(
-    r"^(?i)(phường|xã|thị trấn)\s+"
+    r"(?i)^(phường|xã|thị trấn)\s+"
 )
 
 
 def strip_diacritics(text: str) -> str:
-    if not isinstance(text, str):
-        return ""
-    norm = unicodedata.normalize("NFD", text)
-    return "".join(ch for ch in norm if unicodedata.category(ch) != "Mn")
+    # Translation table (includes đ→d), see product_qa/textnorm.py
+    return fold(text)
 
 
 def basic_normalize(text: str) -> str:
-    text = str(text or "").strip().lower()
-    text = re.sub(r"[\.,;:!?()\[\]\"']", " ", text)
-    text = re.sub(r"\s+", " ", text)
-    return text
+    return " ".join(str(text or "").lower().translate(PUNCT_TABLE).split())
 
 
 def normalize_for_match(name: Optional[str]) -> str:
     if not name:
         return ""
-    text = basic_normalize(strip_diacritics(name))
-    tokens = [t for t in text.split() if t]
+    return _normalize_for_match(str(name))
+
+
+@lru_cache(maxsize=65536)
+def _normalize_for_match(name: str) -> str:
+    # Same admin names (provinces, districts) are normalized for every record: memoize
+    tokens = match_key(name).split()
     # drop leading admin prefixes
     while tokens and tokens[0] in ADMIN_PREFIXES:
         tokens.pop(0)
@@ -92,7 +129,7 @@ def normalize_for_match(name: Optional[str]) -> str:
 
 
 def _contains_all(hay: str, needles: List[str]) -> bool:
-    base = basic_normalize(strip_diacritics(hay))
+    base = match_key(str(hay or ""))
     return all(n in base for n in needles)
 
 
@@ -174,7 +211,7 @@ def generate_variants(candidate: Dict[str, Any]) -> List[Dict[str, Any]]:
         # remove hamlet words if mistakenly included
         hamlet_words = {"thon", "thôn", "xom", "xóm", "to", "tổ", "khu", "ap", "ấp", "ban", "bản", "buon", "buôn", "doi", "đội"}
         raw_tokens = [t for t in commune.split() if t]
-        no_hamlet_tokens = [t for t in raw_tokens if basic_normalize(strip_diacritics(t)) not in hamlet_words]
+        no_hamlet_tokens = [t for t in raw_tokens if match_key(t) not in hamlet_words]
         trimmed_tokens = no_hamlet_tokens if no_hamlet_tokens else raw_tokens
         if len(trimmed_tokens) >= 3:
             two_token_comm = " ".join(trimmed_tokens[-2:])
@@ -236,7 +273,7 @@ class AdminApiClient:
 
     def list_provinces(self) -> List[Dict[str, Any]]:
         url = f"{self.base_url}/provinces"
-        r = requests.get(url, timeout=self.timeout)
+        r = http_get(url, timeout=self.timeout)
         r.raise_for_status()
         data = r.json()
         # expected: [{id, name, synonyms?}]
@@ -244,25 +281,58 @@ class AdminApiClient:
 
     def list_districts(self, province_id: str) -> List[Dict[str, Any]]:
         url = f"{self.base_url}/provinces/{province_id}/districts"
-        r = requests.get(url, timeout=self.timeout)
+        r = http_get(url, timeout=self.timeout)
         r.raise_for_status()
         return list(r.json())
 
     def list_communes(self, district_id: str) -> List[Dict[str, Any]]:
         url = f"{self.base_url}/districts/{district_id}/communes"
-        r = requests.get(url, timeout=self.timeout)
+        r = http_get(url, timeout=self.timeout)
         r.raise_for_status()
         return list(r.json())
 
 
+def get_poscake_max_calls(default: int = 0) -> int:
+    # Max PosCake lookups per record (all variants and fallbacks together); 0 = no limit
+    try:
+        return max(0, int(os.getenv("ADDR_POSCAKE_MAX_CALLS", str(default))))
+    except ValueError:
+        return default
+
+
+class CallBudgetExceeded(RuntimeError):
+    pass
+
+
 class PosCakeClient:
     """Client for PosCake Geo API: GET /api/v1/poscake/geo/location-ids
     Expects query params: province_name, district_name, commune_name
+
+    One client serves one record: it counts calls per fallback step and their
+    latency, and refuses calls beyond `max_calls` (CallBudgetExceeded).
     """
 
-    def __init__(self, base_url: str, timeout: int = 20) -> None:
+    def __init__(self, base_url: str, timeout: int = 20, max_calls: Optional[int] = None) -> None:
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
+        self.max_calls = get_poscake_max_calls() if max_calls is None else max(0, max_calls)
+        self.calls = 0
+        self.skipped = 0
+        self.latency_s = 0.0
+        self.by_step: Dict[str, int] = {}
+
+    @property
+    def exhausted(self) -> bool:
+        return bool(self.max_calls) and self.calls >= self.max_calls
+
+    def call_stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "latency_ms": round(self.latency_s * 1000.0, 1),
+            "max_calls": self.max_calls,
+            "skipped": self.skipped,
+            "by_step": dict(self.by_step),
+        }
 
     def get_location_ids_by_names(
         self,
@@ -270,7 +340,12 @@ class PosCakeClient:
         district_name: Optional[str],
         commune_name: Optional[str],
         preserve_prefixes: bool = False,
+        step: str = "names",
     ) -> Dict[str, Any]:
+        if self.exhausted:
+            self.skipped += 1
+            POSCAKE_CALLS.inc(step="over_budget")
+            raise CallBudgetExceeded(f"PosCake call budget of {self.max_calls} exhausted")
         url = f"{self.base_url}/api/v1/poscake/geo/location-ids"
         if preserve_prefixes:
             params = {
@@ -285,7 +360,15 @@ class PosCakeClient:
                 "district_name": c_dist or "",
                 "commune_name": c_comm or "",
             }
-        r = requests.get(url, params=params, timeout=self.timeout)
+        self.calls += 1
+        self.by_step[step] = self.by_step.get(step, 0) + 1
+        POSCAKE_CALLS.inc(step=step)
+        t0 = time.perf_counter()
+        try:
+            with stage("address", "poscake_lookup", step):
+                r = http_get(url, params=params, timeout=self.timeout)
+        finally:
+            self.latency_s += time.perf_counter() - t0
         r.raise_for_status()
         try:
             return r.json()
@@ -323,11 +406,7 @@ def _fuzzy_pick(target: str, choices: List[Tuple[str, Dict[str, Any]]], threshol
     return choices[idx][1]
 
 
-def extract_address_fields(raw: str) -> Dict[str, Any]:
-    load_api_key()
-    model_name = get_llm_model_name()
-    prompt = SYSTEM_PROMPT_TEMPLATE.replace("{RAW}", str(raw or ""))
-    out = call_llm_json(prompt, model_name)
+def _fields_from_llm(out: Dict[str, Any]) -> Dict[str, Any]:
     # Ensure keys exist
     phone = out.get("phone_number")
     addr = out.get("address")
@@ -345,6 +424,90 @@ def extract_address_fields(raw: str) -> Dict[str, Any]:
     }
 
 
+def _extract_one(raw: str, model_name: str) -> Dict[str, Any]:
+    prompt = SYSTEM_PROMPT_TEMPLATE.replace("{RAW}", str(raw or ""))
+    return _fields_from_llm(call_llm_json(prompt, model_name))
+
+
+def extract_address_fields(raw: str) -> Dict[str, Any]:
+    load_api_key()
+    ADDRESS_EXTRACTIONS.inc(mode="single")
+    return _extract_one(raw, get_llm_model_name())
+
+
+def get_llm_batch_size(default: int = 10) -> int:
+    # Number of raw addresses per extraction prompt; 1 = one call per record (old behaviour)
+    try:
+        return max(1, int(os.getenv("ADDR_LLM_BATCH_SIZE", str(default))))
+    except ValueError:
+        return default
+
+
+def build_batch_prompt(raws: List[str]) -> str:
+    payload = json.dumps({str(i): str(r or "") for i, r in enumerate(raws)}, ensure_ascii=False)
+    return BATCH_PROMPT_TEMPLATE.replace("{RAWS}", payload)
+
+
+def _valid_batch_item(item: Any) -> bool:
+    if not isinstance(item, dict):
+        return False
+    if not all(k in item for k in _FIELD_KEYS if k != "full_address"):
+        return False
+    return all(item.get(k) is None or isinstance(item.get(k), str) for k in _FIELD_KEYS)
+
+
+def parse_batch_response(out: Any, n: int) -> List[Optional[Dict[str, Any]]]:
+    """Map a batch response back to its inputs by "index"; None where the element is missing or malformed."""
+    items = out.get("items") if isinstance(out, dict) else out
+    parsed: List[Optional[Dict[str, Any]]] = [None] * n
+    if not isinstance(items, list):
+        return parsed
+    for item in items:
+        if not _valid_batch_item(item):
+            continue
+        try:
+            i = int(item.get("index"))
+        except (TypeError, ValueError):
+            continue
+        # Duplicate index: the answer is ambiguous, retry that record on its own
+        if 0 <= i < n:
+            parsed[i] = _fields_from_llm(item) if parsed[i] is None else {}
+    return [p or None for p in parsed]
+
+
+def extract_address_fields_batch(raws: List[str], batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """extract_address_fields for many records, `batch_size` per LLM call.
+
+    Elements missing from or malformed in a batch response (and every record
+    of a batch whose call fails) are retried one by one with the single-record
+    prompt, so the output always lines up with `raws`.
+    """
+    batch_size = get_llm_batch_size() if batch_size is None else max(1, batch_size)
+    if batch_size == 1:
+        return [extract_address_fields(r) for r in raws]
+    load_api_key()
+    model_name = get_llm_model_name()
+    results: List[Dict[str, Any]] = []
+    for start in range(0, len(raws), batch_size):
+        chunk = raws[start:start + batch_size]
+        if len(chunk) == 1:
+            results.append(extract_address_fields(chunk[0]))
+            continue
+        try:
+            parsed = parse_batch_response(call_llm_json(build_batch_prompt(chunk), model_name), len(chunk))
+        except Exception as e:
+            print(f"[extract_address_fields_batch] Batch of {len(chunk)} failed, retrying one by one: {e}")
+            parsed = [None] * len(chunk)
+        for raw, fields in zip(chunk, parsed):
+            if fields is None:
+                ADDRESS_EXTRACTIONS.inc(mode="retried")
+                fields = _extract_one(raw, model_name)
+            else:
+                ADDRESS_EXTRACTIONS.inc(mode="batched")
+            results.append(fields)
+    return results
+
+
 def match_admin(candidate: Dict[str, Any], api_client: Optional[AdminApiClient]) -> Tuple[Dict[str, Any], List[str], List[str]]:
     """Return (resolved_names_with_ids, found_items, errors)."""
     found_items: List[str] = []
@@ -528,7 +691,7 @@ def match_admin_poscake(candidate: Dict[str, Any], client: Optional[PosCakeClien
         alt_prov = re.sub(r"[^\w\sÀ-ỹ]", " ", in_prov_raw or "").strip()
         if alt_prov and alt_prov != in_prov_raw:
             try:
-                alt_resp = client.get_location_ids_by_names(alt_prov, in_dist_raw, in_comm_raw, preserve_prefixes=True)
+                alt_resp = client.get_location_ids_by_names(alt_prov, in_dist_raw, in_comm_raw, preserve_prefixes=True, step="province_alnum")
                 _pid, _pname = _extract_level_from_poscake(alt_resp, "province")
                 if _pid and _pname:
                     prov_id, prov_name = _pid, _pname
@@ -536,7 +699,7 @@ def match_admin_poscake(candidate: Dict[str, Any], client: Optional[PosCakeClien
                 else:
                     # try hyphen without spaces variant
                     alt_prov2 = re.sub(r"\s*-\s*", "-", in_prov_raw or "").strip()
-                    alt_resp2 = client.get_location_ids_by_names(alt_prov2, in_dist_raw, in_comm_raw, preserve_prefixes=True)
+                    alt_resp2 = client.get_location_ids_by_names(alt_prov2, in_dist_raw, in_comm_raw, preserve_prefixes=True, step="province_hyphen")
                     _pid2, _pname2 = _extract_level_from_poscake(alt_resp2, "province")
                     if _pid2 and _pname2:
                         prov_id, prov_name = _pid2, _pname2
@@ -556,7 +719,7 @@ def match_admin_poscake(candidate: Dict[str, Any], client: Optional[PosCakeClien
         # Fallback: if commune is numeric (e.g., ward number), try district-only
         if re.fullmatch(r"\d+", (in_comm_raw or "").strip()):
             try:
-                alt_resp = client.get_location_ids_by_names(in_prov_raw, in_dist_raw, None, preserve_prefixes=True)
+                alt_resp = client.get_location_ids_by_names(in_prov_raw, in_dist_raw, None, preserve_prefixes=True, step="district_only")
                 _did, _dname = _extract_level_from_poscake(alt_resp, "district")
                 if _did and _dname:
                     dist_id, dist_name = _did, _dname
@@ -570,7 +733,7 @@ def match_admin_poscake(candidate: Dict[str, Any], client: Optional[PosCakeClien
             tried = False
             for pf in ["Thành phố", "Thị xã", "Quận", "Huyện"]:
                 try:
-                    alt_resp = client.get_location_ids_by_names(in_prov_raw, f"{pf} {in_dist_raw}", in_comm_raw, preserve_prefixes=True)
+                    alt_resp = client.get_location_ids_by_names(in_prov_raw, f"{pf} {in_dist_raw}", in_comm_raw, preserve_prefixes=True, step="district_prefix")
                     _did, _dname = _extract_level_from_poscake(alt_resp, "district")
                     if _did and _dname:
                         dist_id, dist_name = _did, _dname
@@ -591,14 +754,14 @@ def match_admin_poscake(candidate: Dict[str, Any], client: Optional[PosCakeClien
         if re.fullmatch(r"\d+", (in_comm_raw or "").strip()):
             guess = f"Phường {in_comm_raw.strip()}"
             try:
-                alt_resp = client.get_location_ids_by_names(in_prov_raw, dist_name or in_dist_raw, guess, preserve_prefixes=True)
+                alt_resp = client.get_location_ids_by_names(in_prov_raw, dist_name or in_dist_raw, guess, preserve_prefixes=True, step="commune_ward_number")
                 _cid, _cname = _extract_level_from_poscake(alt_resp, "commune")
                 if _cid and _cname:
                     comm_id, comm_name = _cid, _cname
                 else:
                     # try generic "Xã <num>" as a last resort
                     alt_guess = f"Xã {in_comm_raw.strip()}"
-                    alt_resp2 = client.get_location_ids_by_names(in_prov_raw, dist_name or in_dist_raw, alt_guess, preserve_prefixes=True)
+                    alt_resp2 = client.get_location_ids_by_names(in_prov_raw, dist_name or in_dist_raw, alt_guess, preserve_prefixes=True, step="commune_xa_number")
                     _cid2, _cname2 = _extract_level_from_poscake(alt_resp2, "commune")
                     if _cid2 and _cname2:
                         comm_id, comm_name = _cid2, _cname2
@@ -611,7 +774,7 @@ def match_admin_poscake(candidate: Dict[str, Any], client: Optional[PosCakeClien
             tried = False
             for pf in ["Xã", "Phường", "Thị trấn"]:
                 try:
-                    alt_resp = client.get_location_ids_by_names(in_prov_raw, dist_name or in_dist_raw, f"{pf} {in_comm_raw}", preserve_prefixes=True)
+                    alt_resp = client.get_location_ids_by_names(in_prov_raw, dist_name or in_dist_raw, f"{pf} {in_comm_raw}", preserve_prefixes=True, step="commune_prefix")
                     _cid, _cname = _extract_level_from_poscake(alt_resp, "commune")
                     if _cid and _cname:
                         comm_id, comm_name = _cid, _cname
@@ -623,7 +786,7 @@ def match_admin_poscake(candidate: Dict[str, Any], client: Optional[PosCakeClien
             if not tried and (dist_name or in_dist_raw) and _contains_all(dist_name or in_dist_raw, ["ha", "dong"]):
                 alt = "La Khê"
                 try:
-                    alt_resp = client.get_location_ids_by_names(in_prov_raw, dist_name or in_dist_raw, alt, preserve_prefixes=True)
+                    alt_resp = client.get_location_ids_by_names(in_prov_raw, dist_name or in_dist_raw, alt, preserve_prefixes=True, step="commune_ha_dong")
                     _cid, _cname = _extract_level_from_poscake(alt_resp, "commune")
                     if _cid and _cname:
                         comm_id, comm_name = _cid, _cname
@@ -635,7 +798,7 @@ def match_admin_poscake(candidate: Dict[str, Any], client: Optional[PosCakeClien
         # Last resort: if province known, try province+commune only to infer district
         if not comm_id and in_comm_raw and (prov_id or prov_name or in_prov_raw):
             try:
-                alt_resp = client.get_location_ids_by_names(prov_name or in_prov_raw, None, in_comm_raw, preserve_prefixes=True)
+                alt_resp = client.get_location_ids_by_names(prov_name or in_prov_raw, None, in_comm_raw, preserve_prefixes=True, step="infer_district")
                 _pid, _pname = _extract_level_from_poscake(alt_resp, "province")
                 _did, _dname = _extract_level_from_poscake(alt_resp, "district")
                 _cid, _cname = _extract_level_from_poscake(alt_resp, "commune")
@@ -660,8 +823,14 @@ def match_admin_poscake(candidate: Dict[str, Any], client: Optional[PosCakeClien
     }, found_items, errors)
 
 
-def normalize_record(raw: str, api_client: Optional[AdminApiClient]) -> Dict[str, Any]:
-    top1 = extract_address_fields(raw)
+def normalize_record(
+    raw: str,
+    api_client: Optional[AdminApiClient],
+    top1: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    # top1: fields already extracted (batch mode); otherwise one LLM call here
+    if top1 is None:
+        top1 = extract_address_fields(raw)
     # Generate initial variants (can be enriched later if needed)
     variants = generate_variants(top1)
     # Prefer PosCake if configured
@@ -678,8 +847,15 @@ def normalize_record(raw: str, api_client: Optional[AdminApiClient]) -> Dict[str
         top1_attempt_success: bool = False
         variant_test_results: List[Dict[str, Any]] = []
         accepted_variant_index: Optional[int] = None
+        attempts_made = 0
+        attempts_skipped = 0
         for idx, cand in enumerate(attempts):
+            if client.exhausted:
+                # Budget spent: remaining variants would only be refused
+                attempts_skipped = len(attempts) - idx
+                break
             r, fi, er = match_admin_poscake(cand, client)
+            attempts_made += 1
             if idx == 0:
                 first_attempt_result = (r, fi, er)
                 top1_attempt_success = bool(r.get("province_id") and r.get("district_id") and r.get("commune_id"))
@@ -721,6 +897,8 @@ def normalize_record(raw: str, api_client: Optional[AdminApiClient]) -> Dict[str
     # If resolved successfully, clear transient errors gathered during fallbacks
     if success:
         errors = []
+    elif poscake_base and (client.skipped or attempts_skipped):
+        errors = errors + [f"PosCake call budget exhausted ({client.max_calls} calls)"]
 
     result = {
         "raw": raw,
@@ -754,6 +932,7 @@ def normalize_record(raw: str, api_client: Optional[AdminApiClient]) -> Dict[str
                 result["variant_diagnostics"] = diagnostics
         except Exception:
             pass
+        result["poscake_calls"] = dict(client.call_stats(), attempts=attempts_made, attempts_skipped=attempts_skipped)
     return result
 
 
@@ -766,29 +945,48 @@ def build_admin_client_from_env() -> Optional[AdminApiClient]:
     return None
 
 
-def process_file(input_path: str, output_path: Optional[str] = None) -> List[Dict[str, Any]]:
+def normalize_records(
+    raws: List[str],
+    api_client: Optional[AdminApiClient] = None,
+    batch_size: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """normalize_record over many raws, extracting fields `batch_size` records per LLM call."""
+    batch_size = get_llm_batch_size() if batch_size is None else max(1, batch_size)
+    results: List[Dict[str, Any]] = []
+    total = len(raws)
+    correct_so_far = 0
+    for start in range(0, total, batch_size):
+        chunk = raws[start:start + batch_size]
+        extracted = extract_address_fields_batch(chunk, batch_size)
+        for raw, top1 in zip(chunk, extracted):
+            item_res = normalize_record(raw, api_client, top1=top1)
+            results.append(item_res)
+            if _is_progress_enabled():
+                idx = len(results)
+                try:
+                    if evaluate_result_item(item_res):
+                        correct_so_far += 1
+                except Exception:
+                    pass
+                ratio = (correct_so_far / idx * 100.0) if idx else 0.0
+                print(f"[{idx}/{total}] {round(ratio,2)}% ok | raw: {_truncate_raw(raw)}", flush=True)
+    return results
+
+
+def process_file(
+    input_path: str,
+    output_path: Optional[str] = None,
+    batch_size: Optional[int] = None,
+) -> List[Dict[str, Any]]:
     with open(input_path, "r", encoding="utf-8") as f:
         items = json.load(f)
     api_client = build_admin_client_from_env()
-    results: List[Dict[str, Any]] = []
-    total = len(items) if isinstance(items, list) else 0
-    correct_so_far = 0
-    idx = 0
-    for it in items:
+    raws: List[str] = []
+    for it in items if isinstance(items, list) else []:
         raw = it.get("raw") if isinstance(it, dict) else None
-        if not raw:
-            continue
-        idx += 1
-        item_res = normalize_record(raw, api_client)
-        results.append(item_res)
-        if _is_progress_enabled():
-            try:
-                if evaluate_result_item(item_res):
-                    correct_so_far += 1
-            except Exception:
-                pass
-            ratio = (correct_so_far / idx * 100.0) if idx else 0.0
-            print(f"[{idx}/{total}] {round(ratio,2)}% ok | raw: {_truncate_raw(raw)}", flush=True)
+        if raw:
+            raws.append(raw)
+    results = normalize_records(raws, api_client, batch_size=batch_size)
     if output_path:
         with open(output_path, "w", encoding="utf-8") as f:
             json.dump(results, f, ensure_ascii=False, indent=2)
@@ -817,6 +1015,36 @@ def evaluate_result_item(item: Dict[str, Any]) -> bool:
     return False
 
 
+def summarize_poscake_calls(results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Aggregate per-record `poscake_calls` (None when no record used PosCake)."""
+    stats = [r.get("poscake_calls") for r in results if isinstance(r, dict) and isinstance(r.get("poscake_calls"), dict)]
+    if not stats:
+        return None
+    calls = sorted(int(s.get("calls") or 0) for s in stats)
+    latency = sorted(float(s.get("latency_ms") or 0.0) for s in stats)
+    by_step: Dict[str, int] = {}
+    for s in stats:
+        for step, n in (s.get("by_step") or {}).items():
+            by_step[step] = by_step.get(step, 0) + int(n)
+
+    def pct(values: List[Any], q: float) -> Any:
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {
+        "records": len(stats),
+        "calls_total": sum(calls),
+        "calls_per_record": round(sum(calls) / len(stats), 2),
+        "calls_p50": pct(calls, 0.5),
+        "calls_p99": pct(calls, 0.99),
+        "calls_max": calls[-1],
+        "latency_ms_total": round(sum(latency), 1),
+        "latency_ms_p50": pct(latency, 0.5),
+        "latency_ms_p99": pct(latency, 0.99),
+        "budget_exhausted": sum(1 for s in stats if s.get("skipped") or s.get("attempts_skipped")),
+        "by_step": dict(sorted(by_step.items(), key=lambda kv: -kv[1])),
+    }
+
+
 def summarize_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
     total = len(results)
     correct = 0
@@ -827,7 +1055,11 @@ def summarize_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
         except Exception:
             pass
     ratio = (correct / total * 100.0) if total else 0.0
-    return {"correct": correct, "total": total, "ratio_percent": round(ratio, 2)}
+    summary: Dict[str, Any] = {"correct": correct, "total": total, "ratio_percent": round(ratio, 2)}
+    poscake = summarize_poscake_calls(results)
+    if poscake is not None:
+        summary["poscake_calls"] = poscake
+    return summary
 
 
 def _is_progress_enabled() -> bool:
@@ -0,0 +1,184 @@
+"""Full-answer cache for `ask`, shared by workers through Redis.
+
+Keys combine the normalized question, a hash of `preferred_ids` and the
+catalog snapshot identity (content fingerprint, embedding model, which
+indexes are built) plus the ranking settings (fusion method, partition
+routing thresholds, rerank token budget, local reranker weights, LLM model,
+final score threshold), so a catalog, index or ranking change makes old
+entries unreachable without any explicit purge. The fingerprint is content
+based, unlike `CatalogSnapshot.version` which is a per-process counter, so
+workers on the same catalog and settings share keys.
+Entries are stored as JSON: a hit always returns a fresh copy.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import redis  # type: ignore
+except Exception:  # pragma: no cover
+    redis = None  # type: ignore
+
+from .categories import get_partition_min_cosine, get_partition_min_score
+from .compaction import get_rerank_token_budget
+from .fusion import get_fusion_method, get_rrf_k
+from .llm_client import get_llm_model_name
+from .metrics import LLM_CACHE, REDIS_ERRORS
+from .textnorm import PUNCT_TABLE, nfc_lower
+
+
+def get_answer_cache_enabled() -> bool:
+    return os.getenv("PRODUCT_QA_ANSWER_CACHE", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def normalize_question(text: str) -> str:
+    # Giữ dấu (không fold): "nồi" và "nối" là hai câu hỏi khác nhau
+    return " ".join(nfc_lower(str(text or "")).translate(PUNCT_TABLE).split())
+
+
+def preferred_hash(preferred_ids: Optional[Iterable[str]]) -> str:
+    if not preferred_ids:
+        return "-"
+    return hashlib.sha1("\x1f".join(sorted(str(d) for d in preferred_ids)).encode("utf-8")).hexdigest()[:12]
+
+
+def snapshot_key(snap, reranker=None, min_final_score: Optional[float] = None) -> str:
+    """Catalog content, indexes and ranking settings an answer depends on; changes whenever any does."""
+    embed = f"{snap.idx.model_name}/{snap.idx.storage}" if snap.idx is not None else "noembed"
+    fusion = get_fusion_method()
+    if fusion == "rrf":
+        fusion = f"rrf{get_rrf_k()}"
+    # Ngưỡng định tuyến chỉ có tác dụng khi có phân vùng
+    part = f"part{get_partition_min_score()}/{get_partition_min_cosine()}" if snap.partitions is not None else "nopart"
+    rerank = reranker.fingerprint() if reranker is not None else "llm"
+    return ":".join([
+        snap.fingerprint[:16],
+        embed,
+        "lex" if snap.lexical is not None else "nolex",
+        "phr" if snap.phrases is not None else "nophr",
+        part,
+        fusion,
+        f"{rerank}/{get_llm_model_name()}/tok{get_rerank_token_budget()}",
+        f"min{min_final_score}",
+    ])
+
+
+class AnswerCache:
+    """In-process LRU with TTL in front of an optional Redis tier (REDIS_URL)."""
+
+    def __init__(
+        self,
+        namespace: str = "default",
+        ttl_s: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        redis_url: Optional[str] = None,
+        reranker=None,
+        min_final_score: Optional[float] = None,
+    ) -> None:
+        # namespace: nguồn catalog (api_url/csv) để nhiều shop không dùng chung key
+        self.namespace = hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:12]
+        self.ttl_s = _env_number("PRODUCT_QA_ANSWER_CACHE_TTL_S", 300) if ttl_s is None else ttl_s
+        self.max_entries = int(_env_number("PRODUCT_QA_ANSWER_CACHE_SIZE", 1024) if max_entries is None else max_entries)
+        # Câu trả lời lớn hơn ngưỡng (nhiều ứng viên dài) không được cache
+        self.max_bytes = int(_env_number("PRODUCT_QA_ANSWER_CACHE_MAX_BYTES", 65536) if max_bytes is None else max_bytes)
+        self._local: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._snapshot_key: Optional[str] = None
+        # LocalReranker của pipeline (None: luôn rerank bằng LLM), thuộc về key
+        self.reranker = reranker
+        # Ngưỡng điểm chọn sản phẩm cuối của pipeline, cũng thuộc về key
+        self.min_final_score = min_final_score
+        url = redis_url if redis_url is not None else os.getenv("REDIS_URL")
+        self.client = None
+        if url and redis is not None:
+            try:
+                self.client = redis.Redis.from_url(url, decode_responses=True)
+            except Exception:
+                self.client = None
+
+    def key(self, snap, user_text: str, preferred_ids: Optional[Iterable[str]] = None) -> str:
+        raw = f"{snapshot_key(snap, self.reranker, self.min_final_score)}|{preferred_hash(preferred_ids)}|{normalize_question(user_text)}"
+        return f"product_qa:answer:{self.namespace}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    def _check_snapshot(self, snap) -> None:
+        # Catalog đổi: key cũ không còn được tra tới, dọn luôn tầng trong RAM thay vì chờ LRU
+        current = snapshot_key(snap, self.reranker, self.min_final_score)
+        if current != self._snapshot_key:
+            with self._lock:
+                if current != self._snapshot_key:
+                    self._local.clear()
+                    self._snapshot_key = current
+
+    def get(self, snap, user_text: str, preferred_ids: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        self._check_snapshot(snap)
+        key = self.key(snap, user_text, preferred_ids)
+        now = time.time()
+        with self._lock:
+            hit = self._local.get(key)
+            if hit is not None:
+                if hit[0] > now:
+                    self._local.move_to_end(key)
+                else:
+                    del self._local[key]
+                    hit = None
+        if hit is not None:
+            LLM_CACHE.inc(cache="product_qa_answer_memory", result="hit")
+            return json.loads(hit[1])
+        LLM_CACHE.inc(cache="product_qa_answer_memory", result="miss")
+        if self.client is None:
+            return None
+        try:
+            payload = self.client.get(key)
+        except Exception:
+            REDIS_ERRORS.inc(component="answer_cache", op="get")
+            return None
+        if payload is None:
+            LLM_CACHE.inc(cache="product_qa_answer_redis", result="miss")
+            return None
+        LLM_CACHE.inc(cache="product_qa_answer_redis", result="hit")
+        self._put_local(key, payload, now)
+        return json.loads(payload)
+
+    def put(self, snap, user_text: str, preferred_ids: Optional[Iterable[str]], answer: Dict) -> bool:
+        payload = json.dumps(answer, ensure_ascii=False, default=str)
+        if len(payload.encode("utf-8")) > self.max_bytes or self.ttl_s <= 0:
+            return False
+        self._check_snapshot(snap)
+        key = self.key(snap, user_text, preferred_ids)
+        self._put_local(key, payload, time.time())
+        if self.client is not None:
+            try:
+                self.client.setex(key, max(1, int(self.ttl_s)), payload)
+            except Exception:
+                REDIS_ERRORS.inc(component="answer_cache", op="set")
+        return True
+
+    def _put_local(self, key: str, payload: str, now: float) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._local[key] = (now + self.ttl_s, payload)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            size = len(self._local)
+        return {"entries": size, "max_entries": self.max_entries, "ttl_s": self.ttl_s, "redis": self.client is not None}
@@ -0,0 +1,181 @@
+import gc
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from .catalog import get_refresh_interval_s
+from .metrics import CONTENT_TYPE, render_latest
+from .pipeline import product_qa_pipeline
+from .tenants import TenantRegistry
+
+
+class AskRequest(BaseModel):
+    user_text: str
+    with_timings: bool = False
+    # Bắt buộc khi chạy nhiều shop (PRODUCT_QA_TENANTS)
+    shop_id: Optional[str] = None
+    # Mã hội thoại/khách: ưu tiên sản phẩm khách đã mua (xem preferences.py)
+    customer_id: Optional[str] = None
+    preferred_ids: Optional[List[str]] = None
+
+
+class BatchAskRequest(BaseModel):
+    questions: List[str]
+    with_timings: bool = False
+    shop_id: Optional[str] = None
+    customer_id: Optional[str] = None
+    preferred_ids: Optional[List[str]] = None
+
+
+class OrderEventRequest(BaseModel):
+    customer_id: str
+    # Một đơn dạng PosCake: {"items": [{"display_id": ...}]} (hoặc {"orders": [...]})
+    order: Dict[str, Any]
+    shop_id: Optional[str] = None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def build_pipeline_from_env() -> Callable[..., Dict]:
+    """Build the catalog, fuzzy structures and EmbeddingIndex once for this process."""
+    api_url = os.getenv("PRODUCT_QA_API_URL") or None
+    csv_path = os.getenv("PRODUCT_QA_CSV", "Current_product_names__with_clean_name_.csv")
+    build_embedding = os.getenv("PRODUCT_QA_EMBED", "0").strip().lower() in ("1", "true", "yes", "on")
+    ask = product_qa_pipeline(
+        csv_path=None if api_url else csv_path,
+        build_embedding=build_embedding,
+        api_url=api_url,
+        # Thread không sống qua fork: refresher được bật trong từng worker lúc startup
+        refresh_interval_s=0,
+    )
+    # Đưa toàn bộ object đã dựng vào thế hệ "permanent" của GC: GC không ghi refcount/header
+    # lên các trang này nữa, nên worker fork ra (gunicorn --preload) chia sẻ copy-on-write
+    gc.collect()
+    gc.freeze()
+    return ask
+
+
+def create_app(
+    ask: Optional[Callable[..., Dict]] = None,
+    registry: Optional[TenantRegistry] = None,
+) -> FastAPI:
+    app = FastAPI(title="Product QA API", version="0.1.0")
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Nhiều shop: catalog từng shop được load khi có request đầu tiên (xem tenants.py)
+    registry = registry or (TenantRegistry.from_env() if ask is None else None)
+    # Một shop: dựng một lần khi import module (trước khi fork worker nếu chạy với --preload)
+    if registry is None:
+        ask = ask or build_pipeline_from_env()
+
+    def resolve(shop_id: Optional[str]) -> Callable[..., Dict]:
+        if registry is None:
+            return ask
+        if not shop_id:
+            raise HTTPException(status_code=400, detail="shop_id is required")
+        try:
+            return registry.get(shop_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Unknown shop_id: {shop_id}")
+    max_batch = _env_int("PRODUCT_QA_MAX_BATCH", 32)
+    batch_pool = ThreadPoolExecutor(
+        max_workers=_env_int("PRODUCT_QA_BATCH_CONCURRENCY", 4),
+        thread_name_prefix="product-qa-batch",
+    )
+
+    @app.on_event("startup")
+    def start_refresher():
+        interval = get_refresh_interval_s()
+        if interval > 0 and ask is not None:
+            ask.refresher.interval_s = interval
+            ask.refresher.start()
+
+    @app.get("/healthz")
+    def healthz():
+        if registry is not None:
+            return {"ok": True, "tenants": len(registry.tenants), "resident": len(registry.stats()["lru_order"])}
+        snap = ask.catalog.current
+        return {
+            "ok": True,
+            "catalog_version": snap.version,
+            "products": len(snap.store),
+            "embedding": snap.idx is not None,
+        }
+
+    def _preferred(ids: Optional[List[str]]) -> Optional[set]:
+        return set(ids) if ids is not None else None
+
+    @app.post("/api/v1/product-qa/ask")
+    def ask_one(req: AskRequest):
+        return resolve(req.shop_id)(
+            req.user_text,
+            with_timings=req.with_timings,
+            preferred_ids=_preferred(req.preferred_ids),
+            customer_id=req.customer_id,
+        )
+
+    @app.post("/api/v1/product-qa/ask/batch")
+    def ask_batch(req: BatchAskRequest):
+        if len(req.questions) > max_batch:
+            raise HTTPException(status_code=413, detail=f"At most {max_batch} questions per batch")
+        tenant_ask = resolve(req.shop_id)
+
+        def one(q: str) -> Dict:
+            try:
+                return tenant_ask(
+                    q,
+                    with_timings=req.with_timings,
+                    preferred_ids=_preferred(req.preferred_ids),
+                    customer_id=req.customer_id,
+                )
+            except Exception as e:
+                # Một câu lỗi (LLM timeout...) không làm hỏng cả batch
+                return {"error": str(e)}
+
+        # Các câu hỏi chủ yếu chờ LLM: chạy song song có giới hạn, giữ thứ tự kết quả
+        return {"results": list(batch_pool.map(one, req.questions))}
+
+    @app.post("/api/v1/product-qa/refresh")
+    def refresh(shop_id: Optional[str] = None):
+        tenant_ask = resolve(shop_id)
+        swapped = tenant_ask.refresher.refresh_once()
+        return {"swapped": swapped, "catalog_version": tenant_ask.catalog.current.version}
+
+    @app.post("/api/v1/product-qa/preferences/orders")
+    def add_order(req: OrderEventRequest):
+        # Sự kiện đơn hàng mới: bổ sung sản phẩm vào tập ưu tiên của khách
+        ids = resolve(req.shop_id).preferences.add_order(req.customer_id, req.order)
+        return {"customer_id": req.customer_id, "preferred_ids": sorted(ids)}
+
+    @app.get("/api/v1/product-qa/tenants")
+    def tenants():
+        # Thời gian load, kích thước ước tính, số hit/evict của từng shop và thứ tự LRU
+        if registry is None:
+            raise HTTPException(status_code=404, detail="Multi-tenant mode is off (PRODUCT_QA_TENANTS)")
+        return registry.stats()
+
+    @app.get("/metrics")
+    def metrics():
+        return PlainTextResponse(render_latest(), media_type=CONTENT_TYPE)
+
+    return app
+
+
+app = create_app()
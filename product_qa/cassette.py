@@ -0,0 +1,248 @@
+"""Record/replay of remote calls (Gemini generate/embed, PosCake, admin API).
+
+    CASSETTE_MODE=record CASSETTE_PATH=runs/addr.jsonl.gz python run_address_normalization.py ...
+    CASSETTE_MODE=replay CASSETTE_PATH=runs/addr.jsonl.gz CASSETTE_LATENCY=1 python -m benchmarks...
+
+Record mode makes the real call and appends one JSON line per call:
+{"k": request key, "kind", "ms": latency, "q": short request hint, "r": response}.
+Replay mode serves responses from the file and never touches the network
+or the Gemini SDK (`load_api_key` is a no-op), so runs are deterministic
+and need no credentials. A key recorded several times is replayed in
+recorded order, then the last response repeats; a key that was never
+recorded raises CassetteMiss. CASSETTE_LATENCY=1 sleeps for the recorded
+latency (any other number scales it; 0, the default, serves instantly).
+
+Keys hash the request only: model + prompt for generate, model + text for
+embed, URL path + query params for HTTP (not the host, so a cassette
+recorded against one POSCAKE_BASE replays against any other).
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol
+from urllib.parse import urlsplit
+
+from .metrics import REGISTRY
+
+
+CASSETTE_REQUESTS = REGISTRY.counter(
+    "cassette_requests_total",
+    "Remote calls seen by the record/replay layer by kind and result (recorded, replayed, miss).",
+    ["kind", "result"],
+)
+
+
+class CassetteMiss(RuntimeError):
+    pass
+
+
+class Backend(Protocol):
+    """What remote calls are routed through: a Cassette, or e.g. a benchmark stub."""
+
+    mode: str
+
+    def call(self, kind: str, payload: Dict[str, Any], hint: str, fn: Callable[[], Any],
+             encode: Callable[[Any], Any] = ..., decode: Callable[[Any], Any] = ...) -> Any:
+        ...
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        import gzip
+
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def request_key(kind: str, payload: Dict[str, Any]) -> str:
+    raw = json.dumps([kind, payload], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _hint(text: str, max_len: int = 80) -> str:
+    s = " ".join(str(text or "").split())
+    return s if len(s) <= max_len else s[: max_len - 1] + "…"
+
+
+class Cassette:
+    """One cassette file in record or replay mode."""
+
+    def __init__(self, path: str, mode: str = "replay", latency: float = 0.0) -> None:
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._served: Dict[str, int] = {}
+        if mode == "replay":
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _load(self) -> None:
+        with _open(self.path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["k"], []).append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._entries.values())
+
+    def call(self, kind: str, payload: Dict[str, Any], hint: str, fn: Callable[[], Any],
+             encode: Callable[[Any], Any] = lambda r: r, decode: Callable[[Any], Any] = lambda r: r) -> Any:
+        key = request_key(kind, payload)
+        if self.mode == "replay":
+            with self._lock:
+                entries = self._entries.get(key)
+                if not entries:
+                    CASSETTE_REQUESTS.inc(kind=kind, result="miss")
+                    raise CassetteMiss(f"No recorded {kind} response for {_hint(hint)!r} in {self.path}")
+                i = self._served.get(key, 0)
+                self._served[key] = i + 1
+                entry = entries[min(i, len(entries) - 1)]
+            CASSETTE_REQUESTS.inc(kind=kind, result="replayed")
+            if self.latency > 0 and entry.get("ms"):
+                time.sleep(float(entry["ms"]) / 1000.0 * self.latency)
+            return decode(entry["r"])
+        t0 = time.perf_counter()
+        result = fn()
+        ms = (time.perf_counter() - t0) * 1000.0
+        entry = {"k": key, "kind": kind, "ms": round(ms, 1), "q": _hint(hint), "r": encode(result)}
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+            with _open(self.path, "a") as f:
+                f.write(line + "\n")
+        CASSETTE_REQUESTS.inc(kind=kind, result="recorded")
+        return result
+
+
+_ACTIVE: Optional[Backend] = None
+_FROM_ENV = False
+_ENV_LOCK = threading.Lock()
+
+
+def _from_env() -> Optional[Cassette]:
+    mode = os.getenv("CASSETTE_MODE", "off").strip().lower()
+    if mode in ("", "off", "0", "false"):
+        return None
+    path = os.getenv("CASSETTE_PATH")
+    if not path:
+        raise RuntimeError("CASSETTE_MODE is set but CASSETTE_PATH is missing")
+    try:
+        latency = float(os.getenv("CASSETTE_LATENCY", "0"))
+    except ValueError:
+        latency = 0.0
+    return Cassette(path, mode, latency)
+
+
+def active() -> Optional[Backend]:
+    """The cassette in use: set by `use_cassette`, else from CASSETTE_MODE/CASSETTE_PATH (read once)."""
+    global _ACTIVE, _FROM_ENV
+    if not _FROM_ENV:
+        with _ENV_LOCK:
+            if not _FROM_ENV:
+                _ACTIVE = _from_env()
+                _FROM_ENV = True
+    return _ACTIVE
+
+
+def replaying() -> bool:
+    c = active()
+    return c is not None and c.mode == "replay"
+
+
+@contextmanager
+def use_backend(backend: Backend) -> Iterator[Backend]:
+    """Serve remote calls from `backend` for the duration of the block (overrides the env).
+
+    Any `Backend` works, e.g. a benchmark stub answering from fixtures.
+    """
+    global _ACTIVE, _FROM_ENV
+    previous = (_ACTIVE, _FROM_ENV)
+    _ACTIVE, _FROM_ENV = backend, True
+    try:
+        yield backend
+    finally:
+        _ACTIVE, _FROM_ENV = previous
+
+
+@contextmanager
+def use_cassette(path: str, mode: str = "replay", latency: float = 0.0) -> Iterator[Cassette]:
+    """Route remote calls through the cassette file `path` for the duration of the block."""
+    with use_backend(Cassette(path, mode, latency)) as cassette:
+        yield cassette
+
+
+def record_llm(prompt: str, model_name: str, fn: Callable[[], Dict]) -> Dict:
+    c = active()
+    if c is None:
+        return fn()
+    return c.call("generate", {"model": model_name, "prompt": prompt}, prompt, fn)
+
+
+def _encode_vector(vec: Any) -> str:
+    # float32 base64: ~4 bytes/chiều thay vì ~20 ký tự JSON
+    import numpy as np
+
+    return base64.b64encode(np.asarray(vec, dtype="<f4").tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str) -> List[float]:
+    import numpy as np
+
+    return np.frombuffer(base64.b64decode(data), dtype="<f4").tolist()
+
+
+def record_embed(text: str, model_name: str, fn: Callable[[], List[float]]) -> List[float]:
+    c = active()
+    if c is None:
+        return fn()
+    return c.call("embed", {"model": model_name, "text": text}, text, fn, _encode_vector, _decode_vector)
+
+
+class ReplayResponse:
+    """The part of requests.Response the HTTP callers use."""
+
+    def __init__(self, url: str, status_code: int, text: str) -> None:
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            import requests
+
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=None)
+
+
+def http_get(url: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None):
+    """requests.get through the active cassette (a real requests.Response when none is active)."""
+    # requests chỉ được import khi có gọi HTTP: llm_client (và ship_fee) import module này
+    import requests
+
+    c = active()
+    if c is None:
+        return requests.get(url, params=params, timeout=timeout)
+    parts = urlsplit(url)
+    query = {str(k): "" if v is None else str(v) for k, v in (params or {}).items()}
+    payload = {"path": parts.path, "query": parts.query, "params": query}
+    hint = f"GET {parts.path} {json.dumps(query, ensure_ascii=False)}"
+
+    def fetch() -> Dict[str, Any]:
+        r = requests.get(url, params=params, timeout=timeout)
+        return {"status": r.status_code, "text": r.text}
+
+    out = c.call("http", payload, hint, fetch)
+    return ReplayResponse(url, int(out["status"]), out["text"])
@@ -0,0 +1,204 @@
+"""Versioned product catalog snapshots with background hot reload.
+
+`ask` reads `CatalogHolder.current` once per request and uses that snapshot
+until it returns, so a refresh never changes the catalog under an in-flight
+request. The refresher builds the next snapshot off to the side (embedding
+only new or renamed items) and swaps the reference in one assignment.
+"""
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Union
+
+import pandas as pd
+
+from .metrics import REGISTRY
+from .lexical import LexicalIndex, load_or_build_lexical
+from .categories import CategoryPartitions, build_partitions as build_category_partitions
+from .phrases import PhraseDictionary, build_phrase_dictionary
+from .pipeline import EmbeddingIndex
+from .store import ProductStore, as_store
+
+
+CATALOG_VERSION = REGISTRY.gauge(
+    "product_qa_catalog_version",
+    "Version of the catalog snapshot currently served.",
+)
+CATALOG_REFRESHES = REGISTRY.counter(
+    "product_qa_catalog_refresh_total",
+    "Catalog refresh polls by result (unchanged, swapped, error).",
+    ["result"],
+)
+
+
+def get_refresh_interval_s(default: float = 0.0) -> float:
+    # Chu kỳ poll nguồn catalog (giây); 0 tắt refresher
+    try:
+        return max(0.0, float(os.getenv("PRODUCT_QA_CATALOG_REFRESH_S", str(default))))
+    except ValueError:
+        return default
+
+
+def catalog_fingerprint(store: ProductStore) -> str:
+    h = hashlib.sha1()
+    for did, name, pri in zip(store.ids, store.names, store.priority.tolist()):
+        h.update(f"{did}\x1f{name}\x1f{pri}\x1e".encode("utf-8"))
+    if store.category is not None:
+        h.update("\x1f".join(store.category).encode("utf-8"))
+    return h.hexdigest()
+
+
+def diff_catalogs(old: Optional[ProductStore], new: ProductStore) -> Dict[str, int]:
+    """Counts of added / removed / renamed / reprioritized display_ids."""
+    new_names = dict(zip(new.ids, new.names))
+    new_pri = dict(zip(new.ids, new.priority.tolist()))
+    if old is None:
+        return {"added": len(new_names), "removed": 0, "renamed": 0, "reprioritized": 0}
+    old_names = dict(zip(old.ids, old.names))
+    old_pri = dict(zip(old.ids, old.priority.tolist()))
+    common = old_names.keys() & new_names.keys()
+    return {
+        "added": len(new_names.keys() - old_names.keys()),
+        "removed": len(old_names.keys() - new_names.keys()),
+        "renamed": sum(1 for d in common if old_names[d] != new_names[d]),
+        "reprioritized": sum(1 for d in common if old_pri[d] != new_pri[d]),
+    }
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: int
+    store: ProductStore = field(repr=False)
+    idx: Optional[EmbeddingIndex] = field(repr=False)
+    fingerprint: str
+    lexical: Optional[LexicalIndex] = field(repr=False, default=None)
+    phrases: Optional[PhraseDictionary] = field(repr=False, default=None)
+    partitions: Optional[CategoryPartitions] = field(repr=False, default=None)
+    loaded_at: float = field(default_factory=time.time)
+
+
+def build_snapshot(
+    catalog: Union[pd.DataFrame, ProductStore],
+    source_key: str,
+    build_embedding: bool,
+    previous: Optional[CatalogSnapshot] = None,
+    version: int = 1,
+    build_lexical: bool = False,
+    build_phrases: bool = False,
+    build_partitions: bool = False,
+) -> CatalogSnapshot:
+    # Snapshot chỉ giữ ProductStore (mảng song song), DataFrame nguồn được bỏ sau khi chuyển
+    store = as_store(catalog)
+    idx = None
+    if build_embedding:
+        prev_idx = previous.idx if previous is not None else None
+        # Tái dùng vector của snapshot cũ theo (display_id, clean_name): chỉ embed mục mới/đổi tên
+        idx = EmbeddingIndex(store, source_key=source_key, previous=prev_idx)
+    return CatalogSnapshot(
+        version=version,
+        store=store,
+        idx=idx,
+        fingerprint=catalog_fingerprint(store),
+        lexical=load_or_build_lexical(store, source_key) if build_lexical else None,
+        phrases=build_phrase_dictionary(store) if build_phrases else None,
+        partitions=build_category_partitions(store) if build_partitions else None,
+    )
+
+
+class CatalogHolder:
+    """Holds the current snapshot; readers take `current` once per request."""
+
+    def __init__(self, snapshot: CatalogSnapshot) -> None:
+        self._current = snapshot
+        self._swap_lock = threading.Lock()
+        CATALOG_VERSION.set(snapshot.version)
+
+    @property
+    def current(self) -> CatalogSnapshot:
+        return self._current
+
+    def swap(self, snapshot: CatalogSnapshot) -> CatalogSnapshot:
+        with self._swap_lock:
+            old = self._current
+            # Gán tham chiếu là nguyên tử: request đang chạy vẫn giữ snapshot cũ
+            self._current = snapshot
+        CATALOG_VERSION.set(snapshot.version)
+        return old
+
+
+class CatalogRefresher:
+    """Polls `loader` every `interval_s` seconds and swaps in changed catalogs."""
+
+    def __init__(
+        self,
+        holder: CatalogHolder,
+        loader: Callable[[], pd.DataFrame],
+        source_key: str,
+        build_embedding: bool,
+        interval_s: float,
+        build_lexical: bool = False,
+        build_phrases: bool = False,
+        build_partitions: bool = False,
+    ) -> None:
+        self.holder = holder
+        self.build_lexical = build_lexical
+        self.build_phrases = build_phrases
+        self.build_partitions = build_partitions
+        self.loader = loader
+        self.source_key = source_key
+        self.build_embedding = build_embedding
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh_once(self) -> bool:
+        """Reload the source; return True if a new snapshot was swapped in."""
+        try:
+            df = self.loader()
+        except Exception as e:
+            CATALOG_REFRESHES.inc(result="error")
+            print(f"[CatalogRefresher] Load failed, keeping v{self.holder.current.version}: {e}")
+            return False
+        old = self.holder.current
+        new_store = ProductStore.from_frame(df)
+        if catalog_fingerprint(new_store) == old.fingerprint:
+            CATALOG_REFRESHES.inc(result="unchanged")
+            return False
+        diff = diff_catalogs(old.store, new_store)
+        try:
+            snapshot = build_snapshot(
+                new_store,
+                self.source_key,
+                self.build_embedding,
+                previous=old,
+                version=old.version + 1,
+                build_lexical=self.build_lexical,
+                build_phrases=self.build_phrases,
+                build_partitions=self.build_partitions,
+            )
+        except Exception as e:
+            CATALOG_REFRESHES.inc(result="error")
+            print(f"[CatalogRefresher] Build failed, keeping v{old.version}: {e}")
+            return False
+        self.holder.swap(snapshot)
+        CATALOG_REFRESHES.inc(result="swapped")
+        print(f"[CatalogRefresher] v{old.version} -> v{snapshot.version}: {diff}")
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.refresh_once()
+
+    def start(self) -> "CatalogRefresher":
+        if self._thread is None and self.interval_s > 0:
+            self._thread = threading.Thread(target=self._run, name="catalog-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
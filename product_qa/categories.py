@@ -0,0 +1,124 @@
+"""Category partitions of the catalog for routed retrieval.
+
+A product's category is the `category` column when the source provides
+one, otherwise its head noun: the first syllable of `clean_name` ("nồi",
+"chảo"), or the first two when the first is generic ("máy sấy", "bộ nồi").
+Head nouns found in a query route it to the partitions whose products use
+them, so fuzzy/embedding scoring only touches those rows; the caller falls
+back to a global search when the routed hits are weak.
+"""
+import os
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .metrics import REGISTRY
+from .store import ProductStore
+from .textnorm import match_key
+
+
+PARTITION_ROUTES = REGISTRY.counter(
+    "product_qa_partition_routes_total",
+    "Retriever calls by routing result (routed, fallback = routed hits too weak, global = no category found).",
+    ["retriever", "result"],
+)
+
+_WORD_RE = re.compile(r"[a-z]+")
+
+# Đầu tên quá chung: lấy thêm âm tiết thứ hai ("máy sấy", "bộ nồi", "bình giữ")
+GENERIC_HEADS = {
+    "may", "bo", "combo", "set", "binh", "hop", "tui", "nuoc", "dung", "do", "cap",
+    "khay", "thung", "lo", "ong", "tam", "cay", "goi", "bich", "chai", "cuon", "o",
+}
+
+
+def get_partitions_enabled() -> bool:
+    return os.getenv("PRODUCT_QA_PARTITIONS", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_partition_min_score(default: float = 0.6) -> float:
+    # Điểm tốt nhất trong phân vùng dưới ngưỡng này thì tìm lại trên toàn catalog
+    try:
+        return float(os.getenv("PRODUCT_QA_PARTITION_MIN_SCORE", str(default)))
+    except ValueError:
+        return default
+
+
+def get_partition_min_cosine(default: float = 0.55) -> float:
+    try:
+        return float(os.getenv("PRODUCT_QA_PARTITION_MIN_COSINE", str(default)))
+    except ValueError:
+        return default
+
+
+def head_noun(name: str) -> Optional[str]:
+    """Folded head noun of a product name ("Máy Sấy Tóc SEKA" -> "may say")."""
+    words = _WORD_RE.findall(match_key(str(name or "")))
+    if not words:
+        return None
+    if words[0] in GENERIC_HEADS and len(words) > 1:
+        return f"{words[0]} {words[1]}"
+    return words[0]
+
+
+class CategoryPartitions:
+    """category -> row array, plus head noun -> categories for routing text."""
+
+    def __init__(self, store: ProductStore) -> None:
+        members: Dict[str, List[int]] = defaultdict(list)
+        routes: Dict[str, Set[str]] = defaultdict(set)
+        categories = store.category
+        for i, name in enumerate(store.names):
+            head = head_noun(name)
+            cat = categories[i] if categories is not None and categories[i] else head
+            if cat is None:
+                continue
+            members[cat].append(i)
+            if head is not None:
+                routes[head].add(cat)
+        self.rows: Dict[str, np.ndarray] = {c: np.asarray(r, dtype=np.int64) for c, r in members.items()}
+        self.routes: Dict[str, Tuple[str, ...]] = {h: tuple(sorted(c)) for h, c in routes.items()}
+        self.num_rows = len(store)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def categories_of(self, text: str) -> List[str]:
+        """Categories whose head nouns appear in `text` (two-syllable heads first)."""
+        words = _WORD_RE.findall(match_key(str(text or "")))
+        found: List[str] = []
+        for i, w in enumerate(words):
+            key = f"{w} {words[i + 1]}" if i + 1 < len(words) else None
+            cats = self.routes.get(key) if key else None
+            if cats is None:
+                cats = self.routes.get(w)
+            for c in cats or ():
+                if c not in found:
+                    found.append(c)
+        return found
+
+    def rows_for(self, text: str) -> Optional[np.ndarray]:
+        """Sorted rows of the routed partitions, or None when `text` names no category."""
+        cats = self.categories_of(text)
+        if not cats:
+            return None
+        if len(cats) == 1:
+            return self.rows[cats[0]]
+        return np.unique(np.concatenate([self.rows[c] for c in cats]))
+
+    def stats(self) -> Dict[str, object]:
+        sizes = sorted((len(r) for r in self.rows.values()), reverse=True)
+        return {
+            "partitions": len(self.rows),
+            "rows": self.num_rows,
+            "largest": sizes[:5],
+            "heads": len(self.routes),
+        }
+
+
+def build_partitions(store: ProductStore) -> CategoryPartitions:
+    partitions = CategoryPartitions(store)
+    print(f"[CategoryPartitions] {len(partitions)} partitions over {len(store)} products")
+    return partitions
@@ -0,0 +1,128 @@
+import math
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+# Từ chỉ màu/kích cỡ: bỏ đi khi so trùng biến thể của cùng một model
+VARIANT_WORDS = {
+    "màu", "size", "đen", "trắng", "đỏ", "xanh", "vàng", "hồng", "tím", "xám", "ghi", "bạc",
+    "nâu", "cam", "be", "kem", "gold", "black", "white", "pink", "blue", "red", "grey", "gray",
+    "s", "m", "l", "xl", "xxl",
+}
+# Từ "trang trí" ít giá trị phân biệt trong tên sản phẩm
+FILLER_WORDS = {
+    "cao", "cấp", "chính", "hãng", "loại", "hàng", "siêu", "tốt", "mới", "new", "hot", "sale",
+    "combo", "tặng", "kèm", "free", "bh", "bảo", "hành", "năm", "tháng", "-", "+", "/",
+}
+_UNIT_RE = re.compile(r"^\d+([.,]\d+)?(cm|mm|ml|l|lít|lit|kg|g|gr|w|inch|m)?$", re.IGNORECASE)
+# Mã model: có cả chữ và số (GM-2086, SK1009, 2500W) hoặc số >= 3 chữ số (2202)
+_MODEL_RE = re.compile(r"(?=[\w\-.]*[a-z])(?=[\w\-.]*\d)[\w\-.]+|\d{3,}", re.IGNORECASE)
+_PAREN_RE = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token estimate (~3 chars/token for Vietnamese with diacritics)."""
+    return int(math.ceil(len(text) / 3.0)) if text else 0
+
+
+def get_rerank_token_budget(default: int = 400) -> int:
+    # Ngân sách token cho khối ứng viên của prompt rerank; 0 tắt compaction (gửi nguyên danh sách)
+    try:
+        return max(0, int(os.getenv("PRODUCT_QA_RERANK_TOKEN_BUDGET", str(default))))
+    except ValueError:
+        return default
+
+
+def _words(name: str) -> List[str]:
+    text = _PAREN_RE.sub(" ", str(name or ""))
+    words = (w.strip(",;") for w in text.split())
+    return [w for w in words if w]
+
+
+def variant_key(name: str) -> str:
+    """Name with color/size/unit tokens removed: variants of one model share a key."""
+    kept = []
+    for w in _words(name):
+        lw = w.lower().strip(".:")
+        if lw in VARIANT_WORDS or _UNIT_RE.match(lw):
+            continue
+        kept.append(lw)
+    return " ".join(kept)
+
+
+def discriminative_name(name: str, keyword_tokens: set, max_words: int = 8) -> str:
+    """Keep the tokens that tell candidates apart: keyword hits, brand/model codes, head words."""
+    words = [w for w in _words(name) if w.lower() not in FILLER_WORDS]
+    if len(words) <= max_words:
+        return " ".join(words)
+    must = [i for i, w in enumerate(words) if w.lower() in keyword_tokens or _MODEL_RE.fullmatch(w)]
+    keep = set(must[:max_words])
+    for i in range(len(words)):
+        if len(keep) >= max_words:
+            break
+        keep.add(i)
+    return " ".join(words[i] for i in sorted(keep))
+
+
+def _assign_keyword(name: str, keywords: List[str]) -> Optional[str]:
+    tokens = set(w.lower() for w in _words(name))
+    best, best_overlap = None, 0
+    for kw in keywords:
+        overlap = len(tokens & set(kw.lower().split()))
+        if overlap > best_overlap:
+            best, best_overlap = kw, overlap
+    return best
+
+
+def compact_candidates(
+    keywords: List[str],
+    candidates: List[Dict],
+    token_budget: int,
+    max_words: int = 8,
+) -> Tuple[str, List[str]]:
+    """Build the candidate block of the rerank prompt within `token_budget`.
+
+    Near-identical names (color/size variants) collapse to the best-ranked
+    one, candidates are grouped under the keyword they match, names are cut
+    to discriminative tokens and lines are added in rank order until the
+    budget is spent. Returns (text, display_ids included).
+    """
+    seen_keys: Dict[str, Dict] = {}
+    reps: List[Dict] = []
+    for c in candidates:
+        key = variant_key(c.get("clean_name", "")) or str(c.get("display_id"))
+        if key in seen_keys:
+            seen_keys[key]["variants"] += 1
+            continue
+        entry = {"c": c, "variants": 1}
+        seen_keys[key] = entry
+        reps.append(entry)
+
+    kw_tokens = set(t for kw in keywords for t in kw.lower().split())
+    groups: Dict[Optional[str], List[str]] = {}
+    order: List[Optional[str]] = []
+    included: List[str] = []
+    used = 0
+    for entry in reps:
+        c = entry["c"]
+        short = discriminative_name(c.get("clean_name", ""), kw_tokens, max_words=max_words)
+        suffix = f" (+{entry['variants'] - 1} biến thể)" if entry["variants"] > 1 else ""
+        line = f"{c['display_id']} | {short}{suffix}"
+        group = _assign_keyword(c.get("clean_name", ""), keywords)
+        header_cost = estimate_tokens(f"# {group}\n") if group not in groups else 0
+        cost = estimate_tokens(line + "\n") + header_cost
+        if token_budget and included and used + cost > token_budget:
+            break
+        used += cost
+        if group not in groups:
+            groups[group] = []
+            order.append(group)
+        groups[group].append(line)
+        included.append(str(c["display_id"]))
+
+    blocks: List[str] = []
+    for group in order:
+        title = f"# {group}" if group else "# khác"
+        blocks.append(title + "\n" + "\n".join(groups[group]))
+    return "\n".join(blocks), included
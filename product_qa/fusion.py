@@ -0,0 +1,282 @@
+"""Retriever registry and array-based fusion of their hits.
+
+Every retriever returns (row indices, scores) best first; the hits of all
+retrievers and queries are concatenated into flat arrays (row, score, rank,
+retriever, query) and fused in one NumPy pass: per-row sums via `bincount`,
+per-retriever maxima via `maximum.at`, ordering via `lexsort`. The cost is
+linear in the number of hits, with no per-hit Python dicts until the final
+top_k records are built.
+"""
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from .categories import PARTITION_ROUTES, get_partition_min_cosine, get_partition_min_score
+from .metrics import stage
+from .store import ProductStore
+from .textnorm import squash_lower
+
+
+FUSION_METHODS = ("rrf", "calibrated")
+_EMPTY_ROWS = np.empty(0, dtype=np.int64)
+_EMPTY_SCORES = np.empty(0, dtype=np.float32)
+
+
+def get_fusion_method(default: str = "rrf") -> str:
+    # rrf: cộng 1/(k + hạng) qua mọi danh sách; calibrated: cộng điểm đã chia cho điểm cao nhất của danh sách
+    value = os.getenv("PRODUCT_QA_FUSION", default).strip().lower()
+    return value if value in FUSION_METHODS else default
+
+
+def get_rrf_k(default: int = 60) -> int:
+    try:
+        return max(1, int(os.getenv("PRODUCT_QA_RRF_K", str(default))))
+    except ValueError:
+        return default
+
+
+class Retriever(ABC):
+    """One candidate source. Subclasses implement `search(text, limit) -> (rows, scores)` best first."""
+
+    name = "retriever"
+    # Khóa điểm riêng trên candidate (feature cho reranker)
+    score_key = "retriever_score"
+    # Tên stage trong metrics/timings
+    stage = "retrieve"
+    # False: chỉ chạy trên cả câu hỏi, không chạy cho từng keyword
+    per_keyword = True
+    # Có ghi keyword vào timings ("fuzzy[<keyword>]") hay không
+    stage_detail = False
+    weight = 1.0
+
+    @abstractmethod
+    def search(self, text: str, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(row indices, scores) best first."""
+
+
+class FuzzyRetriever(Retriever):
+    name = "fuzzy"
+    score_key = "fuzzy_score"
+    stage = "fuzzy"
+    stage_detail = True
+
+    def __init__(self, store: ProductStore, lexical=None, prefilter: int = 0, partitions=None, min_score: Optional[float] = None) -> None:
+        self.store = store
+        self.lexical = lexical if prefilter else None
+        self.prefilter = prefilter
+        self.partitions = partitions
+        self.min_score = get_partition_min_score() if min_score is None else min_score
+
+    def _score_rows(self, query: str, rows: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        lower = self.store.lower
+        results = process.extract(query, [lower[i] for i in rows], scorer=fuzz.token_set_ratio, limit=limit)
+        if not results:
+            return _EMPTY_ROWS, _EMPTY_SCORES
+        return (
+            rows[[idx for _, _, idx in results]],
+            np.asarray([score for _, score, _ in results], dtype=np.float64) / 100.0,
+        )
+
+    def search(self, text: str, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        query = squash_lower(text)
+        if self.partitions is not None:
+            # Chỉ chấm trong phân vùng danh mục được nhắc tới; điểm yếu thì quét lại toàn bộ
+            rows = self.partitions.rows_for(text)
+            if rows is None:
+                PARTITION_ROUTES.inc(retriever=self.name, result="global")
+            else:
+                found, scores = self._score_rows(query, rows, limit)
+                if scores.size and scores[0] >= self.min_score:
+                    PARTITION_ROUTES.inc(retriever=self.name, result="routed")
+                    return found, scores
+                PARTITION_ROUTES.inc(retriever=self.name, result="fallback")
+        if self.lexical is not None:
+            # Chỉ chấm fuzzy trên các dòng BM25 tốt nhất; không có từ nào trùng thì quét toàn bộ
+            rows, _ = self.lexical.search_rows(text, top_k=self.prefilter)
+            if rows.size:
+                return self._score_rows(query, rows, limit)
+        results = process.extract(query, self.store.lower, scorer=fuzz.token_set_ratio, limit=limit)
+        if not results:
+            return _EMPTY_ROWS, _EMPTY_SCORES
+        return (
+            np.asarray([idx for _, _, idx in results], dtype=np.int64),
+            np.asarray([score for _, score, _ in results], dtype=np.float64) / 100.0,
+        )
+
+
+class LexicalRetriever(Retriever):
+    name = "lexical"
+    score_key = "lexical_score"
+    stage = "lexical"
+
+    def __init__(self, lexical) -> None:
+        self.lexical = lexical
+
+    def search(self, text: str, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.lexical.search_rows(text, top_k=limit)
+
+
+class EmbeddingRetriever(Retriever):
+    name = "embedding"
+    score_key = "embed_score"
+    stage = "embedding_search"
+    # Mỗi truy vấn là một lần gọi API embedding: chỉ embed cả câu hỏi như trước
+    per_keyword = False
+
+    def __init__(self, idx, partitions=None, min_score: Optional[float] = None) -> None:
+        self.idx = idx
+        self.partitions = partitions
+        self.min_score = get_partition_min_cosine() if min_score is None else min_score
+
+    def search(self, text: str, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        qv = self.idx.query_vector(text)
+        if self.partitions is not None:
+            rows = self.partitions.rows_for(text)
+            if rows is None:
+                PARTITION_ROUTES.inc(retriever=self.name, result="global")
+            else:
+                found, scores = self.idx.search_vector(qv, top_k=limit, rows=rows)
+                if scores.size and scores[0] >= self.min_score:
+                    PARTITION_ROUTES.inc(retriever=self.name, result="routed")
+                    return found, scores
+                # Tìm lại toàn cục bằng cùng vector: không gọi API embedding lần hai
+                PARTITION_ROUTES.inc(retriever=self.name, result="fallback")
+        return self.idx.search_vector(qv, top_k=limit)
+
+
+def default_retrievers(store: ProductStore, idx=None, lexical=None, prefilter: int = 0, partitions=None) -> List[Retriever]:
+    """fuzzy, then BM25 (if built), then embedding (if built)."""
+    retrievers: List[Retriever] = [FuzzyRetriever(store, lexical=lexical, prefilter=prefilter, partitions=partitions)]
+    if lexical is not None:
+        retrievers.append(LexicalRetriever(lexical))
+    if idx is not None:
+        retrievers.append(EmbeddingRetriever(idx, partitions=partitions))
+    return retrievers
+
+
+class Hits:
+    """Flat hit arrays: one entry per (retriever, query, rank)."""
+
+    __slots__ = ("rows", "scores", "ranks", "retriever", "query")
+
+    def __init__(self, rows, scores, ranks, retriever, query) -> None:
+        self.rows = rows
+        self.scores = scores
+        self.ranks = ranks
+        self.retriever = retriever
+        self.query = query
+
+    def __len__(self) -> int:
+        return int(self.rows.size)
+
+    @classmethod
+    def from_lists(cls, lists: Iterable[Tuple[int, int, np.ndarray, np.ndarray]]) -> "Hits":
+        """lists: (retriever id, query id, rows, scores) with rows best first."""
+        parts = [(r, q, np.asarray(rows, dtype=np.int64), scores) for r, q, rows, scores in lists]
+        parts = [p for p in parts if p[2].size]
+        if not parts:
+            empty_i = np.empty(0, dtype=np.int64)
+            return cls(empty_i, np.empty(0, dtype=np.float64), empty_i, np.empty(0, dtype=np.int16), np.empty(0, dtype=np.int32))
+        # Một lần concatenate/repeat cho mọi danh sách thay vì một mảng phụ cho từng danh sách
+        lengths = np.fromiter((p[2].size for p in parts), dtype=np.int64, count=len(parts))
+        starts = np.cumsum(lengths) - lengths
+        return cls(
+            np.concatenate([p[2] for p in parts]),
+            np.concatenate([np.asarray(p[3], dtype=np.float64) for p in parts]),
+            np.arange(int(lengths.sum()), dtype=np.int64) - np.repeat(starts, lengths),
+            np.repeat(np.fromiter((p[0] for p in parts), dtype=np.int16, count=len(parts)), lengths),
+            np.repeat(np.fromiter((p[1] for p in parts), dtype=np.int32, count=len(parts)), lengths),
+        )
+
+
+def collect_hits(
+    retrievers: Sequence[Retriever],
+    user_text: str,
+    keywords: Sequence[str],
+    top_k: int = 20,
+) -> Hits:
+    """Run every retriever on the question (query 0) and, if per_keyword, on each keyword (query i+1)."""
+    per_kw = max(5, top_k // len(keywords) if keywords else top_k)
+    queries = [(0, user_text, top_k, "query")] + [(i + 1, kw, per_kw, kw) for i, kw in enumerate(keywords)]
+    lists = []
+    for rid, retriever in enumerate(retrievers):
+        for qid, text, limit, label in queries:
+            if qid and not retriever.per_keyword:
+                break
+            with stage("product_qa", retriever.stage, detail=label if retriever.stage_detail else None):
+                rows, scores = retriever.search(text, limit)
+            lists.append((rid, qid, rows, scores))
+    return Hits.from_lists(lists)
+
+
+def fuse(
+    store: ProductStore,
+    hits: Hits,
+    retrievers: Sequence[Retriever],
+    top_k: int = 20,
+    preferred_ids: Optional[set] = None,
+    method: Optional[str] = None,
+    rrf_k: Optional[int] = None,
+) -> List[Dict]:
+    """Fuse hits into top_k candidate dicts ordered by (preferred, priority, fused score).
+
+    Each candidate keeps `score` = best raw score over retrievers (the
+    min_final_score filter), `<retriever>_score` = that retriever's best raw
+    score, `fused_score`, and `source` = the retriever contributing most.
+    """
+    if not len(hits):
+        return []
+    method = method or get_fusion_method()
+    # display_id trùng ở nhiều dòng: gộp về dòng đầu tiên như khi merge theo display_id
+    rows = store.canonical[hits.rows]
+    if method == "calibrated":
+        # Điểm các retriever không cùng thang (token_set_ratio/100, cosine, BM25): chia cho điểm
+        # cao nhất của từng danh sách (retriever, truy vấn) để đưa về cùng thang [0, 1]
+        list_id = hits.retriever.astype(np.int64) * (int(hits.query.max()) + 1) + hits.query
+        best = np.zeros(int(list_id.max()) + 1, dtype=np.float64)
+        np.maximum.at(best, list_id, hits.scores)
+        denom = best[list_id]
+        contrib = np.divide(hits.scores, denom, out=np.zeros_like(hits.scores), where=denom > 0)
+    else:
+        contrib = 1.0 / (float(rrf_k or get_rrf_k()) + hits.ranks + 1.0)
+    weights = np.asarray([r.weight for r in retrievers], dtype=np.float64)
+    contrib = contrib * weights[hits.retriever]
+
+    urows, inverse = np.unique(rows, return_inverse=True)
+    n_ret = len(retrievers)
+    fused = np.bincount(inverse, weights=contrib, minlength=len(urows))
+    per_ret = np.full((len(urows), n_ret), -np.inf, dtype=np.float64)
+    np.maximum.at(per_ret, (inverse, hits.retriever), hits.scores)
+    per_ret_contrib = np.zeros((len(urows), n_ret), dtype=np.float64)
+    np.add.at(per_ret_contrib, (inverse, hits.retriever), contrib)
+
+    priority = store.priority[urows]
+    pref = np.ones(len(urows), dtype=np.int8)
+    if preferred_ids:
+        pref_rows = [store.row_of(d) for d in preferred_ids]
+        pref_rows = np.asarray([r for r in pref_rows if r is not None], dtype=np.int64)
+        if pref_rows.size:
+            pref[np.isin(urows, pref_rows)] = 0
+    # lexsort: khóa cuối là khóa chính -> (preferred, priority, -fused)
+    order = np.lexsort((-fused, priority, pref))[:top_k]
+
+    # Chỉ top_k dòng được chuyển sang dict; đổi sang list Python một lần thay vì đọc từng phần tử NumPy
+    top_rows = urows[order].tolist()
+    top_scores = per_ret[order]
+    best_score = top_scores.max(axis=1).tolist()
+    best_source = per_ret_contrib[order].argmax(axis=1).tolist()
+    top_fused = fused[order].tolist()
+    keys = [r.score_key for r in retrievers]
+    names = [r.name for r in retrievers]
+    out: List[Dict] = []
+    for i, per in enumerate(top_scores.tolist()):
+        rec = store.record(top_rows[i], best_score[i], names[best_source[i]])
+        for key, value in zip(keys, per):
+            if value != -np.inf:
+                rec[key] = value
+        rec["fused_score"] = top_fused[i]
+        out.append(rec)
+    return out
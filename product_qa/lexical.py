@@ -0,0 +1,185 @@
+"""BM25 inverted index over diacritic-folded syllables and syllable bigrams.
+
+Postings are stored CSR-style (term -> contiguous doc/weight slices) with
+the BM25 weight of every posting precomputed, so a query only touches the
+postings of its own terms. The arrays are saved as `.cache/lexical_*.npz`
+next to the embedding cache and reloaded when the catalog is unchanged.
+"""
+import hashlib
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .store import ProductStore
+from .textnorm import match_key
+
+
+K1 = 1.2
+B = 0.75
+_WORD_RE = re.compile(r"\w+")
+
+
+def get_lexical_enabled() -> bool:
+    return os.getenv("PRODUCT_QA_LEXICAL", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_lexical_prefilter(default: int = 0) -> int:
+    # >0: fuzzy chỉ chấm trên N dòng BM25 tốt nhất (thay vì quét cả catalog); 0 tắt
+    try:
+        return max(0, int(os.getenv("PRODUCT_QA_LEXICAL_PREFILTER", str(default))))
+    except ValueError:
+        return default
+
+
+def terms_of(text: str) -> List[str]:
+    """Folded syllables plus adjacent-syllable bigrams ("noi", "com", "noi_com")."""
+    syllables = _WORD_RE.findall(match_key(str(text or "")))
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+def _catalog_digest(store: ProductStore) -> str:
+    h = hashlib.sha1()
+    for did, name in zip(store.ids, store.names):
+        h.update(f"{did}\x1f{name}\x1e".encode("utf-8"))
+    return h.hexdigest()
+
+
+class LexicalIndex:
+    def __init__(
+        self,
+        terms: List[str],
+        indptr: np.ndarray,
+        docs: np.ndarray,
+        weights: np.ndarray,
+        idf: np.ndarray,
+        num_docs: int,
+        digest: str = "",
+    ) -> None:
+        self.terms = list(terms)
+        self.vocab: Dict[str, int] = {t: i for i, t in enumerate(self.terms)}
+        self.indptr = indptr
+        self.docs = docs
+        self.weights = weights
+        self.idf = idf
+        self.num_docs = int(num_docs)
+        self.digest = digest
+
+    @classmethod
+    def build(cls, store: ProductStore) -> "LexicalIndex":
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        doc_len = np.zeros(len(store), dtype=np.float32)
+        for i, name in enumerate(store.names):
+            counts = Counter(terms_of(name))
+            doc_len[i] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(i)
+                tfs.append(tf)
+        t = np.asarray(term_ids, dtype=np.int64)
+        d = np.asarray(doc_ids, dtype=np.int32)
+        tf = np.asarray(tfs, dtype=np.float32)
+        order = np.lexsort((d, t))
+        t, d, tf = t[order], d[order], tf[order]
+        df = np.bincount(t, minlength=len(vocab)).astype(np.float32)
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df.astype(np.int64), out=indptr[1:])
+        n = max(1, len(store))
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(doc_len.mean()) if len(store) else 1.0
+        norm = K1 * (1.0 - B + B * doc_len[d] / max(avgdl, 1e-6))
+        weights = (idf[t] * tf * (K1 + 1.0) / (tf + norm)).astype(np.float32)
+        terms = [None] * len(vocab)
+        for term, i in vocab.items():
+            terms[i] = term
+        return cls(terms, indptr, d, weights, idf, len(store), _catalog_digest(store))
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.indptr.nbytes + self.docs.nbytes + self.weights.nbytes + self.idf.nbytes)
+
+    # -------- query --------
+    def _postings(self, text: str) -> Tuple[np.ndarray, np.ndarray, float]:
+        tids = sorted({self.vocab[t] for t in terms_of(text) if t in self.vocab})
+        if not tids:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32), 0.0
+        docs = np.concatenate([self.docs[self.indptr[t]:self.indptr[t + 1]] for t in tids])
+        weights = np.concatenate([self.weights[self.indptr[t]:self.indptr[t + 1]] for t in tids])
+        # Cận trên BM25 của truy vấn (tf -> vô hạn): dùng để đưa điểm về [0, 1]
+        bound = float(self.idf[tids].sum() * (K1 + 1.0))
+        return docs, weights, bound
+
+    def search_rows(self, text: str, top_k: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+        """(row indices, scores in [0, 1]) best first; cost ~ postings of the query terms."""
+        docs, weights, bound = self._postings(text)
+        if docs.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32) / bound
+        if len(rows) > top_k:
+            keep = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")
+        return rows[order].astype(np.int64), scores[order]
+
+    # -------- persistence --------
+    def save(self, path: Path) -> None:
+        tmp = path.with_suffix(".npz.tmp")
+        with tmp.open("wb") as f:
+            np.savez(
+                f,
+                terms=np.asarray(self.terms, dtype=str),
+                indptr=self.indptr,
+                docs=self.docs,
+                weights=self.weights,
+                idf=self.idf,
+                num_docs=np.asarray([self.num_docs]),
+                digest=np.asarray([self.digest]),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["terms"].tolist(),
+                data["indptr"],
+                data["docs"],
+                data["weights"],
+                data["idf"],
+                int(data["num_docs"][0]),
+                str(data["digest"][0]),
+            )
+
+
+def lexical_cache_path(source_key: str) -> Path:
+    base = Path(__file__).parent / ".cache"
+    base.mkdir(parents=True, exist_ok=True)
+    key = hashlib.sha256(source_key.encode("utf-8")).hexdigest()[:16]
+    return base / f"lexical_{key}.npz"
+
+
+def load_or_build_lexical(store: ProductStore, source_key: str) -> LexicalIndex:
+    path = lexical_cache_path(source_key)
+    digest = _catalog_digest(store)
+    if path.exists():
+        try:
+            index = LexicalIndex.load(path)
+            if index.digest == digest and index.num_docs == len(store):
+                print(f"[LexicalIndex] Loaded cache: {path.name} terms={len(index.terms)}")
+                return index
+        except Exception:
+            pass
+    index = LexicalIndex.build(store)
+    try:
+        index.save(path)
+        print(f"[LexicalIndex] Saved cache: {path.name} terms={len(index.terms)}")
+    except Exception:
+        pass
+    return index
@@ -0,0 +1,116 @@
+"""Slim Gemini client shared by product_qa, ship_fee and the address normalizer.
+
+Importing this module does not import the provider SDK; `google.generativeai`
+is loaded and configured once, on the first call that needs it.
+"""
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from . import cassette
+from .metrics import record_calls
+
+
+_LOCK = threading.RLock()
+_GENAI: Any = None
+_MODELS: Dict[str, Any] = {}
+
+
+def _provider() -> Any:
+    global _GENAI
+    if _GENAI is None:
+        with _LOCK:
+            if _GENAI is None:
+                import google.generativeai as genai
+
+                _GENAI = genai
+    return _GENAI
+
+
+_CONFIGURED = False
+
+
+def load_api_key() -> None:
+    # Chỉ đọc .env và genai.configure một lần cho cả process
+    global _CONFIGURED
+    if _CONFIGURED or cassette.replaying():
+        # Replay không cần khóa API lẫn SDK
+        return
+    with _LOCK:
+        if _CONFIGURED:
+            return
+        load_dotenv()
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise RuntimeError("Missing GOOGLE_API_KEY in .env")
+        _provider().configure(api_key=api_key)
+        _CONFIGURED = True
+
+
+def get_llm_model_name() -> str:
+    # Model cho intent/keyword/rerank
+    return os.getenv("GOOGLE_MODEL", "gemini-2.5-flash")
+
+
+def get_embed_model_name() -> str:
+    # Model cho embedding
+    return os.getenv("GOOGLE_EMBED_MODEL", "text-embedding-004")
+
+
+def _model(name: str) -> Any:
+    model = _MODELS.get(name)
+    if model is None:
+        model = _provider().GenerativeModel(name)
+        _MODELS[name] = model
+    return model
+
+
+def call_llm_json(prompt: str, model_name: Optional[str] = None) -> Dict:
+    load_api_key()
+    record_calls("generate")
+    name = model_name or get_llm_model_name()
+    return cassette.record_llm(prompt, name, lambda: _generate_json(prompt, name))
+
+
+def _generate_json(prompt: str, model_name: str) -> Dict:
+    resp = _model(model_name).generate_content(prompt)
+    text = resp.candidates[0].content.parts[0].text  # type: ignore
+    try:
+        return json.loads(text)
+    except Exception:
+        m = re.search(r"\{[\s\S]*\}", text)
+        return json.loads(m.group(0)) if m else {"error": "Malformed JSON", "raw": text}
+
+
+def _to_vector(emb_resp) -> List[float]:
+    # Normalize various response shapes from SDK
+    # Possible shapes:
+    # - {"embedding": {"values": [...]}}
+    # - {"embedding": [...]}
+    # - object with .embedding (list) or .embedding.values
+    if isinstance(emb_resp, dict):
+        emb = emb_resp.get("embedding")
+        if isinstance(emb, dict) and "values" in emb:
+            return emb["values"]
+        if isinstance(emb, list):
+            return emb
+    if hasattr(emb_resp, "embedding"):
+        emb = getattr(emb_resp, "embedding")
+        if hasattr(emb, "values"):
+            return emb.values  # type: ignore
+        return emb  # type: ignore
+    raise ValueError("Unknown embedding response shape")
+
+
+def embed(texts: List[str], model_name: Optional[str] = None) -> List[List[float]]:
+    load_api_key()
+    name = model_name or get_embed_model_name()
+    vectors: List[List[float]] = []
+    for t in texts:
+        record_calls("embed")
+        vectors.append(cassette.record_embed(t, name, lambda t=t: _to_vector(_provider().embed_content(model=name, content=t))))
+    return vectors
@@ -0,0 +1,298 @@
+"""In-process metrics shared by ship_fee and product_qa.
+
+Counters, gauges and histograms are kept in a process-wide registry and
+rendered in the Prometheus text exposition format, so a `/metrics` endpoint
+needs no external client library or service.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:  # pragma: no cover - overridden
+        return []
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def set_function(self, fn: Callable[[], float], **labels: str) -> None:
+        """Read the value from `fn` at scrape time (e.g. a queue depth)."""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = fn
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = float(fn())
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        # per label set: [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = [0.0] * (len(self.buckets) + 2)
+                self._values[key] = row
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            row = self._values.get(self._key(labels))
+            return int(row[-1]) if row else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines: List[str] = []
+        for key, row in items:
+            for bound, cnt in zip(self.buckets, row):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {_format_value(cnt)}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {_format_value(row[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(row[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(row[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None:
+                if not isinstance(existing, cls) or existing.labelnames != tuple(labelnames):
+                    raise ValueError(f"Metric {name} already registered with a different type or labels")
+                return existing
+            metric = cls(name, documentation, labelnames, **kwargs)
+            self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = [self._metrics[n] for n in sorted(self._metrics)]
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+# -----------------------------
+# Shared metric families
+# -----------------------------
+STAGE_SECONDS = REGISTRY.histogram(
+    "nhanbeo_stage_duration_seconds",
+    "Wall time per pipeline stage.",
+    ["subsystem", "stage"],
+)
+LLM_CALLS = REGISTRY.counter(
+    "nhanbeo_llm_calls_total",
+    "Remote LLM/embedding calls by kind (generate, embed).",
+    ["kind"],
+)
+LLM_CACHE = REGISTRY.counter(
+    "nhanbeo_llm_cache_requests_total",
+    "LLM result cache lookups by cache and result (hit, miss).",
+    ["cache", "result"],
+)
+REDIS_ERRORS = REGISTRY.counter(
+    "nhanbeo_redis_errors_total",
+    "Redis operations that raised and were handled by a fallback.",
+    ["component", "op"],
+)
+
+
+class RequestTimings:
+    """Per-request stage wall times and remote call counts."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.calls: Dict[str, int] = {}
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages.append((name, seconds))
+
+    def add_calls(self, kind: str, n: int = 1) -> None:
+        self.calls[kind] = self.calls.get(kind, 0) + n
+
+    def as_dict(self) -> Dict[str, Any]:
+        stages_ms: Dict[str, float] = {}
+        for name, seconds in self.stages:
+            # Repeated stages (e.g. the same keyword twice) are summed
+            stages_ms[name] = round(stages_ms.get(name, 0.0) + seconds * 1000.0, 3)
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000.0, 3),
+            "stages_ms": stages_ms,
+            "llm_calls": self.calls.get("generate", 0),
+            "embedding_calls": self.calls.get("embed", 0),
+        }
+
+
+_CURRENT_TIMINGS: ContextVar[Optional[RequestTimings]] = ContextVar("nhanbeo_request_timings", default=None)
+
+
+@contextmanager
+def collect_timings() -> Iterator[RequestTimings]:
+    """Collect stage timings and call counts of the enclosed request."""
+    timings = RequestTimings()
+    token = _CURRENT_TIMINGS.set(timings)
+    try:
+        yield timings
+    finally:
+        _CURRENT_TIMINGS.reset(token)
+
+
+@contextmanager
+def stage(subsystem: str, name: str, detail: Optional[str] = None) -> Iterator[None]:
+    """Time a block into `nhanbeo_stage_duration_seconds{subsystem,stage}`.
+
+    `detail` (e.g. the keyword of a fuzzy call) only shows up in per-request
+    timings as "name[detail]", keeping histogram label cardinality bounded.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, subsystem=subsystem, stage=name)
+        timings = _CURRENT_TIMINGS.get()
+        if timings is not None:
+            timings.add_stage(f"{name}[{detail}]" if detail else name, elapsed)
+
+
+def record_calls(kind: str, n: int = 1) -> None:
+    """Count remote calls ("generate" or "embed") globally and for the current request."""
+    LLM_CALLS.inc(n, kind=kind)
+    timings = _CURRENT_TIMINGS.get()
+    if timings is not None:
+        timings.add_calls(kind, n)
+
+
+def render_latest() -> str:
+    return REGISTRY.render()
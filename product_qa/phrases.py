@@ -0,0 +1,174 @@
+"""Product phrase dictionary mined from the catalog, matched in one pass.
+
+Phrases are 2-4 syllable n-grams of `clean_name`: the leading n-grams of
+every name (the product type usually comes first: "Nồi cơm điện ...") plus
+any n-gram shared by at least `min_count` names, and synonyms that point to
+one of those phrases. Leading n-grams are "head" phrases (a product type);
+a message is only answered locally if it contains at least one, so shared
+modifiers like "cao cấp" alone still go to the LLM. Phrases are compiled
+into a syllable trie keyed on diacritic-folded syllables, so "noi com dien"
+and "nồi cơm điện" both return the catalog spelling "nồi cơm điện".
+"""
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import REGISTRY
+from .store import ProductStore
+from .textnorm import fold_cached
+
+
+KEYWORD_SOURCES = REGISTRY.counter(
+    "product_qa_keyword_source_total",
+    "Keyword extraction by source (local = phrase dictionary, llm).",
+    ["source"],
+)
+
+MIN_SYLLABLES = 2
+MAX_SYLLABLES = 4
+_WORD_RE = re.compile(r"\w+")
+_END = ""
+
+# Từ không được đứng đầu/cuối cụm, so theo chữ viết (còn dấu): cụm kiểu "có vung", "cho bé"
+# không phải tên sản phẩm. Không so sau khi bỏ dấu vì sẽ chặn nhầm danh từ: bán/bàn, kèm/kem, đây/dây
+STOP_SYLLABLES = {
+    "có", "cho", "và", "với", "của", "thế", "này", "kia", "đó", "đây", "ấy",
+    "tặng", "kèm", "loại", "size", "màu", "bán", "mới", "hàng", "chính", "x",
+}
+
+# Cách gọi khác -> cụm có trong catalog; chỉ dùng khi cụm đích có trong từ điển
+DEFAULT_SYNONYMS = {
+    "ấm đun siêu tốc": "ấm siêu tốc",
+    "bình đun siêu tốc": "ấm siêu tốc",
+    "nồi cơm": "nồi cơm điện",
+    "máy xay sinh tố": "máy sinh tố",
+    "bếp điện từ": "bếp từ",
+    "nồi ủ nhiệt": "nồi ủ chân không",
+}
+
+
+def get_local_keywords_enabled() -> bool:
+    # Trích keyword bằng từ điển cụm từ catalog; LLM chỉ chạy khi không khớp cụm nào
+    return os.getenv("PRODUCT_QA_LOCAL_KEYWORDS", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_phrase_min_count(default: int = 2) -> int:
+    try:
+        return max(1, int(os.getenv("PRODUCT_QA_PHRASE_MIN_COUNT", str(default))))
+    except ValueError:
+        return default
+
+
+def load_synonyms() -> Dict[str, str]:
+    """DEFAULT_SYNONYMS plus PRODUCT_QA_PHRASE_SYNONYMS (JSON file {"alias": "catalog phrase"})."""
+    synonyms = dict(DEFAULT_SYNONYMS)
+    path = os.getenv("PRODUCT_QA_PHRASE_SYNONYMS")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            synonyms.update({str(k): str(v) for k, v in json.load(f).items()})
+    return synonyms
+
+
+def syllables(text: str) -> Tuple[List[str], List[str]]:
+    """(lowercase syllables as written, folded syllables) of `text`."""
+    words = _WORD_RE.findall(str(text or "").lower())
+    return words, [fold_cached(w) for w in words]
+
+
+def _is_phrase(words: Tuple[str, ...]) -> bool:
+    return (
+        all(s.isalpha() for s in words)
+        and words[0] not in STOP_SYLLABLES
+        and words[-1] not in STOP_SYLLABLES
+    )
+
+
+class PhraseDictionary:
+    """Syllable trie over folded phrases; `extract` is leftmost-longest, linear in the text."""
+
+    def __init__(self, phrases: Dict[Tuple[str, ...], Tuple[str, bool]]) -> None:
+        # phrases: khóa (âm tiết đã bỏ dấu) -> (cụm trả về theo chính tả catalog, là cụm đầu tên)
+        self.size = len(phrases)
+        self._root: Dict[str, Dict] = {}
+        for key, value in phrases.items():
+            node = self._root
+            for syl in key:
+                node = node.setdefault(syl, {})
+            node[_END] = value
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def build(
+        cls,
+        store: ProductStore,
+        min_count: Optional[int] = None,
+        synonyms: Optional[Dict[str, str]] = None,
+    ) -> "PhraseDictionary":
+        min_count = get_phrase_min_count() if min_count is None else min_count
+        counts: Counter = Counter()
+        leading = set()
+        surfaces: Dict[Tuple[str, ...], Counter] = defaultdict(Counter)
+        for name in store.names:
+            words, folded = syllables(name)
+            seen = set()
+            for n in range(MIN_SYLLABLES, MAX_SYLLABLES + 1):
+                for i in range(len(folded) - n + 1):
+                    key = tuple(folded[i:i + n])
+                    if key in seen or not _is_phrase(tuple(words[i:i + n])):
+                        continue
+                    seen.add(key)
+                    counts[key] += 1
+                    surfaces[key][" ".join(words[i:i + n])] += 1
+                    if i == 0:
+                        leading.add(key)
+        phrases = {
+            key: (surfaces[key].most_common(1)[0][0], key in leading)
+            for key, c in counts.items()
+            if c >= min_count or key in leading
+        }
+        for alias, target in (load_synonyms() if synonyms is None else synonyms).items():
+            target_key = tuple(syllables(target)[1])
+            alias_key = tuple(syllables(alias)[1])
+            if target_key in phrases and alias_key and alias_key not in phrases:
+                phrases[alias_key] = phrases[target_key]
+        return cls(phrases)
+
+    def extract(self, text: str) -> List[str]:
+        """Catalog phrases found in `text`, in order, without overlaps or duplicates.
+
+        Empty unless at least one head phrase (product type) matched.
+        """
+        _, folded = syllables(text)
+        out: List[str] = []
+        has_head = False
+        i, n = 0, len(folded)
+        while i < n:
+            node = self._root
+            best: Optional[Tuple[int, Tuple[str, bool]]] = None
+            j = i
+            while j < n:
+                node = node.get(folded[j])
+                if node is None:
+                    break
+                j += 1
+                if _END in node:
+                    best = (j, node[_END])
+            if best is None:
+                i += 1
+                continue
+            surface, is_head = best[1]
+            has_head = has_head or is_head
+            if surface not in out:
+                out.append(surface)
+            i = best[0]
+        return out if has_head else []
+
+
+def build_phrase_dictionary(store: ProductStore) -> PhraseDictionary:
+    phrases = PhraseDictionary.build(store)
+    print(f"[PhraseDictionary] Built {len(phrases)} phrases from {len(store)} products")
+    return phrases
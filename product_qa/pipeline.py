@@ -4,34 +4,28 @@ import json
 import time
 import hashlib
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
 
 import pandas as pd
 import numpy as np
-from dotenv import load_dotenv
 from rapidfuzz import fuzz, process
-from sklearn.metrics.pairwise import cosine_similarity
 
-import google.generativeai as genai
-import requests
-
-
-def load_api_key() -> None:
-    load_dotenv()
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise RuntimeError("Missing GOOGLE_API_KEY in .env")
-    genai.configure(api_key=api_key)
-
-
-def get_llm_model_name() -> str:
-    # Model cho intent/keyword/rerank
-    return os.getenv("GOOGLE_MODEL", "gemini-2.5-flash")
-
-
-def get_embed_model_name() -> str:
-    # Model cho embedding
-    return os.getenv("GOOGLE_EMBED_MODEL", "text-embedding-004")
+# Giữ tên cũ (pipeline.load_api_key, pipeline.call_llm_json...) cho code đang import từ đây
+from .llm_client import call_llm_json, embed, get_embed_model_name, get_llm_model_name, load_api_key
+from .cassette import http_get
+from .metrics import collect_timings, stage
+from .profiling import profile_request
+from .compaction import compact_candidates, get_rerank_token_budget
+from .reranker import RERANK_PATHS, LocalReranker, load_reranker_from_env, log_rerank_decision
+from .store import ProductStore, as_store
+from .quantize import QuantizedIndex, get_embed_storage
+from .textnorm import squash_lower
+from .lexical import LexicalIndex, get_lexical_enabled, get_lexical_prefilter
+from .fusion import Retriever, collect_hits, default_retrievers, fuse
+from .categories import CategoryPartitions, get_partitions_enabled
+from .answer_cache import AnswerCache, get_answer_cache_enabled
+from .preferences import PreferenceStore
+from .phrases import KEYWORD_SOURCES, PhraseDictionary, get_local_keywords_enabled
 
 
 def load_products(csv_path: str) -> pd.DataFrame:
@@ -39,11 +33,19 @@ def load_products(csv_path: str) -> pd.DataFrame:
     # priority: vị trí trong file, dòng càng nhỏ càng ưu tiên
     df["priority"] = np.arange(len(df), dtype=int)
     df["clean_lower"] = df["clean_name"].astype(str).str.lower()
-    return df[["display_id", "clean_name", "clean_lower", "priority"]]
+    return df[_catalog_columns(df)]
+
+
+def _catalog_columns(df: pd.DataFrame) -> List[str]:
+    # Cột category (nếu nguồn có) dùng để chia phân vùng tìm kiếm (categories.py)
+    cols = ["display_id", "clean_name", "clean_lower", "priority"]
+    if "category" in df.columns and df["category"].notna().any():
+        cols.append("category")
+    return cols
 
 
 def load_products_from_api(api_url: str, timeout: int = 20) -> pd.DataFrame:
-    resp = requests.get(api_url, timeout=timeout)
+    resp = http_get(api_url, timeout=timeout)
     resp.raise_for_status()
     data = resp.json()
     items = data.get("current") or data.get("data") or []
@@ -58,73 +60,57 @@ def load_products_from_api(api_url: str, timeout: int = 20) -> pd.DataFrame:
             "display_id": did,
             "clean_name": name,
             "priority": i,  # thứ tự theo API
+            "category": str(it.get("category") or it.get("category_name") or "").strip() or None,
         })
     df = pd.DataFrame(rows)
     if df.empty:
         raise RuntimeError("API returned no valid products")
     df["clean_lower"] = df["clean_name"].astype(str).str.lower()
-    return df[["display_id", "clean_name", "clean_lower", "priority"]]
+    return df[_catalog_columns(df)]
 
 
 def basic_normalize(text: str) -> str:
-    return re.sub(r"\s+", " ", text.strip().lower())
+    return squash_lower(text)
 
 
-def fuzzy_candidates(df: pd.DataFrame, query: str, limit: int = 20) -> List[Dict]:
-    choices = df["clean_lower"].tolist()
+def fuzzy_candidates(catalog: Union[pd.DataFrame, ProductStore], query: str, limit: int = 20) -> List[Dict]:
+    # Truyền ProductStore dựng sẵn để khỏi chuyển DataFrame mỗi lần gọi
+    store = as_store(catalog)
     results = process.extract(
-        basic_normalize(query), choices, scorer=fuzz.token_set_ratio, limit=limit
+        basic_normalize(query), store.lower, scorer=fuzz.token_set_ratio, limit=limit
     )
-    rows: List[Dict] = []
-    for _, score, idx in results:
-        r = df.iloc[idx]
-        rows.append({
-            "display_id": r["display_id"],
-            "clean_name": r["clean_name"],
-            "score": float(score) / 100.0,
-            "priority": int(r["priority"]),
-            "source": "fuzzy",
-        })
-    return rows
-
-
-def _to_vector(emb_resp) -> List[float]:
-    # Normalize various response shapes from SDK
-    # Possible shapes:
-    # - {"embedding": {"values": [...]}}
-    # - {"embedding": [...]}
-    # - resp.embedding.values
-    # - resp.embedding
-    if isinstance(emb_resp, dict):
-        emb = emb_resp.get("embedding")
-        if isinstance(emb, dict) and "values" in emb:
-            return emb["values"]
-        if isinstance(emb, list):
-            return emb
-    if hasattr(emb_resp, "embedding"):
-        emb = getattr(emb_resp, "embedding")
-        if hasattr(emb, "values"):
-            return emb.values  # type: ignore
-        return emb  # type: ignore
-    raise ValueError("Unknown embedding response shape")
+    return [store.record(idx, score / 100.0, "fuzzy") for _, score, idx in results]
 
 
 def embed_texts_gemini(texts: List[str], model_name: str = "text-embedding-004") -> np.ndarray:
-    # Prefer embed_content for embeddings
-    vectors: List[List[float]] = []
-    for t in texts:
-        emb = genai.embed_content(model=model_name, content=t)
-        vectors.append(_to_vector(emb))
-    return np.array(vectors)
+    # float32 ngay từ đầu (np.array mặc định float64 sẽ gấp đôi bộ nhớ cho tới khi lưu cache)
+    return np.asarray(embed(texts, model_name), dtype=np.float32)
 
 
 class EmbeddingIndex:
-    def __init__(self, df: pd.DataFrame, model_name: Optional[str] = None, source_key: str = "default") -> None:
-        # Giữ nguyên cột priority từ df gốc
-        self.df = df.reset_index(drop=True)
+    def __init__(
+        self,
+        catalog: Union[pd.DataFrame, ProductStore],
+        model_name: Optional[str] = None,
+        source_key: str = "default",
+        previous: Optional["EmbeddingIndex"] = None,
+        storage: Optional[str] = None,
+    ) -> None:
+        # Giữ nguyên priority của catalog gốc
+        self.store = as_store(catalog)
         self.model_name = model_name or get_embed_model_name()
         self.source_key = source_key
+        # previous: index đang phục vụ; tái sử dụng vector trong RAM thay vì đọc lại cache từ đĩa
+        self._previous = previous if (previous is not None and previous.model_name == self.model_name) else None
         self.matrix = self._load_or_build_index()
+        self._previous = None
+        # storage float16/int8: giữ ma trận lượng tử trong RAM, float32 gốc chỉ được mmap
+        # từ file cache để chấm lại chính xác shortlist
+        self.storage = storage or get_embed_storage()
+        self.quant: Optional[QuantizedIndex] = None
+        if self.storage != "float32":
+            self.matrix = self._mmap_cache(self.matrix)
+            self.quant = QuantizedIndex(self.matrix, self.storage)
 
     def _cache_dir(self) -> Path:
         base = Path(__file__).parent / ".cache"
@@ -163,11 +149,33 @@ class EmbeddingIndex:
                 return None
         return None
 
+    def _mmap_cache(self, matrix: np.ndarray) -> np.ndarray:
+        matrix_path = self._cache_paths()["matrix"]
+        try:
+            mm = np.load(matrix_path, mmap_mode="r")
+        except Exception:
+            return matrix
+        if mm.shape != matrix.shape or mm.dtype != np.float32 or not (
+            len(mm) == 0 or (np.array_equal(mm[0], matrix[0]) and np.array_equal(mm[-1], matrix[-1]))
+        ):
+            return matrix
+        return mm
+
+    @property
+    def resident_nbytes(self) -> int:
+        if self.quant is not None and isinstance(self.matrix, np.memmap):
+            return self.quant.resident_nbytes
+        return int(self.matrix.nbytes) + (self.quant.resident_nbytes if self.quant is not None else 0)
+
     def _save_cache(self, matrix: np.ndarray, ids: List[str], names: List[str]) -> None:
         paths = self._cache_paths()
         matrix_path, meta_path = paths["matrix"], paths["meta"]
         try:
-            np.save(matrix_path, matrix.astype(np.float32))
+            # Ghi file tạm rồi đổi tên: snapshot cũ đang mmap file cũ không bị cắt ngang
+            tmp_path = matrix_path.with_suffix(".npy.tmp")
+            with tmp_path.open("wb") as f:
+                np.save(f, matrix.astype(np.float32))
+            os.replace(tmp_path, matrix_path)
             meta = {
                 "model_name": self.model_name,
                 "num_rows": int(len(ids)),
@@ -182,9 +190,13 @@ class EmbeddingIndex:
             pass
 
     def _build_or_update_matrix(self) -> np.ndarray:
-        cached = self._try_load_cache()
-        df_ids = self.df["display_id"].astype(str).tolist()
-        df_names = self.df["clean_name"].astype(str).tolist()
+        if self._previous is not None:
+            prev = self._previous
+            cached = (prev.matrix, {"ids": prev.store.ids, "names": prev.store.names})
+        else:
+            cached = self._try_load_cache()
+        df_ids = self.store.ids
+        df_names = self.store.names
 
         if cached is None:
             vectors = embed_texts_gemini(df_names, self.model_name)
@@ -224,39 +236,40 @@ class EmbeddingIndex:
                 rows[i] = next(it)
 
         matrix = np.vstack(rows)
-        self._save_cache(matrix, df_ids, df_names)
+        # Chỉ ghi lại cache khi có thay đổi (thêm/đổi tên/xóa/đổi thứ tự)
+        if missing_names or len(rows) != len(cached_ids) or df_ids != cached_ids:
+            self._save_cache(matrix, df_ids, df_names)
         return matrix
 
     def _load_or_build_index(self) -> np.ndarray:
         print("[EmbeddingIndex] Preparing embeddings (incremental)...")
         return self._build_or_update_matrix()
 
-    def search(self, query: str, top_k: int = 10) -> List[Dict]:
-        qv = embed_texts_gemini([query], self.model_name)[0]
-        sims = cosine_similarity([qv], self.matrix)[0]
+    def query_vector(self, query: str) -> np.ndarray:
+        return embed_texts_gemini([query], self.model_name)[0]
+
+    def search_vector(self, qv: np.ndarray, top_k: int = 10, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(row indices, cosine scores) best first; `rows` restricts scoring to a subset."""
+        if self.quant is not None:
+            return self.quant.search(qv, top_k=top_k, rows=rows)
+        # sklearn chỉ cần khi tìm bằng embedding float32: import muộn để khởi động nhanh
+        from sklearn.metrics.pairwise import cosine_similarity
+
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        sims = cosine_similarity([qv], matrix)[0]
         top_idx = np.argsort(-sims)[:top_k]
-        rows: List[Dict] = []
-        for i in top_idx:
-            r = self.df.iloc[i]
-            rows.append({
-                "display_id": r["display_id"],
-                "clean_name": r["clean_name"],
-                "score": float(sims[i]),
-                "priority": int(r["priority"]),
-                "source": "embedding",
-            })
-        return rows
-
-
-def call_llm_json(prompt: str, model_name: Optional[str] = None) -> Dict:
-    model = genai.GenerativeModel(model_name or get_llm_model_name())
-    resp = model.generate_content(prompt)
-    text = resp.candidates[0].content.parts[0].text  # type: ignore
-    try:
-        return json.loads(text)
-    except Exception:
-        m = re.search(r"\{[\s\S]*\}", text)
-        return json.loads(m.group(0)) if m else {"error": "Malformed JSON", "raw": text}
+        scores = sims[top_idx].astype(np.float32)
+        if rows is not None:
+            top_idx = np.asarray(rows, dtype=np.int64)[top_idx]
+        return top_idx, scores
+
+    def search_rows(self, query: str, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """(row indices, cosine scores) best first."""
+        return self.search_vector(self.query_vector(query), top_k=top_k)
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict]:
+        top_idx, scores = self.search_rows(query, top_k=top_k)
+        return self.store.records(top_idx, scores, "embedding")
 
 
 INTENT_PROMPT = (
@@ -302,10 +315,23 @@ def _normalize_keyword(kw: str, add_electric: bool = False) -> str:
     return normalized
 
 
-def extract_keywords(user_text: str) -> List[str]:
-    prompt = KEYWORD_PROMPT.replace("{user_text}", user_text)
-    out = call_llm_json(prompt)
-    raw_kws: List[str] = out.get("keywords", [])
+def extract_keywords(user_text: str, phrases: Optional[PhraseDictionary] = None) -> List[str]:
+    return _extract_keywords(user_text, phrases)[0]
+
+
+def _extract_keywords(user_text: str, phrases: Optional[PhraseDictionary] = None) -> Tuple[List[str], Optional[str]]:
+    """(keywords, error of the LLM call or None)."""
+    # Từ điển cụm từ catalog (nếu bật): khớp được cụm sản phẩm thì không cần gọi LLM
+    raw_kws: List[str] = phrases.extract(user_text) if phrases is not None else []
+    error = None
+    if raw_kws:
+        KEYWORD_SOURCES.inc(source="local")
+    else:
+        KEYWORD_SOURCES.inc(source="llm")
+        prompt = KEYWORD_PROMPT.replace("{user_text}", user_text)
+        out = call_llm_json(prompt)
+        raw_kws = out.get("keywords", [])
+        error = out.get("error")
     lower_text = user_text.lower()
     # Chỉ coi là có ngữ cảnh điện khi người dùng nhắc từ "điện" rõ ràng
     electric_hint = "điện" in lower_text
@@ -321,55 +347,42 @@ def extract_keywords(user_text: str) -> List[str]:
             norm_kws.append(nk)
     # keep only >= 2 tokens
     filtered = [k for k in norm_kws if len(k.split()) >= 2]
-    return filtered if filtered else norm_kws
+    return (filtered if filtered else norm_kws), error
 
 
 def retrieve_candidates(
-    df: pd.DataFrame,
+    catalog: Union[pd.DataFrame, ProductStore],
     idx: Optional[EmbeddingIndex],
     keywords: List[str],
     user_text: str,
     top_k: int = 20,
     preferred_ids: Optional[set] = None,
+    lexical: Optional[LexicalIndex] = None,
+    retrievers: Optional[List[Retriever]] = None,
+    partitions: Optional[CategoryPartitions] = None,
 ) -> List[Dict]:
-    bag: List[Dict] = []
-    bag.extend(fuzzy_candidates(df, user_text, limit=top_k))
-    for kw in keywords:
-        bag.extend(
-            fuzzy_candidates(
-                df, kw, limit=max(5, top_k // len(keywords) if keywords else top_k)
-            )
-        )
-    if idx is not None:
-        bag.extend(idx.search(user_text, top_k=top_k))
-    combined: Dict[str, Dict] = {}
-    for r in bag:
-        did = r["display_id"]
-        if did not in combined:
-            combined[did] = r
-        else:
-            combined[did]["score"] = max(combined[did]["score"], r["score"])
-            # Ưu tiên priority nhỏ hơn (gần đầu file hơn)
-            combined[did]["priority"] = min(
-                combined[did].get("priority", 1_000_000), r.get("priority", 1_000_000)
-            )
-    def sort_key(item: Dict):
-        # Ưu tiên 1: có trong preferred_ids
-        pref_flag = 0 if (preferred_ids and item.get("display_id") in preferred_ids) else 1
-        # Ưu tiên 2: thứ tự dòng trong CSV (priority nhỏ hơn tốt hơn)
-        pri = int(item.get("priority", 1_000_000))
-        # Ưu tiên 3: điểm số (cao hơn tốt hơn)
-        score = -float(item.get("score", 0.0))
-        return (pref_flag, pri, score)
-
-    merged = sorted(combined.values(), key=sort_key)[:top_k]
-    return merged
-
-
-def rerank_with_llm(user_text: str, keywords: List[str], candidates: List[Dict]) -> Dict:
-    cand_lines = "\n".join([f"{c['display_id']} | {c['clean_name']}" for c in candidates])
-    prompt = f"""
-Bạn nhận: truy vấn người dùng và danh sách ứng viên (display_id | clean_name).
+    store = as_store(catalog)
+    if retrievers is None:
+        prefilter = get_lexical_prefilter() if lexical is not None else 0
+        retrievers = default_retrievers(store, idx=idx, lexical=lexical, prefilter=prefilter, partitions=partitions)
+    # Mỗi retriever trả (dòng, điểm) theo thứ tự tốt nhất trước; gộp lại thành mảng phẳng
+    hits = collect_hits(retrievers, user_text, keywords, top_k=top_k)
+    with stage("product_qa", "merge"):
+        # Thứ tự: preferred_ids -> priority (dòng trong CSV) -> điểm fusion (PRODUCT_QA_FUSION)
+        return fuse(store, hits, retrievers, top_k=top_k, preferred_ids=preferred_ids)
+
+
+def build_rerank_prompt(user_text: str, keywords: List[str], candidates: List[Dict], token_budget: Optional[int] = None) -> str:
+    budget = get_rerank_token_budget() if token_budget is None else token_budget
+    if budget > 0:
+        # Gộp biến thể màu/size, nhóm theo keyword, rút gọn tên và giới hạn số token của prompt
+        cand_lines, _ = compact_candidates(keywords, candidates, budget)
+        cand_header = "display_id | tên rút gọn, nhóm theo từ khóa"
+    else:
+        cand_lines = "\n".join([f"{c['display_id']} | {c['clean_name']}" for c in candidates])
+        cand_header = "display_id | clean_name"
+    return f"""
+Bạn nhận: truy vấn người dùng và danh sách ứng viên ({cand_header}).
 Hãy chọn các sản phẩm phù hợp nhất, có thể chia theo từng từ khóa.
 Trả về JSON:\n{{
   "selections": [
@@ -383,7 +396,10 @@ Truy vấn: "{user_text}"
 Từ khóa: {json.dumps(keywords, ensure_ascii=False)}
 Ứng viên:\n{cand_lines}
 """
-    return call_llm_json(prompt)
+
+
+def rerank_with_llm(user_text: str, keywords: List[str], candidates: List[Dict], token_budget: Optional[int] = None) -> Dict:
+    return call_llm_json(build_rerank_prompt(user_text, keywords, candidates, token_budget))
 
 
 def _select_final_product(
@@ -392,6 +408,7 @@ def _select_final_product(
     reranked: Optional[Dict],
     preferred_ids: Optional[set] = None,
     min_score: float = 0.6,
+    store: Optional[ProductStore] = None,
 ) -> Dict:
     # Ưu tiên keyword có nhiều từ hơn (>= 2 từ). Chọn ra đúng 1 sản phẩm cuối cùng, bắt buộc score >= min_score.
     def count_words(s: Optional[str]) -> int:
@@ -400,7 +417,12 @@ def _select_final_product(
         return len(str(s).strip().split())
 
     id_to_rank = {c["display_id"]: i for i, c in enumerate(candidates)}
-    id_to_priority = {c["display_id"]: int(c.get("priority", 1_000_000)) for c in candidates}
+    if store is not None:
+        # Tra priority trực tiếp trong catalog (id -> dòng) thay vì dựng dict từ candidates
+        priority_of = store.priority_of
+    else:
+        id_to_priority = {c["display_id"]: int(c.get("priority", 1_000_000)) for c in candidates}
+        priority_of = lambda d: id_to_priority.get(d, 1_000_000)
 
     selections = (reranked or {}).get("selections", []) if isinstance(reranked, dict) else []
     # Chỉ xét candidates đạt ngưỡng điểm
@@ -421,7 +443,7 @@ def _select_final_product(
             # Ưu tiên preferred_ids nếu có, sau đó theo thứ hạng trong candidates
             def rank_key(d: str) -> tuple:
                 pref = 0 if (preferred_ids and d in preferred_ids) else 1
-                pri = id_to_priority.get(d, 1_000_000)
+                pri = priority_of(d)
                 idx = id_to_rank.get(d, 10**9)
                 return (pref, pri, idx)
             best_id = min(dids, key=rank_key) if dids else None
@@ -443,44 +465,161 @@ def _select_final_product(
     return {"keyword": None, "product": None}
 
 
+def _cacheable(out: Dict) -> bool:
+    # Lỗi tạm thời (LLM trả JSON hỏng...) hoặc chưa chọn được sản phẩm: không cache, lần sau hỏi lại
+    if out.get("keyword_error"):
+        return False
+    reranked = out.get("reranked")
+    if isinstance(reranked, dict) and reranked.get("error"):
+        return False
+    # _select_final_product luôn trả dict; {"product": None} nghĩa là không có sản phẩm đạt ngưỡng
+    return bool((out.get("final_product") or {}).get("product"))
+
+
 def product_qa_pipeline(
     csv_path: Optional[str] = None,
     build_embedding: bool = False,
     preferred_ids: Optional[set] = None,
     api_url: Optional[str] = None,
     min_final_score: float = 0.6,
+    reranker: Optional[LocalReranker] = None,
+    refresh_interval_s: Optional[float] = None,
+    build_lexical: Optional[bool] = None,
+    local_keywords: Optional[bool] = None,
+    partitions: Optional[bool] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    preferences: Optional[PreferenceStore] = None,
 ):
+    from .catalog import CatalogHolder, CatalogRefresher, build_snapshot, get_refresh_interval_s
+
     load_api_key()
+    # Reranker cục bộ (tùy chọn): bỏ qua LLM rerank khi ứng viên top1 vượt trội rõ ràng
+    reranker = reranker or load_reranker_from_env()
     if api_url:
-        df = load_products_from_api(api_url)
+        loader = lambda: load_products_from_api(api_url)
     elif csv_path:
-        df = load_products(csv_path)
+        loader = lambda: load_products(csv_path)
     else:
         raise ValueError("Either api_url or csv_path must be provided")
     # Source key để cache theo nguồn (api/csv) nhằm cho phép cập nhật gia tăng
     source_key = api_url or (os.path.abspath(csv_path) if csv_path else "default")
-    idx = EmbeddingIndex(df, source_key=source_key) if build_embedding else None
-
-    def ask(user_text: str) -> Dict:
-        intent = detect_intent(user_text)
+    # Chỉ mục BM25 (retriever thứ ba, tùy chọn): PRODUCT_QA_LEXICAL=1
+    if build_lexical is None:
+        build_lexical = get_lexical_enabled()
+    # Trích keyword cục bộ bằng từ điển cụm từ của catalog: PRODUCT_QA_LOCAL_KEYWORDS=1
+    if local_keywords is None:
+        local_keywords = get_local_keywords_enabled()
+    # Chia catalog theo danh mục, tìm trong phân vùng trước: PRODUCT_QA_PARTITIONS=1
+    if partitions is None:
+        partitions = get_partitions_enabled()
+    holder = CatalogHolder(build_snapshot(
+        loader(), source_key, build_embedding,
+        build_lexical=build_lexical, build_phrases=local_keywords, build_partitions=partitions,
+    ))
+    # Refresher nền: poll nguồn, chỉ embed mục mới/đổi tên rồi đổi snapshot nguyên tử
+    if refresh_interval_s is None:
+        refresh_interval_s = get_refresh_interval_s()
+    refresher = CatalogRefresher(
+        holder, loader, source_key, build_embedding, refresh_interval_s,
+        build_lexical=build_lexical, build_phrases=local_keywords, build_partitions=partitions,
+    ).start()
+    # Cache toàn bộ câu trả lời theo (câu hỏi, preferred_ids, nội dung catalog): PRODUCT_QA_ANSWER_CACHE=1
+    if answer_cache is None and get_answer_cache_enabled():
+        answer_cache = AnswerCache(namespace=source_key)
+    if answer_cache is not None:
+        answer_cache.reranker = reranker
+        answer_cache.min_final_score = min_final_score
+
+    # Sở thích theo khách (đơn hàng cũ): ask(q, customer_id=...) tra một lần thay vì dựng lại pipeline
+    if preferences is None:
+        preferences = PreferenceStore.from_env()
+    default_preferred = preferred_ids
+
+    def ask(
+        user_text: str,
+        with_timings: bool = False,
+        preferred_ids: Optional[set] = None,
+        customer_id: Optional[str] = None,
+    ) -> Dict:
+        # with_timings=True thêm mục "timings": thời gian từng bước + số lần gọi LLM/embedding
+        # preferred_ids truyền trực tiếp > tra theo customer_id (hội thoại/khách) > preferred_ids lúc dựng pipeline
+        with profile_request("ask"):
+            if not with_timings:
+                return _cached_ask(user_text, preferred_ids, customer_id)
+            with collect_timings() as timings:
+                out = _cached_ask(user_text, preferred_ids, customer_id)
+            out["timings"] = timings.as_dict()
+            return out
+
+    def _cached_ask(user_text: str, preferred_ids: Optional[set], customer_id: Optional[str]) -> Dict:
+        if preferred_ids is None and customer_id:
+            with stage("product_qa", "preferences"):
+                preferred_ids = preferences.get(customer_id)
+        if preferred_ids is None:
+            preferred_ids = default_preferred
+        # Đọc snapshot đúng một lần: cả request dùng cùng một phiên bản catalog
+        snap = holder.current
+        if answer_cache is None:
+            return _ask(user_text, snap, preferred_ids)
+        with stage("product_qa", "answer_cache"):
+            hit = answer_cache.get(snap, user_text, preferred_ids)
+        if hit is not None:
+            # Câu trả lời có thể do worker khác ghi (cùng nội dung catalog, số version riêng)
+            if "catalog_version" in hit:
+                hit["catalog_version"] = snap.version
+            return hit
+        out = _ask(user_text, snap, preferred_ids)
+        if _cacheable(out):
+            answer_cache.put(snap, user_text, preferred_ids, out)
+        return out
+
+    def _ask(user_text: str, snap, preferred_ids: Optional[set]) -> Dict:
+        with stage("product_qa", "intent"):
+            intent = detect_intent(user_text)
         if intent != "product_query":
             return {"intent": intent, "message": "Đây không phải câu hỏi sản phẩm."}
-        keywords = extract_keywords(user_text)
-        cands = retrieve_candidates(df, idx, keywords, user_text, preferred_ids=preferred_ids)
+        with stage("product_qa", "keywords"):
+            keywords, keyword_error = _extract_keywords(user_text, phrases=snap.phrases)
+        with stage("product_qa", "retrieve"):
+            cands = retrieve_candidates(
+                snap.store, snap.idx, keywords, user_text, preferred_ids=preferred_ids,
+                lexical=snap.lexical, partitions=snap.partitions,
+            )
         if not cands:
             return {"intent": intent, "keywords": keywords, "results": []}
-        reranked = rerank_with_llm(user_text, keywords, cands)
-        final_pick = _select_final_product(
-            keywords, cands, reranked, preferred_ids=preferred_ids, min_score=min_final_score
-        )
-        return {
+        reranked = None
+        if reranker is not None:
+            with stage("product_qa", "local_rerank"):
+                reranked = reranker.decide(keywords, cands, preferred_ids)
+        if reranked is not None:
+            RERANK_PATHS.inc(path="local")
+        else:
+            RERANK_PATHS.inc(path="llm")
+            with stage("product_qa", "rerank"):
+                reranked = rerank_with_llm(user_text, keywords, cands)
+            log_rerank_decision(user_text, keywords, cands, reranked, preferred_ids)
+        with stage("product_qa", "final_pick"):
+            final_pick = _select_final_product(
+                keywords, cands, reranked, preferred_ids=preferred_ids, min_score=min_final_score, store=snap.store
+            )
+        out = {
             "intent": intent,
             "keywords": keywords,
             "candidates": cands,
             "reranked": reranked,
             "final_product": final_pick,
+            "catalog_version": snap.version,
         }
-
+        if keyword_error:
+            # Keyword do LLM lỗi (vd. JSON hỏng): câu trả lời không được cache
+            out["keyword_error"] = keyword_error
+        return out
+
+    # Cho phép caller xem/ép refresh: ask.catalog.current.version, ask.refresher.refresh_once()
+    ask.catalog = holder
+    ask.refresher = refresher
+    ask.answer_cache = answer_cache
+    ask.preferences = preferences
     return ask
 
 
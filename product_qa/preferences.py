@@ -0,0 +1,238 @@
+"""Per-customer preferred display_ids (products from past orders).
+
+`ask(..., customer_id=...)` looks the set up here instead of the pipeline
+being built around one `preferred_ids`. Sets are filled incrementally from
+order events (`add_order`) or, on a miss, from the PosCake
+near-by-conversation endpoint, and kept with a TTL in process and, when
+REDIS_URL is set, in Redis so every worker sees the same history. With
+Redis, Redis is the source of truth and the in-process copy only lives for
+PRODUCT_QA_PREFERENCE_LOCAL_TTL_S (default 5 s), so an order added on
+another worker shows up here within that time.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+try:
+    import redis  # type: ignore
+except Exception:  # pragma: no cover
+    redis = None  # type: ignore
+
+from .cassette import http_get
+from .metrics import LLM_CACHE, REDIS_ERRORS
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def preferred_ids_from_orders(data: Any) -> FrozenSet[str]:
+    """display_ids in `orders[*].items[*]` (PosCake order list or a single order event)."""
+    if not isinstance(data, dict):
+        return frozenset()
+    orders = data.get("orders")
+    if orders is None:
+        # Một đơn lẻ (sự kiện đơn hàng): {"items": [...]}
+        orders = [data]
+    out = set()
+    for od in orders or []:
+        if not isinstance(od, dict):
+            continue
+        for it in od.get("items") or []:
+            if not isinstance(it, dict):
+                continue
+            did = it.get("display_id") or it.get("product_display_id")
+            if did:
+                out.add(str(did))
+    return frozenset(out)
+
+
+class PosCakeOrdersLoader:
+    """GET {base}/api/v1/poscake/orders/near-by-conversation?conversation_id=..."""
+
+    def __init__(self, base_url: str, timeout: float = 10.0) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def __call__(self, conversation_id: str) -> Optional[FrozenSet[str]]:
+        url = f"{self.base_url}/api/v1/poscake/orders/near-by-conversation"
+        resp = http_get(url, params={"conversation_id": conversation_id}, timeout=self.timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        if isinstance(data, dict) and data.get("success") is False:
+            return None
+        return preferred_ids_from_orders(data)
+
+
+class PreferenceStore:
+    """customer/conversation id -> frozenset of display_ids, with TTL."""
+
+    def __init__(
+        self,
+        loader: Optional[Callable[[str], Optional[Iterable[str]]]] = None,
+        ttl_s: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        redis_url: Optional[str] = None,
+        local_ttl_s: Optional[float] = None,
+    ) -> None:
+        self.loader = loader
+        self.ttl_s = _env_number("PRODUCT_QA_PREFERENCE_TTL_S", 1800) if ttl_s is None else ttl_s
+        self.max_entries = int(_env_number("PRODUCT_QA_PREFERENCE_SIZE", 10000) if max_entries is None else max_entries)
+        self._local: "OrderedDict[str, Tuple[float, FrozenSet[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Khóa theo khách: nhiều tin nhắn cùng lúc của một khách chỉ gọi PosCake một lần
+        self._load_locks: Dict[str, threading.Lock] = {}
+        url = redis_url if redis_url is not None else os.getenv("REDIS_URL")
+        self.client = None
+        if url and redis is not None:
+            try:
+                self.client = redis.Redis.from_url(url, decode_responses=True)
+            except Exception:
+                self.client = None
+        local_ttl_s = _env_number("PRODUCT_QA_PREFERENCE_LOCAL_TTL_S", 5) if local_ttl_s is None else local_ttl_s
+        # Có Redis: bản trong RAM chỉ giữ ngắn, để đơn mới ghi ở worker khác được thấy sớm
+        self.local_ttl_s = min(self.ttl_s, local_ttl_s) if self.client is not None else self.ttl_s
+
+    @classmethod
+    def from_env(cls) -> "PreferenceStore":
+        base = os.getenv("POSCAKE_BASE")
+        return cls(loader=PosCakeOrdersLoader(base) if base else None)
+
+    @staticmethod
+    def _redis_key(customer_id: str) -> str:
+        return f"product_qa:pref:{customer_id}"
+
+    def _get_local(self, customer_id: str) -> Optional[FrozenSet[str]]:
+        with self._lock:
+            hit = self._local.get(customer_id)
+            if hit is None:
+                return None
+            if hit[0] <= time.time():
+                del self._local[customer_id]
+                return None
+            self._local.move_to_end(customer_id)
+            return hit[1]
+
+    def _put_local(self, customer_id: str, ids: FrozenSet[str]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._local[customer_id] = (time.time() + self.local_ttl_s, ids)
+            self._local.move_to_end(customer_id)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def get(self, customer_id: Optional[str]) -> Optional[FrozenSet[str]]:
+        """Preferred ids of a customer (None if unknown); loads from PosCake on a miss."""
+        if not customer_id:
+            return None
+        ids = self._get_local(customer_id)
+        if ids is not None:
+            LLM_CACHE.inc(cache="product_qa_preferences", result="hit")
+            return ids or None
+        LLM_CACHE.inc(cache="product_qa_preferences", result="miss")
+        with self._lock:
+            load_lock = self._load_locks.setdefault(customer_id, threading.Lock())
+        try:
+            with load_lock:
+                ids = self._get_local(customer_id)
+                if ids is None:
+                    ids = self._load(customer_id)
+        finally:
+            with self._lock:
+                self._load_locks.pop(customer_id, None)
+        return ids or None
+
+    def _load(self, customer_id: str) -> Optional[FrozenSet[str]]:
+        if self.client is not None:
+            try:
+                key = self._redis_key(customer_id)
+                pipe = self.client.pipeline()
+                pipe.exists(key)
+                pipe.smembers(key)
+                exists, members = pipe.execute()
+                if exists:
+                    # Tập rỗng được lưu bằng phần tử "" để phân biệt "không có đơn" với "chưa tải"
+                    ids = frozenset(m for m in members if m)
+                    self._put_local(customer_id, ids)
+                    return ids
+            except Exception:
+                REDIS_ERRORS.inc(component="preferences", op="get")
+        if self.loader is None:
+            return None
+        try:
+            loaded = self.loader(customer_id)
+        except Exception as e:
+            # Lỗi PosCake: trả lời không cá nhân hóa, không cache để lần sau thử lại
+            print(f"[PreferenceStore] Load failed for {customer_id}: {e}")
+            return None
+        if loaded is None:
+            return None
+        ids = frozenset(str(d) for d in loaded)
+        self.set(customer_id, ids)
+        return ids
+
+    def set(self, customer_id: str, ids: Iterable[str]) -> FrozenSet[str]:
+        ids = frozenset(str(d) for d in ids)
+        self._put_local(customer_id, ids)
+        if self.client is not None:
+            try:
+                key = self._redis_key(customer_id)
+                pipe = self.client.pipeline()
+                pipe.delete(key)
+                pipe.sadd(key, *(ids or {""}))
+                pipe.expire(key, max(1, int(self.ttl_s)))
+                pipe.execute()
+            except Exception:
+                REDIS_ERRORS.inc(component="preferences", op="set")
+        return ids
+
+    def add_order(self, customer_id: str, order: Any) -> FrozenSet[str]:
+        """Merge the display_ids of one order event into the customer's set."""
+        new_ids = preferred_ids_from_orders(order)
+        current = self._get_local(customer_id)
+        if current is None:
+            # Tải lịch sử (Redis/PosCake) trước khi bổ sung, để không ghi đè bằng tập chỉ có đơn mới
+            current = self.get(customer_id) or frozenset()
+        merged = current | new_ids
+        if self.client is not None and new_ids:
+            try:
+                key = self._redis_key(customer_id)
+                pipe = self.client.pipeline()
+                pipe.sadd(key, *new_ids)
+                pipe.srem(key, "")
+                pipe.expire(key, max(1, int(self.ttl_s)))
+                pipe.smembers(key)
+                members = pipe.execute()[-1]
+                # Tập trong Redis có cả đơn do worker khác ghi
+                merged = frozenset(m for m in members if m) | new_ids
+            except Exception:
+                REDIS_ERRORS.inc(component="preferences", op="add")
+        self._put_local(customer_id, merged)
+        return merged
+
+    def invalidate(self, customer_id: str) -> None:
+        with self._lock:
+            self._local.pop(customer_id, None)
+        if self.client is not None:
+            try:
+                self.client.delete(self._redis_key(customer_id))
+            except Exception:
+                REDIS_ERRORS.inc(component="preferences", op="delete")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._local)
+        return {
+            "entries": size,
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "local_ttl_s": self.local_ttl_s,
+            "loader": self.loader is not None,
+            "redis": self.client is not None,
+        }
@@ -0,0 +1,92 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+try:
+    from pyinstrument import Profiler as _SamplingProfiler  # type: ignore
+except Exception:  # pragma: no cover
+    _SamplingProfiler = None  # type: ignore
+
+
+_COUNTER = 0
+_COUNTER_LOCK = threading.Lock()
+_CPROFILE_LOCK = threading.Lock()
+
+
+def get_profile_dir() -> Optional[str]:
+    # Bật profiler theo request khi đặt PRODUCT_QA_PROFILE_DIR
+    return os.getenv("PRODUCT_QA_PROFILE_DIR") or None
+
+
+def _should_sample() -> bool:
+    try:
+        rate = float(os.getenv("PRODUCT_QA_PROFILE_SAMPLE", "1"))
+    except ValueError:
+        rate = 1.0
+    return rate >= 1.0 or random.random() < rate
+
+
+def _next_path(profile_dir: str, name: str, suffix: str) -> Path:
+    global _COUNTER
+    with _COUNTER_LOCK:
+        _COUNTER += 1
+        n = _COUNTER
+    base = Path(profile_dir)
+    base.mkdir(parents=True, exist_ok=True)
+    return base / f"{name}_{int(time.time())}_{os.getpid()}_{n}{suffix}"
+
+
+@contextmanager
+def profile_request(name: str = "ask") -> Iterator[None]:
+    """Profile the enclosed request and dump the result to PRODUCT_QA_PROFILE_DIR.
+
+    PRODUCT_QA_PROFILER=cprofile (default) writes a .prof file readable with
+    pstats/snakeviz; =sampling uses pyinstrument (if installed) and writes .html.
+    PRODUCT_QA_PROFILE_SAMPLE (0..1) profiles only a fraction of requests.
+    cProfile runs for one request at a time; overlapping requests are not profiled.
+    """
+    profile_dir = get_profile_dir()
+    if not profile_dir or not _should_sample():
+        yield
+        return
+    kind = os.getenv("PRODUCT_QA_PROFILER", "cprofile").lower().strip()
+    if kind == "sampling" and _SamplingProfiler is not None:
+        profiler = _SamplingProfiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            try:
+                _next_path(profile_dir, name, ".html").write_text(profiler.output_html(), encoding="utf-8")
+            except Exception:
+                pass
+        return
+    import cProfile
+
+    # Python >= 3.12 chỉ cho một cProfile chạy mỗi lúc (ValueError): request trùng thời điểm thì bỏ qua
+    if not _CPROFILE_LOCK.acquire(blocking=False):
+        yield
+        return
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Một profiler khác (ngoài module này) đang chạy
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            try:
+                profiler.dump_stats(str(_next_path(profile_dir, name, ".prof")))
+            except Exception:
+                pass
+    finally:
+        _CPROFILE_LOCK.release()
@@ -0,0 +1,121 @@
+"""Quantized embedding storage with exact float32 rescoring.
+
+The resident matrix is int8 (one float32 scale per row) or float16 over
+L2-normalized rows. A query is scored against it coarsely, then a shortlist
+is rescored exactly against the float32 matrix, which can be a read-only
+memory map of the `.cache/*.npy` file so that only shortlisted rows are
+ever paged in.
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+
+def get_embed_storage(default: str = "float32") -> str:
+    # Kiểu lưu ma trận embedding trong RAM: float32 (mặc định, như cũ) | float16 | int8
+    value = os.getenv("PRODUCT_QA_EMBED_STORAGE", default).strip().lower()
+    return value if value in STORAGE_DTYPES else default
+
+
+def get_shortlist_size(top_k: int) -> int:
+    try:
+        size = int(os.getenv("PRODUCT_QA_EMBED_SHORTLIST", "0"))
+    except ValueError:
+        size = 0
+    return max(top_k, size or max(50, 5 * top_k))
+
+
+def quantize(unit_rows: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Return (codes, per-row scales); scales is None for float16."""
+    if dtype == "float16":
+        return unit_rows.astype(np.float16), None
+    if dtype == "int8":
+        max_abs = np.abs(unit_rows).max(axis=1)
+        scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+        codes = np.clip(np.rint(unit_rows / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales
+    raise ValueError(f"Unsupported quantized dtype: {dtype}")
+
+
+class QuantizedIndex:
+    """Coarse search on quantized unit vectors, exact rescoring on float32 rows."""
+
+    def __init__(self, matrix: np.ndarray, dtype: str = "int8", chunk_rows: int = 65536) -> None:
+        # matrix: float32 gốc (ndarray hoặc np.memmap); chỉ các dòng trong shortlist được đọc lại
+        self.matrix = matrix
+        self.dtype = dtype
+        n = matrix.shape[0]
+        norms = np.empty(n, dtype=np.float32)
+        codes_parts = []
+        scale_parts = []
+        # Lượng tử hóa theo khối để không phải giữ cả ma trận float32 trong RAM cùng lúc
+        for start in range(0, n, chunk_rows):
+            block = np.asarray(matrix[start:start + chunk_rows], dtype=np.float32)
+            block_norms = np.linalg.norm(block, axis=1)
+            norms[start:start + len(block)] = block_norms
+            codes, scales = quantize(block / np.where(block_norms > 0, block_norms, 1.0)[:, None], dtype)
+            codes_parts.append(codes)
+            if scales is not None:
+                scale_parts.append(scales)
+        dim = matrix.shape[1] if matrix.ndim == 2 else 0
+        empty = np.empty((0, dim), dtype=np.int8 if dtype == "int8" else np.float16)
+        self.codes = np.concatenate(codes_parts) if codes_parts else empty
+        self.scales = np.concatenate(scale_parts) if scale_parts else None
+        self.norms = norms
+
+    @property
+    def resident_nbytes(self) -> int:
+        size = self.codes.nbytes + self.norms.nbytes
+        if self.scales is not None:
+            size += self.scales.nbytes
+        return int(size)
+
+    def coarse_scores(self, unit_query: np.ndarray, chunk_rows: int = 8192, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        # int8/float16 @ float32 khiến NumPy nâng cả ma trận lên float32: làm theo khối để
+        # bộ nhớ tạm chỉ là chunk_rows x dim thay vì gấp 2-4 lần ma trận lượng tử
+        q = unit_query.astype(np.float32)
+        n = self.codes.shape[0] if rows is None else len(rows)
+        out = np.empty(n, dtype=np.float32)
+        for start in range(0, n, chunk_rows):
+            if rows is None:
+                block = self.codes[start:start + chunk_rows].astype(np.float32)
+            else:
+                block = self.codes[rows[start:start + chunk_rows]].astype(np.float32)
+            out[start:start + len(block)] = block @ q
+        if self.scales is not None:
+            out *= self.scales if rows is None else self.scales[rows]
+        return out
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 10,
+        shortlist: Optional[int] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row indices, exact cosine scores) of the top_k rows, best first.
+
+        `rows` restricts the search to a subset (e.g. a category partition).
+        """
+        n = self.codes.shape[0] if rows is None else len(rows)
+        if n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        q = np.asarray(query, dtype=np.float32)
+        q_norm = float(np.linalg.norm(q)) or 1.0
+        unit_q = q / q_norm
+        coarse = self.coarse_scores(unit_q, rows=rows)
+        size = min(n, shortlist or get_shortlist_size(top_k))
+        cand = np.argpartition(-coarse, size - 1)[:size] if size < n else np.arange(n)
+        if rows is not None:
+            cand = np.asarray(rows, dtype=np.int64)[cand]
+        # Đọc theo thứ tự tăng dần để memmap truy cập đĩa tuần tự
+        cand.sort()
+        rows = np.asarray(self.matrix[cand], dtype=np.float32)
+        denom = self.norms[cand]
+        exact = (rows @ unit_q) / np.where(denom > 0, denom, 1.0)
+        order = np.argsort(-exact, kind="stable")[:top_k]
+        return cand[order], exact[order]
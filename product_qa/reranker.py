@@ -0,0 +1,325 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import REGISTRY
+
+
+FEATURE_NAMES = [
+    "fuzzy_score",
+    "cosine",
+    "priority_rank",
+    "keyword_overlap",
+    "preferred",
+]
+
+RERANK_PATHS = REGISTRY.counter(
+    "product_qa_rerank_total",
+    "Rerank decisions by path (local = LLM skipped, llm).",
+    ["path"],
+)
+
+
+def _tokens(text: Optional[str]) -> List[str]:
+    return [t for t in re.split(r"[^\w]+", str(text or "").lower()) if t]
+
+
+def _retriever_score(c: Dict, key: str, source: str) -> float:
+    val = c.get(key)
+    if val is None and c.get("source") == source:
+        val = c.get("score")
+    return float(val or 0.0)
+
+
+def extract_features(
+    keyword: str,
+    candidates: List[Dict],
+    preferred_ids: Optional[set] = None,
+) -> np.ndarray:
+    """Feature matrix (len(candidates) x len(FEATURE_NAMES)) for one keyword."""
+    kw_tokens = set(_tokens(keyword))
+    # Thứ hạng priority trong danh sách ứng viên, chuẩn hóa về [0, 1] (0 = ưu tiên nhất)
+    priorities = [int(c.get("priority", 1_000_000)) for c in candidates]
+    order = sorted(range(len(candidates)), key=lambda i: priorities[i])
+    rank = [0.0] * len(candidates)
+    denom = max(1, len(candidates) - 1)
+    for r, i in enumerate(order):
+        rank[i] = r / denom
+    rows: List[List[float]] = []
+    for i, c in enumerate(candidates):
+        fuzzy_score = _retriever_score(c, "fuzzy_score", "fuzzy")
+        cosine = _retriever_score(c, "embed_score", "embedding")
+        name_tokens = set(_tokens(c.get("clean_name")))
+        overlap = (len(kw_tokens & name_tokens) / len(kw_tokens)) if kw_tokens else 0.0
+        preferred = 1.0 if (preferred_ids and c.get("display_id") in preferred_ids) else 0.0
+        rows.append([fuzzy_score, cosine, rank[i], overlap, preferred])
+    return np.asarray(rows, dtype=np.float32).reshape(len(candidates), len(FEATURE_NAMES))
+
+
+class LocalReranker:
+    """Linear (logistic) scorer trained on logged LLM rerank decisions.
+
+    The LLM is skipped only when, for every keyword, the best candidate beats
+    the runner-up by at least `margin_threshold` in predicted probability.
+    """
+
+    def __init__(
+        self,
+        weights: Sequence[float],
+        bias: float,
+        mean: Sequence[float],
+        std: Sequence[float],
+        margin_threshold: float = 0.3,
+        min_top_prob: float = 0.5,
+    ) -> None:
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.margin_threshold = float(margin_threshold)
+        self.min_top_prob = float(min_top_prob)
+
+    # -------- scoring --------
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        z = ((features - self.mean) / self.std) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def rank(self, keyword: str, candidates: List[Dict], preferred_ids: Optional[set] = None) -> Tuple[List[int], np.ndarray]:
+        probs = self.predict_proba(extract_features(keyword, candidates, preferred_ids))
+        return list(np.argsort(-probs, kind="stable")), probs
+
+    def decide(self, keywords: List[str], candidates: List[Dict], preferred_ids: Optional[set] = None) -> Optional[Dict]:
+        """Return a rerank result shaped like `rerank_with_llm`, or None to defer to the LLM."""
+        if not keywords or not candidates:
+            return None
+        selections: List[Dict[str, Any]] = []
+        for kw in keywords:
+            order, probs = self.rank(kw, candidates, preferred_ids)
+            top = float(probs[order[0]])
+            second = float(probs[order[1]]) if len(order) > 1 else 0.0
+            if top < self.min_top_prob or top - second < self.margin_threshold:
+                return None
+            selections.append({"keyword": kw, "display_ids": [candidates[order[0]]["display_id"]]})
+        return {
+            "selections": selections,
+            "needs_clarification": False,
+            "clarify_question": "",
+            "source": "local_reranker",
+        }
+
+    # -------- persistence --------
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "feature_names": FEATURE_NAMES,
+            "weights": [float(w) for w in self.weights],
+            "bias": self.bias,
+            "mean": [float(m) for m in self.mean],
+            "std": [float(s) for s in self.std],
+            "margin_threshold": self.margin_threshold,
+            "min_top_prob": self.min_top_prob,
+        }
+
+    def fingerprint(self) -> str:
+        """Short hash of the weights and thresholds (part of answer cache keys)."""
+        raw = json.dumps(self.to_dict(), sort_keys=True)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalReranker":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("feature_names") != FEATURE_NAMES:
+            raise ValueError(f"Reranker model {path} was trained with different features")
+        return cls(
+            data["weights"],
+            data["bias"],
+            data["mean"],
+            data["std"],
+            margin_threshold=data.get("margin_threshold", 0.3),
+            min_top_prob=data.get("min_top_prob", 0.5),
+        )
+
+
+def load_reranker_from_env() -> Optional[LocalReranker]:
+    path = os.getenv("PRODUCT_QA_RERANKER_MODEL")
+    if not path:
+        return None
+    try:
+        model = LocalReranker.load(path)
+    except Exception as e:
+        print(f"[LocalReranker] Cannot load {path}: {e}")
+        return None
+    threshold = os.getenv("PRODUCT_QA_RERANK_MARGIN")
+    if threshold:
+        model.margin_threshold = float(threshold)
+    return model
+
+
+# -----------------------------
+# Decision log (training data)
+# -----------------------------
+def log_rerank_decision(
+    user_text: str,
+    keywords: List[str],
+    candidates: List[Dict],
+    reranked: Dict,
+    preferred_ids: Optional[set] = None,
+) -> None:
+    """Append an LLM rerank decision to PRODUCT_QA_RERANK_LOG (JSONL) if set."""
+    path = os.getenv("PRODUCT_QA_RERANK_LOG")
+    if not path or not isinstance(reranked, dict) or not reranked.get("selections"):
+        return
+    record = {
+        "ts": int(time.time()),
+        "user_text": user_text,
+        "keywords": keywords,
+        "candidates": [
+            {
+                "display_id": c.get("display_id"),
+                "clean_name": c.get("clean_name"),
+                "score": c.get("score"),
+                "fuzzy_score": c.get("fuzzy_score"),
+                "embed_score": c.get("embed_score"),
+                "source": c.get("source"),
+                "priority": c.get("priority"),
+            }
+            for c in candidates
+        ],
+        "preferred_ids": sorted(preferred_ids or []),
+        "selections": reranked.get("selections"),
+    }
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception:
+        pass
+
+
+def _load_groups(log_path: str) -> List[Dict[str, Any]]:
+    """One group per (logged query, keyword): candidate features + LLM-selected labels."""
+    groups: List[Dict[str, Any]] = []
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except Exception:
+                continue
+            cands = [c for c in rec.get("candidates") or [] if c.get("display_id")]
+            if len(cands) < 2:
+                continue
+            preferred = set(rec.get("preferred_ids") or [])
+            for sel in rec.get("selections") or []:
+                chosen = set(str(d) for d in (sel.get("display_ids") or []))
+                kw = sel.get("keyword") or rec.get("user_text") or ""
+                if not chosen:
+                    continue
+                labels = np.asarray([1.0 if str(c["display_id"]) in chosen else 0.0 for c in cands], dtype=np.float32)
+                if labels.sum() == 0:
+                    continue
+                groups.append({
+                    "features": extract_features(kw, cands, preferred),
+                    "labels": labels,
+                })
+    return groups
+
+
+def train_logistic(
+    features: np.ndarray,
+    labels: np.ndarray,
+    epochs: int = 500,
+    lr: float = 0.5,
+    l2: float = 1e-3,
+) -> LocalReranker:
+    mean = features.mean(axis=0)
+    std = features.std(axis=0)
+    std[std < 1e-6] = 1.0
+    x = (features - mean) / std
+    w = np.zeros(x.shape[1], dtype=np.float64)
+    b = 0.0
+    # Cân bằng lớp: mỗi nhóm chỉ có 1-2 nhãn dương
+    pos = max(1.0, float(labels.sum()))
+    neg = max(1.0, float(len(labels) - labels.sum()))
+    sample_w = np.where(labels > 0, len(labels) / (2 * pos), len(labels) / (2 * neg))
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-(x @ w + b)))
+        err = (p - labels) * sample_w
+        w -= lr * ((x.T @ err) / len(labels) + l2 * w)
+        b -= lr * float(err.mean())
+    return LocalReranker(w, b, mean, std)
+
+
+def evaluate(model: LocalReranker, groups: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """LLM-skip rate and agreement with the LLM on skipped groups."""
+    skipped = 0
+    agree = 0
+    agree_all = 0
+    for g in groups:
+        probs = model.predict_proba(g["features"])
+        order = np.argsort(-probs, kind="stable")
+        top = float(probs[order[0]])
+        second = float(probs[order[1]]) if len(order) > 1 else 0.0
+        hit = bool(g["labels"][order[0]] > 0)
+        agree_all += int(hit)
+        if top >= model.min_top_prob and top - second >= model.margin_threshold:
+            skipped += 1
+            agree += int(hit)
+    n = len(groups)
+    return {
+        "groups": n,
+        "llm_skip_rate": round(skipped / n, 4) if n else 0.0,
+        "agreement_when_skipped": round(agree / skipped, 4) if skipped else None,
+        "top1_agreement_overall": round(agree_all / n, 4) if n else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Train the local reranker from logged LLM rerank decisions")
+    parser.add_argument("--log", required=True, help="JSONL written via PRODUCT_QA_RERANK_LOG")
+    parser.add_argument("--out", required=True, help="Where to write the model JSON")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of groups kept for evaluation")
+    parser.add_argument("--margin", type=float, default=0.3, help="Min top1-top2 probability margin to skip the LLM")
+    parser.add_argument("--min_top_prob", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args(argv)
+
+    groups = _load_groups(args.log)
+    if len(groups) < 5:
+        raise SystemExit(f"Not enough logged decisions in {args.log} ({len(groups)} groups)")
+    random.Random(args.seed).shuffle(groups)
+    n_test = max(1, int(math.ceil(len(groups) * args.holdout)))
+    test, train = groups[:n_test], groups[n_test:]
+
+    model = train_logistic(
+        np.vstack([g["features"] for g in train]),
+        np.concatenate([g["labels"] for g in train]),
+    )
+    model.margin_threshold = args.margin
+    model.min_top_prob = args.min_top_prob
+    model.save(args.out)
+
+    report = {"train_groups": len(train), "heldout": evaluate(model, test), "sweep": []}
+    for margin in (0.1, 0.2, 0.3, 0.4, 0.5):
+        probe = LocalReranker(model.weights, model.bias, model.mean, model.std, margin, model.min_top_prob)
+        report["sweep"].append({"margin": margin, **evaluate(probe, test)})
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Saved model: {Path(args.out).resolve()}")
+
+
+if __name__ == "__main__":
+    main()
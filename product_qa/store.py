@@ -0,0 +1,92 @@
+"""Compact columnar product catalog.
+
+Retrievers build result dicts straight from parallel arrays instead of
+`df.iloc[i]` (one pandas Series per hit), and a worker only keeps the string
+table and a priority array instead of a full DataFrame.
+"""
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+
+class ProductStore:
+    """Parallel arrays: ids / names / lowercase names (interned) + int32 priority."""
+
+    __slots__ = ("ids", "names", "lower", "priority", "category", "canonical", "_row")
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        names: Sequence[str],
+        priority: Sequence[int],
+        lower: Optional[Sequence[str]] = None,
+        category: Optional[Sequence[str]] = None,
+    ) -> None:
+        intern = sys.intern
+        self.ids: List[str] = [intern(str(d)) for d in ids]
+        self.names: List[str] = [intern(str(n)) for n in names]
+        # list (không phải ndarray) vì rapidfuzz.process.extract nhận trực tiếp làm choices
+        self.lower: List[str] = [intern(str(n)) for n in lower] if lower is not None else [intern(n.lower()) for n in self.names]
+        self.priority = np.asarray(priority, dtype=np.int32)
+        # Danh mục từ nguồn (API/CSV có cột category); None khi nguồn không có
+        self.category: Optional[List[str]] = (
+            [intern(str(c)) if c is not None and c == c and str(c).strip() else "" for c in category]
+            if category is not None else None
+        )
+        self._row: Dict[str, int] = {}
+        for i, did in enumerate(self.ids):
+            # display_id trùng: giữ dòng đầu tiên (priority nhỏ nhất theo thứ tự nguồn)
+            self._row.setdefault(did, i)
+        # Dòng đại diện của mỗi dòng (dòng đầu tiên cùng display_id): fusion gộp hit theo mảng này
+        self.canonical = np.fromiter((self._row[did] for did in self.ids), dtype=np.int64, count=len(self.ids))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "ProductStore":
+        lower = df["clean_lower"].tolist() if "clean_lower" in df.columns else None
+        category = df["category"].tolist() if "category" in df.columns else None
+        return cls(
+            df["display_id"].astype(str).tolist(),
+            df["clean_name"].astype(str).tolist(),
+            df["priority"].to_numpy(),
+            lower=lower,
+            category=category,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row_of(self, display_id: str) -> Optional[int]:
+        return self._row.get(display_id)
+
+    def priority_of(self, display_id: str, default: int = 1_000_000) -> int:
+        i = self._row.get(display_id)
+        return int(self.priority[i]) if i is not None else default
+
+    def record(self, i: int, score: float, source: str) -> Dict:
+        return {
+            "display_id": self.ids[i],
+            "clean_name": self.names[i],
+            "score": float(score),
+            "priority": int(self.priority[i]),
+            "source": source,
+        }
+
+    def records(self, rows: Iterable[int], scores: Iterable[float], source: str) -> List[Dict]:
+        return [self.record(int(i), s, source) for i, s in zip(rows, scores)]
+
+    def to_frame(self) -> pd.DataFrame:
+        df = pd.DataFrame({
+            "display_id": self.ids,
+            "clean_name": self.names,
+            "clean_lower": self.lower,
+            "priority": self.priority,
+        })
+        if self.category is not None:
+            df["category"] = self.category
+        return df
+
+
+def as_store(catalog: Union[pd.DataFrame, ProductStore]) -> ProductStore:
+    return catalog if isinstance(catalog, ProductStore) else ProductStore.from_frame(catalog)
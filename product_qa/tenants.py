@@ -0,0 +1,208 @@
+"""Per-shop catalogs loaded on demand and kept resident under a memory budget.
+
+Each shop has its own catalog source (API URL or CSV) and therefore its own
+`EmbeddingIndex` cache key, so an evicted shop reloads from `.cache` without
+re-embedding. Least recently used shops are evicted first.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import REGISTRY
+from .pipeline import product_qa_pipeline
+
+
+_MB = 1024 * 1024
+
+
+TENANT_EVENTS = REGISTRY.counter(
+    "product_qa_tenant_events_total",
+    "Tenant registry events (hit, load, evict, unknown).",
+    ["event"],
+)
+TENANT_RESIDENT = REGISTRY.gauge(
+    "product_qa_tenant_resident",
+    "Resident tenants and their estimated bytes (field = tenants|bytes).",
+    ["field"],
+)
+
+
+@dataclass(frozen=True)
+class TenantConfig:
+    shop_id: str
+    api_url: Optional[str] = None
+    csv_path: Optional[str] = None
+    build_embedding: bool = False
+
+
+class _TenantState:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.ask: Optional[Callable[..., Dict]] = None
+        self.size_bytes = 0
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self.last_load_ms: Optional[float] = None
+        self.last_used = 0.0
+
+
+def estimate_snapshot_bytes(ask: Callable[..., Dict]) -> int:
+    """Rough resident size of a tenant: string table + priority array + embedding/BM25 indexes."""
+    snap = ask.catalog.current
+    store = snap.store
+    size = int(store.priority.nbytes)
+    for column in (store.ids, store.names, store.lower):
+        size += sys.getsizeof(column) + sum(sys.getsizeof(s) for s in column)
+    if snap.idx is not None:
+        size += snap.idx.resident_nbytes
+    if snap.lexical is not None:
+        size += snap.lexical.nbytes
+    return size
+
+
+class TenantRegistry:
+    def __init__(
+        self,
+        tenants: Dict[str, TenantConfig],
+        memory_budget_mb: float = 1024.0,
+        factory: Optional[Callable[[TenantConfig], Callable[..., Dict]]] = None,
+    ) -> None:
+        self.tenants = dict(tenants)
+        self.memory_budget_bytes = int(memory_budget_mb * _MB)
+        self._factory = factory or self._build
+        self._states: Dict[str, _TenantState] = {shop: _TenantState() for shop in self.tenants}
+        # Thứ tự LRU của các tenant đang nằm trong RAM (cuối = mới dùng nhất)
+        self._resident: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        TENANT_RESIDENT.set_function(lambda: len(self._resident), field="tenants")
+        TENANT_RESIDENT.set_function(self.resident_bytes, field="bytes")
+
+    @classmethod
+    def from_env(cls) -> Optional["TenantRegistry"]:
+        """PRODUCT_QA_TENANTS: JSON file {shop_id: {"api_url"|"csv_path", "embed"}}."""
+        path = os.getenv("PRODUCT_QA_TENANTS")
+        if not path:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        tenants = {
+            str(shop): TenantConfig(
+                shop_id=str(shop),
+                api_url=cfg.get("api_url"),
+                csv_path=cfg.get("csv_path"),
+                build_embedding=bool(cfg.get("embed", False)),
+            )
+            for shop, cfg in raw.items()
+        }
+        try:
+            budget = float(os.getenv("PRODUCT_QA_TENANT_MEMORY_MB", "1024"))
+        except ValueError:
+            budget = 1024.0
+        return cls(tenants, memory_budget_mb=budget)
+
+    @staticmethod
+    def _build(cfg: TenantConfig) -> Callable[..., Dict]:
+        return product_qa_pipeline(
+            csv_path=cfg.csv_path,
+            api_url=cfg.api_url,
+            build_embedding=cfg.build_embedding,
+        )
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(self._states[s].size_bytes for s in self._resident)
+
+    def get(self, shop_id: str) -> Callable[..., Dict]:
+        """Return the tenant's `ask`, loading it (and evicting cold tenants) if needed."""
+        state = self._states.get(shop_id)
+        if state is None:
+            TENANT_EVENTS.inc(event="unknown")
+            raise KeyError(f"Unknown shop_id: {shop_id}")
+        ask = state.ask
+        if ask is None:
+            # Khóa theo tenant: nhiều request cùng lúc cho shop nguội chỉ load một lần
+            with state.lock:
+                ask = state.ask
+                if ask is None:
+                    ask = self._load(shop_id, state)
+                else:
+                    state.hits += 1
+                    TENANT_EVENTS.inc(event="hit")
+        else:
+            state.hits += 1
+            TENANT_EVENTS.inc(event="hit")
+        state.last_used = time.time()
+        with self._lock:
+            if shop_id in self._resident:
+                self._resident.move_to_end(shop_id)
+        return ask
+
+    def _load(self, shop_id: str, state: _TenantState) -> Callable[..., Dict]:
+        started = time.perf_counter()
+        ask = self._factory(self.tenants[shop_id])
+        state.last_load_ms = round((time.perf_counter() - started) * 1000.0, 1)
+        state.size_bytes = estimate_snapshot_bytes(ask)
+        state.loads += 1
+        state.ask = ask
+        TENANT_EVENTS.inc(event="load")
+        with self._lock:
+            self._resident[shop_id] = None
+            self._resident.move_to_end(shop_id)
+            self._evict_over_budget(keep=shop_id)
+        return ask
+
+    def _evict_over_budget(self, keep: str) -> None:
+        # Gọi khi đang giữ self._lock; tenant vừa load không bao giờ bị đẩy ra
+        total = sum(self._states[s].size_bytes for s in self._resident)
+        for shop_id in list(self._resident):
+            if total <= self.memory_budget_bytes:
+                break
+            if shop_id == keep:
+                continue
+            self.evict(shop_id, _locked=True)
+            total -= self._states[shop_id].size_bytes
+
+    def evict(self, shop_id: str, _locked: bool = False) -> bool:
+        if not _locked:
+            with self._lock:
+                return self.evict(shop_id, _locked=True)
+        if shop_id not in self._resident:
+            return False
+        del self._resident[shop_id]
+        state = self._states[shop_id]
+        ask, state.ask = state.ask, None
+        if ask is not None:
+            # Request đang chạy vẫn giữ tham chiếu tới ask cũ cho tới khi trả lời
+            ask.refresher.stop()
+        state.evictions += 1
+        TENANT_EVENTS.inc(event="evict")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            resident = list(self._resident)
+        tenants = {}
+        for shop_id, state in self._states.items():
+            ask = state.ask
+            tenants[shop_id] = {
+                "resident": shop_id in resident,
+                "size_mb": round(state.size_bytes / _MB, 2),
+                "last_load_ms": state.last_load_ms,
+                "loads": state.loads,
+                "hits": state.hits,
+                "evictions": state.evictions,
+                "catalog_version": ask.catalog.current.version if ask is not None else None,
+            }
+        return {
+            "memory_budget_mb": round(self.memory_budget_bytes / _MB, 2),
+            "resident_mb": round(sum(self._states[s].size_bytes for s in resident) / _MB, 2),
+            # Cuối danh sách = mới dùng nhất
+            "lru_order": resident,
+            "tenants": tenants,
+        }
@@ -0,0 +1,80 @@
+"""Vietnamese text folding shared by the address normalizer, fuzzy search and intent rules.
+
+Folding (diacritics removed, đ→d) is a single `str.translate` over a table
+built once at import, instead of NFD decomposition plus a per-character
+category check. Hot strings (admin unit names, repeated queries) are
+memoized; `fold_many` folds whole columns without touching the caches.
+"""
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+
+def _build_fold_table() -> Dict[int, Optional[str]]:
+    table: Dict[int, Optional[str]] = {}
+    # Latin-1 Supplement, Latin Extended-A/B, Latin Extended Additional (toàn bộ chữ tiếng Việt dựng sẵn)
+    for start, end in ((0x00C0, 0x024F), (0x1E00, 0x1EFF)):
+        for cp in range(start, end + 1):
+            ch = chr(cp)
+            base = "".join(c for c in unicodedata.normalize("NFD", ch) if unicodedata.category(c) != "Mn")
+            if base and base != ch:
+                table[cp] = base
+    # Dấu tổ hợp rời (văn bản đã ở dạng NFD, một số bàn phím/điện thoại gõ ra)
+    for cp in range(0x0300, 0x0370):
+        table[cp] = None
+    table[ord("đ")] = "d"
+    table[ord("Đ")] = "D"
+    return table
+
+
+FOLD_TABLE = _build_fold_table()
+# Dấu câu thay bằng khoảng trắng (giống address_normalizer.basic_normalize)
+PUNCT_TABLE = str.maketrans({c: " " for c in ".,;:!?()[]\"'"})
+
+
+def fold(text: str) -> str:
+    """Remove Vietnamese diacritics (đ→d); case is kept."""
+    if not isinstance(text, str):
+        return ""
+    return text.translate(FOLD_TABLE)
+
+
+def squash_lower(text: str) -> str:
+    """Lowercase, trim and collapse whitespace runs to a single space."""
+    return " ".join(str(text or "").lower().split())
+
+
+@lru_cache(maxsize=65536)
+def fold_cached(text: str) -> str:
+    return text.translate(FOLD_TABLE)
+
+
+@lru_cache(maxsize=65536)
+def match_key(text: str) -> str:
+    """Folded, lowercased, punctuation-free, single-spaced form used for matching."""
+    return " ".join(text.translate(FOLD_TABLE).lower().translate(PUNCT_TABLE).split())
+
+
+@lru_cache(maxsize=16384)
+def nfc_lower(text: str) -> str:
+    """NFC + lowercase + trimmed: precomposed-diacritic regexes also match NFD input."""
+    return unicodedata.normalize("NFC", text).lower().strip()
+
+
+def fold_many(values: Iterable, lower: bool = True) -> List[str]:
+    """Fold a whole column (no memoization, so one-off bulk data does not evict hot entries)."""
+    table = FOLD_TABLE
+    out: List[str] = []
+    for v in values:
+        s = v if isinstance(v, str) else ("" if v is None else str(v))
+        s = s.translate(table)
+        out.append(s.lower() if lower else s)
+    return out
+
+
+def cache_info() -> Dict[str, object]:
+    return {
+        "fold_cached": fold_cached.cache_info()._asdict(),
+        "match_key": match_key.cache_info()._asdict(),
+        "nfc_lower": nfc_lower.cache_info()._asdict(),
+    }
@@ -1,21 +1,100 @@
 import argparse
 import json
+import threading
 from typing import Any, List
 from product_qa.address_normalizer import (
     process_file,
     summarize_results,
     build_admin_client_from_env,
-    normalize_record,
-    _is_progress_enabled,
-    _truncate_raw,
+    normalize_records,
+    summarize_poscake_calls,
 )
+from product_qa.address_jobs import AddressJobQueue, run_worker, summarize_job, watch_progress
+
+
+def _load_raws(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        data: Any = json.load(f)
+    out: List[str] = []
+    for it in data if isinstance(data, list) else []:
+        raw = it if isinstance(it, str) else (it.get("raw") if isinstance(it, dict) else None)
+        if raw:
+            out.append(raw)
+    return out
+
+
+def run_job(args) -> None:
+    """--job mode: enqueue --input, run --workers threads, report progress, write --output when done.
+
+    With REDIS_URL every process given the same --job shares the queue, e.g.
+    one `--job J --input in.json --workers 0 --output out.json` plus any
+    number of `--job J --workers 4` on other machines.
+    """
+    queue = AddressJobQueue(args.job)
+    if args.workers <= 0 and queue.client is None:
+        # In-memory queue: no other process can work on it, progress would never finish
+        raise SystemExit("--workers 0 needs REDIS_URL (another process must run the workers)")
+    if args.input:
+        added, new = queue.enqueue(_load_raws(args.input))
+        print(f"[job {args.job}] enqueued {added} records ({new} new)")
+    api_client = build_admin_client_from_env()
+    stop = threading.Event()
+    # Set once every local worker has returned (or died, e.g. on a Redis error)
+    workers_done = threading.Event()
+    alive = [args.workers]
+    alive_lock = threading.Lock()
+
+    def work() -> None:
+        try:
+            run_worker(queue, api_client, args.batch_size, wait=True, stop=stop)
+        finally:
+            with alive_lock:
+                alive[0] -= 1
+                if alive[0] <= 0:
+                    workers_done.set()
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(args.workers)]
+    for t in threads:
+        t.start()
+    try:
+        state = watch_progress(queue, interval_s=args.progress_interval, stop=workers_done if threads else None)
+        for t in threads:
+            t.join()
+    finally:
+        stop.set()
+    if not state["finished"]:
+        print(f"[job {args.job}] all workers stopped before the job finished")
+    if args.output:
+        results = queue.results()
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Processed {len(results)} items")
+        poscake = summarize_poscake_calls(results)
+        if poscake:
+            print(f"PosCake calls: {json.dumps(poscake, ensure_ascii=False)}")
+    summary = summarize_job(queue)
+    print(f"Summary: {summary['correct']}/{summary['total']} = {summary['ratio_percent']}% correct, {summary['failed']} failed")
 
 
 def main():
     parser = argparse.ArgumentParser(description="Normalize VN addresses from JSON file")
-    parser.add_argument("--input", required=True, help="Path to input JSON list with 'raw' fields")
+    parser.add_argument("--input", required=False, help="Path to input JSON list with 'raw' fields")
     parser.add_argument("--output", required=False, help="Path to output JSON")
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=None,
+        help="Raw addresses per LLM extraction call (default ADDR_LLM_BATCH_SIZE or 10; 1 = one call per record)",
+    )
+    parser.add_argument("--job", required=False, help="Job id: run through the shared address job queue (REDIS_URL)")
+    parser.add_argument("--workers", type=int, default=1, help="Job mode: worker threads in this process (0 = enqueue/report only, needs REDIS_URL)")
+    parser.add_argument("--progress_interval", type=float, default=2.0, help="Job mode: seconds between progress lines")
     args = parser.parse_args()
+    if args.job:
+        run_job(args)
+        return
+    if not args.input:
+        parser.error("--input is required without --job")
 
     # Load input; support both list of strings and list of objects with 'raw'
     results: List[dict]
@@ -28,32 +107,17 @@ def main():
     if isinstance(data, list) and (len(data) == 0 or isinstance(data[0], str)):
         # Directly process list of raw strings
         api_client = build_admin_client_from_env()
-        results = []
-        total = len(data)
-        correct_so_far = 0
-        for idx, s in enumerate(data, start=1):
-            if not isinstance(s, str):
-                continue
-            item = normalize_record(s, api_client)
-            results.append(item)
-            # live progress
-            if _is_progress_enabled():
-                from product_qa.address_normalizer import evaluate_result_item
-                try:
-                    if evaluate_result_item(item):
-                        correct_so_far += 1
-                except Exception:
-                    pass
-                ratio = (correct_so_far / idx * 100.0) if idx else 0.0
-                print(f"[{idx}/{total}] {round(ratio,2)}% ok | raw: {_truncate_raw(s)}", flush=True)
+        results = normalize_records([s for s in data if isinstance(s, str)], api_client, batch_size=args.batch_size)
         if args.output:
             with open(args.output, "w", encoding="utf-8") as f:
                 json.dump(results, f, ensure_ascii=False, indent=2)
     else:
-        results = process_file(args.input, args.output)
+        results = process_file(args.input, args.output, batch_size=args.batch_size)
     print(f"Processed {len(results)} items")
     summary = summarize_results(results)
     print(f"Summary: {summary['correct']}/{summary['total']} = {summary['ratio_percent']}% correct")
+    if summary.get("poscake_calls"):
+        print(f"PosCake calls: {json.dumps(summary['poscake_calls'], ensure_ascii=False)}")
 
 
 if __name__ == "__main__":
@@ -2,6 +2,7 @@ import argparse
 import json
 
 from product_qa.pipeline import product_qa_pipeline
+from product_qa.preferences import preferred_ids_from_orders
 
 
 def main():
@@ -25,6 +26,10 @@ def main():
         "--priority_json",
         help="Path to a JSON file containing preferred display_ids (see API example)",
     )
+    parser.add_argument(
+        "--customer_id",
+        help="Conversation/customer id: load preferred display_ids from PosCake (needs POSCAKE_BASE)",
+    )
     args = parser.parse_args()
 
     preferred_ids = None
@@ -33,20 +38,13 @@ def main():
             with open(args.priority_json, "r", encoding="utf-8") as f:
                 data = json.load(f)
             # Kỳ vọng cấu trúc như ví dụ API: orders[*].items[*].display_id
-            s = set()
-            for od in data.get("orders", []):
-                for it in od.get("items", []):
-                    did = it.get("display_id") or it.get("product_display_id")
-                    if did:
-                        s.add(str(did))
-            preferred_ids = s if s else None
+            preferred_ids = set(preferred_ids_from_orders(data)) or None
         except Exception as e:
             print(f"Không đọc được priority_json: {e}")
 
     pipeline = product_qa_pipeline(
         csv_path=None if args.api_url else args.csv,
         build_embedding=args.embed,
-        preferred_ids=preferred_ids,
         api_url=args.api_url,
     )
     query = args.q
@@ -60,7 +58,7 @@ def main():
         print("Không có câu hỏi. Ví dụ chạy: python run_demo.py --q 'cho tôi nồi ủ'\n")
         return
 
-    result = pipeline(query)
+    result = pipeline(query, preferred_ids=preferred_ids, customer_id=args.customer_id)
     print(json.dumps(result, ensure_ascii=False, indent=2))
 
 
@@ -0,0 +1,5 @@
+import uvicorn
+
+if __name__ == "__main__":
+    # Nhiều worker dùng chung index (copy-on-write): xem README, mục "HTTP service"
+    uvicorn.run("product_qa.api:app", host="0.0.0.0", port=8001)
@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .config import get_admission_limits
+
+
+class Overloaded(Exception):
+    """Raised when LLM work is shed and the caller should retry later."""
+
+    def __init__(self, retry_after_seconds: int) -> None:
+        super().__init__(f"LLM capacity exhausted, retry after {retry_after_seconds}s")
+        self.retry_after_seconds = retry_after_seconds
+
+
+class AdmissionController:
+    """Bounded in-flight limit for LLM-dependent work with a small wait queue.
+
+    Requests beyond `max_in_flight` wait (at most `max_queue` of them, each for
+    at most `queue_timeout_ms`); everything else is shed immediately.
+    """
+
+    def __init__(self, max_in_flight: int = 8, max_queue: int = 16, queue_timeout_ms: int = 1000, retry_after_seconds: int = 2) -> None:
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout_ms = max(0, int(queue_timeout_ms))
+        self.retry_after_seconds = max(1, int(retry_after_seconds))
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted_total = 0
+        self.shed_total = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(**get_admission_limits())
+
+    def acquire(self, max_wait: Optional[float] = None) -> bool:
+        """Take a slot, waiting in the queue if needed. Returns False when shed."""
+        timeout = self.queue_timeout_ms / 1000.0
+        if max_wait is not None:
+            timeout = min(timeout, max(0.0, max_wait))
+        with self._cond:
+            if self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                self.admitted_total += 1
+                return True
+            if self.queued >= self.max_queue or timeout <= 0:
+                self.shed_total += 1
+                return False
+            self.queued += 1
+            try:
+                expires_at = time.monotonic() + timeout
+                while self.in_flight >= self.max_in_flight:
+                    remaining = expires_at - time.monotonic()
+                    if remaining <= 0:
+                        self.shed_total += 1
+                        return False
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+                self.admitted_total += 1
+                return True
+            finally:
+                self.queued -= 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queued,
+                "admitted_total": self.admitted_total,
+                "shed_total": self.shed_total,
+            }
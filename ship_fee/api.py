@@ -1,16 +1,19 @@
 from typing import Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from pydantic import BaseModel
 import os
-import requests
 
 from .service import ShipFeeService
 from .config import get_orders_json_path, get_default_conversation_id
 from .counter import CounterStore
+from .intent import LATENCY
+from .admission import Overloaded
+from product_qa.cassette import http_get
+from product_qa.metrics import CONTENT_TYPE, REGISTRY, render_latest
 
 
 class AskRequest(BaseModel):
@@ -18,6 +21,8 @@ class AskRequest(BaseModel):
     conversation_id: Optional[str] = None
     orders_json_path: Optional[str] = None
     orders_json: Optional[dict] = None
+    # Override SHIPFEE_DEBOUNCE_MS for this request (0 disables debouncing)
+    debounce_ms: Optional[int] = None
 
 
 class ResetRequest(BaseModel):
@@ -37,17 +42,36 @@ def create_app() -> FastAPI:
 
     service = ShipFeeService(CounterStore())
 
+    admission_gauge = REGISTRY.gauge(
+        "shipfee_llm_admission",
+        "LLM admission control state (in_flight, queue_depth, shed_total).",
+        ["field"],
+    )
+    for field in ("in_flight", "queue_depth", "shed_total"):
+        admission_gauge.set_function(lambda f=field: service.admission.stats()[f], field=field)
+
+    @app.exception_handler(Overloaded)
+    def overloaded(request: Request, exc: Overloaded):
+        # Fast-fail under load (SHIPFEE_SHED_MODE=reject) instead of queueing more LLM work
+        return JSONResponse(
+            status_code=503,
+            content={"success": False, "error": str(exc)},
+            headers={"Retry-After": str(exc.retry_after_seconds)},
+        )
+
     @app.get("/healthz")
     def healthz():
         return {"ok": True}
 
     @app.post("/api/v1/ship-fee/answer")
-    def answer(req: AskRequest):
-        resp = service.answer(
+    async def answer(req: AskRequest):
+        # async so the debounce window does not hold a threadpool thread; blocking work runs in threads
+        resp = await service.answer_debounced_async(
             user_text=req.user_text,
             conversation_id=req.conversation_id or get_default_conversation_id(),
             orders_json_path=req.orders_json_path or get_orders_json_path(),
             orders_data=req.orders_json,
+            window_ms=req.debounce_ms,
         )
         return {
             "case": resp.case,
@@ -57,6 +81,17 @@ def create_app() -> FastAPI:
             "diagnostic": resp.diagnostic,
         }
 
+    @app.get("/api/v1/ship-fee/stats")
+    def stats():
+        # p50/p99 of intent classification per path (rules, llm, degraded, shed) and raw LLM calls,
+        # plus queue depth and shed counts of LLM admission control
+        return {"intent_latency": LATENCY.snapshot(), "admission": service.admission.stats()}
+
+    @app.get("/metrics")
+    def metrics():
+        # Prometheus text format; covers ship_fee and product_qa stages in this process
+        return PlainTextResponse(render_latest(), media_type=CONTENT_TYPE)
+
     @app.post("/api/v1/ship-fee/reset")
     def reset_counter(req: ResetRequest):
         conv_id = req.conversation_id or get_default_conversation_id()
@@ -79,7 +114,7 @@ def create_app() -> FastAPI:
         base = get_poscake_base()
         url = f"{base}/api/v1/poscake/orders/near-by-conversation"
         try:
-            r = requests.get(url, params={"conversation_id": conversation_id}, timeout=15)
+            r = http_get(url, params={"conversation_id": conversation_id}, timeout=15)
             r.raise_for_status()
             return r.json()
         except Exception as e:
@@ -54,3 +54,51 @@ def get_intent_strategy(default: str = "llm") -> str:
     return val if val in {"llm", "hybrid"} else default
 
 
+def get_debounce_window_ms(default: int = 0) -> int:
+    """Return the debounce window for bursty messages in ms (0 disables it)."""
+    load_env()
+    try:
+        return max(0, int(os.getenv("SHIPFEE_DEBOUNCE_MS", str(default))))
+    except ValueError:
+        return default
+
+
+def get_latency_budget_ms(default: int = 4000) -> int:
+    """Return the per-request latency budget for ship-fee answers in ms."""
+    load_env()
+    try:
+        return max(0, int(os.getenv("SHIPFEE_LATENCY_BUDGET_MS", str(default))))
+    except ValueError:
+        return default
+
+
+def get_llm_hedge_enabled(default: bool = False) -> bool:
+    """Return whether to fire a hedged second LLM request at p95 latency."""
+    load_env()
+    val = os.getenv("SHIPFEE_LLM_HEDGE", "1" if default else "0").lower().strip()
+    return val in {"1", "true", "yes", "on"}
+
+
+def get_admission_limits() -> dict:
+    """Return limits for LLM admission control (see ship_fee/admission.py)."""
+    load_env()
+
+    def _int(name: str, default: int) -> int:
+        try:
+            return int(os.getenv(name, str(default)))
+        except ValueError:
+            return default
+
+    return {
+        "max_in_flight": _int("SHIPFEE_LLM_MAX_IN_FLIGHT", 8),
+        "max_queue": _int("SHIPFEE_LLM_MAX_QUEUE", 16),
+        "queue_timeout_ms": _int("SHIPFEE_LLM_QUEUE_TIMEOUT_MS", 1000),
+        "retry_after_seconds": _int("SHIPFEE_RETRY_AFTER_S", 2),
+    }
+
+
+def get_shed_mode(default: str = "rules") -> str:
+    """Return what to do when LLM work is shed: 'rules' (regex only) or 'reject' (503)."""
+    load_env()
+    val = os.getenv("SHIPFEE_SHED_MODE", default).lower().strip()
+    return val if val in {"rules", "reject"} else default
@@ -6,6 +6,7 @@ except Exception:  # pragma: no cover
     redis = None  # type: ignore
 
 from .config import get_redis_url
+from product_qa.metrics import REDIS_ERRORS, stage
 
 
 class CounterStore:
@@ -22,53 +23,64 @@ class CounterStore:
         if self.client is None:
             # fallback in-memory counter per process (dev only)
             return _InMemoryCounter.increase_and_get(key, ttl_seconds)
-        pipe = self.client.pipeline()
-        pipe.incr(key)
-        pipe.expire(key, ttl_seconds)
-        count, _ = pipe.execute()
+        with stage("ship_fee", "counter_io"):
+            try:
+                pipe = self.client.pipeline()
+                pipe.incr(key)
+                pipe.expire(key, ttl_seconds)
+                count, _ = pipe.execute()
+            except Exception:
+                REDIS_ERRORS.inc(component="counter", op="incr")
+                raise
         return int(count)
 
     def get_current(self, key: str) -> int:
         if self.client is None:
             return _InMemoryCounter.get_current(key)
-        try:
-            val = self.client.get(key)
-            return int(val) if val is not None else 0
-        except Exception:
-            return 0
+        with stage("ship_fee", "counter_io"):
+            try:
+                val = self.client.get(key)
+                return int(val) if val is not None else 0
+            except Exception:
+                REDIS_ERRORS.inc(component="counter", op="get")
+                return 0
 
     def reset(self, key: str) -> None:
         if self.client is None:
             _InMemoryCounter.reset(key)
             return
-        try:
-            # Delete key and ensure value is removed entirely
-            self.client.delete(key)
-        except Exception:
-            pass
+        with stage("ship_fee", "counter_io"):
+            try:
+                # Delete key and ensure value is removed entirely
+                self.client.delete(key)
+            except Exception:
+                REDIS_ERRORS.inc(component="counter", op="delete")
 
     # Boolean flag helpers (e.g., tagged agent)
     def set_flag(self, key: str, value: bool, ttl_seconds: int = 900) -> None:
         if self.client is None:
             _InMemoryCounter.set_flag(key, value)
             return
-        try:
-            if value:
-                # set with ttl
-                self.client.setex(key, ttl_seconds, "1")
-            else:
-                self.client.delete(key)
-        except Exception:
-            pass
+        with stage("ship_fee", "counter_io"):
+            try:
+                if value:
+                    # set with ttl
+                    self.client.setex(key, ttl_seconds, "1")
+                else:
+                    self.client.delete(key)
+            except Exception:
+                REDIS_ERRORS.inc(component="counter", op="set_flag")
 
     def get_flag(self, key: str) -> bool:
         if self.client is None:
             return _InMemoryCounter.get_flag(key)
-        try:
-            val = self.client.get(key)
-            return bool(val == "1")
-        except Exception:
-            return False
+        with stage("ship_fee", "counter_io"):
+            try:
+                val = self.client.get(key)
+                return bool(val == "1")
+            except Exception:
+                REDIS_ERRORS.inc(component="counter", op="get_flag")
+                return False
 
 
 class _InMemoryCounter:
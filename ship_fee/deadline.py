@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call does not finish within the request latency budget."""
+
+
+class Deadline:
+    """Absolute point in time by which a request must be answered."""
+
+    def __init__(self, budget_ms: int) -> None:
+        self.budget_ms = int(budget_ms)
+        self.expires_at = time.monotonic() + max(0, self.budget_ms) / 1000.0
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+
+class LatencyRecorder:
+    """Rolling window of latencies per path, reporting p50/p95/p99."""
+
+    def __init__(self, window: int = 1000) -> None:
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, path: str, seconds: float) -> None:
+        with self._lock:
+            buf = self._samples.get(path)
+            if buf is None:
+                buf = deque(maxlen=self.window)
+                self._samples[path] = buf
+            buf.append(float(seconds))
+
+    def percentile(self, path: str, q: float) -> Optional[float]:
+        with self._lock:
+            data = sorted(self._samples.get(path) or [])
+        if not data:
+            return None
+        pos = min(len(data) - 1, max(0, int(round(q / 100.0 * (len(data) - 1)))))
+        return data[pos]
+
+    def count(self, path: str) -> int:
+        with self._lock:
+            return len(self._samples.get(path) or [])
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            paths = list(self._samples.keys())
+        out: Dict[str, Dict[str, Any]] = {}
+        for p in paths:
+            p50 = self.percentile(p, 50)
+            p99 = self.percentile(p, 99)
+            out[p] = {
+                "count": self.count(p),
+                "p50_ms": round(p50 * 1000.0, 1) if p50 is not None else None,
+                "p99_ms": round(p99 * 1000.0, 1) if p99 is not None else None,
+            }
+        return out
+
+
+# Shared pool for deadline-bounded calls. Timed-out calls keep running in the
+# background (the SDK cannot be cancelled) but the caller stops waiting.
+_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="shipfee-llm")
+
+
+def call_with_deadline(
+    fn: Callable[[], Any],
+    deadline: Optional[Deadline],
+    hedge_after: Optional[float] = None,
+) -> Any:
+    """Run `fn` bounded by `deadline`.
+
+    If `hedge_after` (seconds) is given and the first attempt is still pending
+    by then, a second identical attempt is fired and the first result wins.
+    """
+    if deadline is None:
+        return fn()
+    if deadline.expired():
+        raise DeadlineExceeded("latency budget already spent")
+    futures = [_EXECUTOR.submit(fn)]
+    if hedge_after is not None and hedge_after < deadline.remaining():
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            futures.append(_EXECUTOR.submit(fn))
+    while futures:
+        done, pending = wait(futures, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded(f"no result within {deadline.budget_ms} ms")
+        for fut in done:
+            if fut.exception() is None:
+                return fut.result()
+        # Every finished attempt failed; keep waiting on the hedge if any
+        futures = list(pending)
+        if not futures:
+            # Re-raise the error of the last failed attempt
+            return next(iter(done)).result()
+    raise DeadlineExceeded(f"no result within {deadline.budget_ms} ms")
@@ -0,0 +1,101 @@
+import itertools
+import threading
+from typing import List, Optional
+
+try:
+    import redis  # type: ignore
+except Exception:  # pragma: no cover
+    redis = None  # type: ignore
+
+from .config import get_redis_url
+from product_qa.metrics import REDIS_ERRORS
+
+
+class MessageBuffer:
+    """Per-conversation message buffer used to debounce bursts of messages.
+
+    Each pushed message gets a sequence number. After the quiet window only the
+    request holding the latest sequence drains the buffer and gets to answer.
+    """
+
+    def __init__(self) -> None:
+        url = get_redis_url()
+        self.client = None
+        if url and redis is not None:
+            try:
+                self.client = redis.Redis.from_url(url, decode_responses=True)
+            except Exception:
+                self.client = None
+
+    def push(self, key: str, text: str, ttl_seconds: int = 60) -> Optional[int]:
+        """Append a message and return its sequence (None if buffering failed)."""
+        if self.client is None:
+            return _InMemoryBuffer.push(key, text)
+        try:
+            pipe = self.client.pipeline()
+            pipe.rpush(f"{key}:msgs", text)
+            pipe.incr(f"{key}:seq")
+            pipe.expire(f"{key}:msgs", ttl_seconds)
+            pipe.expire(f"{key}:seq", ttl_seconds)
+            _, seq, _, _ = pipe.execute()
+            return int(seq)
+        except Exception:
+            REDIS_ERRORS.inc(component="debounce", op="push")
+            return None
+
+    def drain_if_latest(self, key: str, seq: int) -> Optional[List[str]]:
+        """Pop all buffered messages if `seq` is still the latest one.
+
+        Returns None when a newer message arrived; that request will answer.
+        An empty list means the buffer is unavailable and the caller should
+        answer its own message.
+        """
+        if self.client is None:
+            return _InMemoryBuffer.drain_if_latest(key, seq)
+        msgs_key = f"{key}:msgs"
+        seq_key = f"{key}:seq"
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.watch(seq_key)
+                current = pipe.get(seq_key)
+                if current is None or int(current) != seq:
+                    pipe.reset()
+                    return None
+                pipe.multi()
+                pipe.lrange(msgs_key, 0, -1)
+                pipe.delete(msgs_key)
+                msgs, _ = pipe.execute()
+                return [str(m) for m in msgs]
+        except Exception as e:
+            # A newer message slipped in between GET and EXEC: it will answer
+            if redis is not None and isinstance(e, redis.WatchError):
+                return None
+            # Redis unavailable: let this request answer its own message
+            REDIS_ERRORS.inc(component="debounce", op="drain")
+            return []
+
+
+class _InMemoryBuffer:
+    _messages: dict = {}
+    _seq: dict = {}
+    # Sequences are unique across keys, so a drained key can drop its entry
+    # without a waiter from an older burst matching a restarted counter
+    _counter = itertools.count(1)
+    _lock = threading.Lock()
+
+    @classmethod
+    def push(cls, key: str, text: str) -> int:
+        # no TTL eviction; drained buffers are removed, good enough for dev
+        with cls._lock:
+            cls._messages.setdefault(key, []).append(text)
+            seq = next(cls._counter)
+            cls._seq[key] = seq
+            return seq
+
+    @classmethod
+    def drain_if_latest(cls, key: str, seq: int) -> Optional[List[str]]:
+        with cls._lock:
+            if cls._seq.get(key) != seq:
+                return None
+            del cls._seq[key]
+            return cls._messages.pop(key, [])
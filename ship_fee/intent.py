@@ -2,10 +2,14 @@ import os
 import re
 import hashlib
 import time
-from typing import Dict, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
-from product_qa.pipeline import load_api_key, call_llm_json
-from .config import get_llm_model_name, get_intent_strategy
+from product_qa.llm_client import load_api_key, call_llm_json
+from product_qa.textnorm import nfc_lower
+from .config import get_llm_model_name, get_intent_strategy, get_llm_hedge_enabled, get_shed_mode
+from .deadline import Deadline, DeadlineExceeded, LatencyRecorder, call_with_deadline
+from .admission import AdmissionController, Overloaded
+from product_qa.metrics import LLM_CACHE, stage
 
 
 SHIP_KEYWORDS = [
@@ -56,19 +60,27 @@ COMPLAINT_KEYWORDS = [
 ]
 
 
+def _any_of(patterns) -> "re.Pattern[str]":
+    # One compiled alternation per keyword list instead of re.search over each pattern
+    return re.compile("|".join(f"(?:{p})" for p in patterns))
+
+
+_SHIP_RE = _any_of(SHIP_KEYWORDS)
+_CANCEL_RE = _any_of(CANCEL_KEYWORDS + [r"không\s*miễn\s*ship\s*(thì)?\s*hủy|không\s*free\s*(thì)?\s*hủy"])
+_SMALLTALK_RE = _any_of(SMALLTALK_KEYWORDS)
+_COMPLAINT_RE = _any_of(COMPLAINT_KEYWORDS)
+_WANTS_FREE_RE = re.compile(r"miễn\s*ship|miễn\s*phí\s*ship|free\s*ship|freeship|miễn\s*phí\s*vận\s*chuyển|giảm\s*ship|bớt\s*ship|miễn\s*phí\s*vch|free\s*shipping")
+_FEE_AMOUNT_RE = re.compile(r"(bao\s*nhiêu|mất\s*bao\s*nhiêu|nhiêu|bao\s*tiền|tiền\s*ship|phí\s*vận\s*chuyển)|phí\s*ship")
+
+
 def _regex_detect(text: str) -> Dict:
-    t = text.lower().strip()
-    intent = "ship_fee" if any(re.search(p, t) for p in SHIP_KEYWORDS) else "other"
-    wants_free = bool(re.search(r"miễn\s*ship|miễn\s*phí\s*ship|free\s*ship|freeship|miễn\s*phí\s*vận\s*chuyển|giảm\s*ship|bớt\s*ship|miễn\s*phí\s*vch|free\s*shipping", t))
-    cancel_threat = bool(
-        any(re.search(p, t) for p in CANCEL_KEYWORDS)
-        or re.search(r"không\s*miễn\s*ship\s*(thì)?\s*hủy|không\s*free\s*(thì)?\s*hủy", t)
-    )
-    about_fee_amount = bool(
-        re.search(r"(bao\s*nhiêu|mất\s*bao\s*nhiêu|nhiêu|bao\s*tiền|tiền\s*ship|phí\s*vận\s*chuyển)", t)
-        or re.search(r"phí\s*ship", t)
-    )
-    is_complaint = bool(any(re.search(p, t) for p in COMPLAINT_KEYWORDS))
+    # NFC first: the patterns use precomposed Vietnamese letters, NFD input (some phone keyboards) would miss
+    t = nfc_lower(text)
+    intent = "ship_fee" if _SHIP_RE.search(t) else "other"
+    wants_free = bool(_WANTS_FREE_RE.search(t))
+    cancel_threat = bool(_CANCEL_RE.search(t))
+    about_fee_amount = bool(_FEE_AMOUNT_RE.search(t))
+    is_complaint = bool(_COMPLAINT_RE.search(t))
     # Rule score
     score = 0.0
     if wants_free:
@@ -79,7 +91,7 @@ def _regex_detect(text: str) -> Dict:
         score = max(score, 0.85)
     elif intent == "ship_fee":
         score = 0.6
-    is_smalltalk = bool(any(re.search(p, t) for p in SMALLTALK_KEYWORDS)) and not wants_free and not about_fee_amount and not cancel_threat and not is_complaint and intent != "ship_fee"
+    is_smalltalk = bool(_SMALLTALK_RE.search(t)) and not wants_free and not about_fee_amount and not cancel_threat and not is_complaint and intent != "ship_fee"
     if is_smalltalk:
         # Treat smalltalk as strong rule to avoid unnecessary LLM calls
         score = max(score, 0.85)
@@ -103,14 +115,78 @@ def _regex_detect(text: str) -> Dict:
 _LLM_CACHE: Dict[str, Tuple[float, Dict]] = {}
 _LLM_TTL_SECONDS = 300
 
+# Latency per classification path ("rules", "llm", "degraded") and of raw LLM calls ("llm_call")
+LATENCY = LatencyRecorder()
+# Minimum samples before the p95 of LLM calls is trusted as the hedge delay
+_HEDGE_MIN_SAMPLES = 20
 
-def _llm_classify(user_text: str) -> Dict:
+
+def _hedge_delay() -> Optional[float]:
+    if not get_llm_hedge_enabled() or LATENCY.count("llm_call") < _HEDGE_MIN_SAMPLES:
+        return None
+    return LATENCY.percentile("llm_call", 95)
+
+
+def _timed_llm_call(prompt: str, model: str) -> Dict:
+    started = time.perf_counter()
+    out = call_llm_json(prompt, model)
+    LATENCY.record("llm_call", time.perf_counter() - started)
+    return out
+
+
+def _noop() -> None:
+    return None
+
+
+def _admit(
+    admission: Optional[AdmissionController],
+    deadline: Optional[Deadline],
+    max_wait: Optional[float] = None,
+) -> Callable[[], None]:
+    """Take an admission slot for one LLM call and return its release callback."""
+    if admission is None:
+        return _noop
+    if deadline is not None:
+        if deadline.expired():
+            raise DeadlineExceeded("latency budget already spent")
+        max_wait = deadline.remaining()
+    if not admission.acquire(max_wait=max_wait):
+        raise Overloaded(admission.retry_after_seconds)
+    if deadline is not None and deadline.expired():
+        admission.release()
+        raise DeadlineExceeded("latency budget spent while queued")
+    return admission.release
+
+
+def _take_slot(slots: List[Callable[[], None]], admission: Optional[AdmissionController]) -> Callable[[], None]:
+    # Reuse the slot the caller queued for; later (hedged) attempts must not wait for one
+    try:
+        return slots.pop()
+    except IndexError:
+        return _admit(admission, None, max_wait=0.0)
+
+
+def _release_unused(slots: List[Callable[[], None]]) -> None:
+    # The queued-for slot when no attempt picked it up (e.g. the deadline hit first)
+    try:
+        slots.pop()()
+    except IndexError:
+        pass
+
+
+def _llm_classify(
+    user_text: str,
+    deadline: Optional[Deadline] = None,
+    admission: Optional[AdmissionController] = None,
+) -> Dict:
     # Cache by text hash for a short time to limit cost
     key = hashlib.md5(user_text.encode("utf-8")).hexdigest()
     now = time.time()
     hit = _LLM_CACHE.get(key)
     if hit and now - hit[0] < _LLM_TTL_SECONDS:
+        LLM_CACHE.inc(cache="shipfee_intent", result="hit")
         return hit[1]
+    LLM_CACHE.inc(cache="shipfee_intent", result="miss")
     load_api_key()
     model = get_llm_model_name()
     prompt = (
@@ -126,15 +202,40 @@ def _llm_classify(user_text: str) -> Dict:
         "\"signals\":{\"wants_free\":bool,\"about_fee_amount\":bool,\"cancel_threat\":bool,\"is_complaint\":bool}}\n"
         f"Câu: \"{user_text}\""
     )
-    out = call_llm_json(prompt, model)
-    if not isinstance(out, dict):
-        out = {"intent": "fee_question_general", "confidence": 0.5, "signals": {}}
-    _LLM_CACHE[key] = (now, out)
-    return out
 
+    def run() -> Dict:
+        # Each attempt holds its own slot until its LLM call really finishes
+        release = _take_slot(first_slot, admission)
+        try:
+            out = _timed_llm_call(prompt, model)
+        finally:
+            release()
+        if not isinstance(out, dict):
+            out = {"intent": "fee_question_general", "confidence": 0.5, "signals": {}}
+        # Cached even when the caller gave up waiting, so a retry is instant
+        _LLM_CACHE[key] = (now, out)
+        return out
+
+    # The first attempt queues for a slot here; a hedged attempt takes its own in run()
+    first_slot = [_admit(admission, deadline)]
+    try:
+        return call_with_deadline(run, deadline, hedge_after=_hedge_delay())
+    finally:
+        _release_unused(first_slot)
+
+
+_FALLBACK_SMALLTALK_REPLY = "Dạ vâng ạ! Em cảm ơn mình ạ."
 
-def generate_smalltalk_reply(user_text: str) -> str:
-    """Use LLM to produce a short, friendly smalltalk reply in Vietnamese."""
+
+def generate_smalltalk_reply(
+    user_text: str,
+    deadline: Optional[Deadline] = None,
+    admission: Optional[AdmissionController] = None,
+) -> str:
+    """Use LLM to produce a short, friendly smalltalk reply in Vietnamese.
+
+    Falls back to a canned reply when `admission` sheds the call.
+    """
     try:
         load_api_key()
         model = get_llm_model_name()
@@ -144,35 +245,70 @@ def generate_smalltalk_reply(user_text: str) -> str:
             f"Người dùng: \"{user_text}\"\n"
             "Chỉ trả về câu trả lời, không giải thích."
         )
-        out = call_llm_json(prompt, model)  # may return string-able dict; fallback below
+
+        def run() -> Dict:
+            release = _take_slot(slot, admission)
+            try:
+                return _timed_llm_call(prompt, model)
+            finally:
+                release()
+
+        # Shed or out of budget while queued: the except below answers with the fallback
+        slot = [_admit(admission, deadline)]
+        try:
+            # may return string-able dict; fallback below
+            out = call_with_deadline(run, deadline)
+        finally:
+            _release_unused(slot)
         if isinstance(out, dict):
             # try common fields
             return str(out.get("text") or out.get("reply") or "Dạ vâng ạ!")
     except Exception:
         pass
     # Fallback generic
-    return "Dạ vâng ạ! Em cảm ơn mình ạ."
+    return _FALLBACK_SMALLTALK_REPLY
 
 
-def classify_intent(user_text: str) -> Dict:
+def classify_intent(
+    user_text: str,
+    deadline: Optional[Deadline] = None,
+    admission: Optional[AdmissionController] = None,
+) -> Dict:
     """Hybrid classifier returning fields used by service.
 
     Output compatibility with previous version:
       {"intent": "ship_fee"|"other", "wants_free": bool, "cancel_threat": bool}
     where intent="ship_fee" means the text is about shipping.
+
+    When `deadline` expires before the LLM answers, the regex result is used
+    and the output carries "degraded": True. When `admission` sheds the LLM
+    call, the regex result is used as well ("shed": True) unless
+    SHIPFEE_SHED_MODE=reject, in which case Overloaded is raised.
     """
+    started = time.perf_counter()
+    out = _classify_intent(user_text, deadline, admission)
+    path = "shed" if out.get("shed") else "degraded" if out.get("degraded") else ("llm" if out.get("used_llm") else "rules")
+    LATENCY.record(path, time.perf_counter() - started)
+    return out
+
+
+def _classify_intent(user_text: str, deadline: Optional[Deadline], admission: Optional[AdmissionController]) -> Dict:
     strategy = get_intent_strategy()
-    rule = _regex_detect(user_text)
+    with stage("ship_fee", "regex"):
+        rule = _regex_detect(user_text)
     use_llm = (strategy == "llm") or (rule["rule_score"] < 0.8)
     intent_final = rule["intent_guess"]
     wants_free = rule["wants_free"]
     cancel_threat = rule["cancel_threat"]
     is_smalltalk = bool(rule.get("is_smalltalk"))
     is_complaint = bool(rule.get("is_complaint"))
+    degraded = False
+    shed = False
 
     if use_llm:
         try:
-            llm = _llm_classify(user_text)
+            with stage("ship_fee", "llm_classify"):
+                llm = _llm_classify(user_text, deadline, admission)
             if isinstance(llm, dict):
                 if llm.get("intent") in {"fee_question_general", "fee_question_complaint", "ask_freeship", "cancel_threat", "smalltalk", "other"}:
                     intent_final = llm.get("intent")
@@ -182,6 +318,17 @@ def classify_intent(user_text: str) -> Dict:
                 about_fee_amount = bool(sig.get("about_fee_amount") or rule.get("about_fee_amount") or intent_final == "fee_question_general")
                 is_complaint = bool(sig.get("is_complaint") or is_complaint or intent_final == "fee_question_complaint")
                 is_smalltalk = bool(intent_final == "smalltalk" or is_smalltalk)
+        except DeadlineExceeded:
+            # Out of budget: fall back to the regex result
+            degraded = True
+            use_llm = False
+        except Overloaded:
+            if get_shed_mode() == "reject":
+                raise
+            # Shed under load: rule-only classification
+            degraded = True
+            shed = True
+            use_llm = False
         except Exception:
             pass
 
@@ -193,11 +340,14 @@ def classify_intent(user_text: str) -> Dict:
     if intent_final == "smalltalk":
         return {
             "intent": "smalltalk",
-            "smalltalk_reply": generate_smalltalk_reply(user_text),
+            "smalltalk_reply": _FALLBACK_SMALLTALK_REPLY if shed else generate_smalltalk_reply(user_text, deadline, admission),
             "wants_free": False,
             "cancel_threat": False,
             "about_fee_amount": False,
             "is_complaint": False,
+            "degraded": degraded,
+            "shed": shed,
+            "used_llm": use_llm,
         }
     # Normalize final intent for service layer
     if intent_final in {"fee_question_general", "fee_question_complaint"}:
@@ -216,6 +366,9 @@ def classify_intent(user_text: str) -> Dict:
         "cancel_threat": bool(cancel_threat),
         "about_fee_amount": bool(rule.get("about_fee_amount")) if not use_llm else bool(locals().get("about_fee_amount", rule.get("about_fee_amount"))),
         "is_complaint": bool(is_complaint),
+        "degraded": degraded,
+        "shed": shed,
+        "used_llm": use_llm,
     }
 
 
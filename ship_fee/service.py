@@ -1,15 +1,33 @@
+import asyncio
+import time
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
-from .config import get_orders_json_path, get_default_conversation_id, REPEAT_FREESHIP_TO_AGENT_THRESHOLD
+from .config import (
+    get_orders_json_path,
+    get_default_conversation_id,
+    get_debounce_window_ms,
+    get_latency_budget_ms,
+    REPEAT_FREESHIP_TO_AGENT_THRESHOLD,
+)
 from .orders import load_orders, pick_latest_active_order, extract_shipping_fee, has_success_order
 from .counter import CounterStore
+from .debounce import MessageBuffer
+from .deadline import Deadline
+from .admission import AdmissionController
 from .intent import classify_intent
 from . import templates as T
+from product_qa.metrics import REGISTRY, stage
 
 
 COUNTER_PREFIX = "shipfee:"
 
+ANSWERS = REGISTRY.counter(
+    "shipfee_answers_total",
+    "Ship-fee answers by case and picked_reason.",
+    ["case", "picked_reason"],
+)
+
 
 @dataclass
 class ShipFeeResponse:
@@ -28,9 +46,98 @@ def _tagged_key(conversation_id: str) -> str:
     return f"{COUNTER_PREFIX}{conversation_id}:tagged"
 
 
+def _buffer_key(conversation_id: str) -> str:
+    return f"{COUNTER_PREFIX}{conversation_id}:buf"
+
+
 class ShipFeeService:
-    def __init__(self, counter: Optional[CounterStore] = None) -> None:
+    def __init__(
+        self,
+        counter: Optional[CounterStore] = None,
+        buffer: Optional[MessageBuffer] = None,
+        admission: Optional[AdmissionController] = None,
+    ) -> None:
         self.counter = counter or CounterStore()
+        self.buffer = buffer or MessageBuffer()
+        # Bounds concurrent LLM classification calls in this process
+        self.admission = admission or AdmissionController.from_env()
+
+    def answer_debounced(
+        self,
+        user_text: str,
+        conversation_id: Optional[str] = None,
+        orders_json_path: Optional[str] = None,
+        orders_data: Optional[Dict[str, Any]] = None,
+        window_ms: Optional[int] = None,
+    ) -> ShipFeeResponse:
+        """Buffer bursty messages per conversation and answer them once.
+
+        Every message waits for the quiet window; only the last message of the
+        burst is answered, using the concatenated text. Earlier messages get
+        case="debounced" with an empty reply.
+        """
+        pending = self._debounce_push(user_text, conversation_id, window_ms)
+        if pending is None:
+            return self.answer(user_text, conversation_id, orders_json_path, orders_data)
+        time.sleep(pending[2] / 1000.0)
+        return self._answer_burst(pending, user_text, orders_json_path, orders_data)
+
+    async def answer_debounced_async(
+        self,
+        user_text: str,
+        conversation_id: Optional[str] = None,
+        orders_json_path: Optional[str] = None,
+        orders_data: Optional[Dict[str, Any]] = None,
+        window_ms: Optional[int] = None,
+    ) -> ShipFeeResponse:
+        """`answer_debounced` for async handlers: the quiet window is awaited, not slept in a thread."""
+        pending = await asyncio.to_thread(self._debounce_push, user_text, conversation_id, window_ms)
+        if pending is None:
+            return await asyncio.to_thread(self.answer, user_text, conversation_id, orders_json_path, orders_data)
+        await asyncio.sleep(pending[2] / 1000.0)
+        return await asyncio.to_thread(self._answer_burst, pending, user_text, orders_json_path, orders_data)
+
+    def _debounce_push(
+        self, user_text: str, conversation_id: Optional[str], window_ms: Optional[int]
+    ) -> Optional[Tuple[str, int, int]]:
+        # (conversation id, sequence, window ms), or None when the message must be answered right away
+        window = get_debounce_window_ms() if window_ms is None else max(0, int(window_ms))
+        if window <= 0:
+            return None
+        conv_id = conversation_id or get_default_conversation_id()
+        seq = self.buffer.push(_buffer_key(conv_id), user_text, ttl_seconds=max(60, window // 1000 * 4))
+        if seq is None:
+            return None
+        return conv_id, seq, window
+
+    def _answer_burst(
+        self,
+        pending: Tuple[str, int, int],
+        user_text: str,
+        orders_json_path: Optional[str],
+        orders_data: Optional[Dict[str, Any]],
+    ) -> ShipFeeResponse:
+        conv_id, seq, _ = pending
+        messages = self.buffer.drain_if_latest(_buffer_key(conv_id), seq)
+        if messages is None:
+            ANSWERS.inc(case="debounced", picked_reason="merged_into_later_message")
+            return ShipFeeResponse(
+                case="debounced",
+                reply_text="",
+                action=None,
+                actions={"apply_free_shipping": False},
+                diagnostic={
+                    "asked_count": self.counter.get_current(_counter_key(conv_id)),
+                    "shipping_fee": None,
+                    "order_id": None,
+                    "status": None,
+                    "picked_reason": "merged_into_later_message",
+                },
+            )
+        combined = " ".join(m.strip() for m in messages if m and m.strip()) or user_text
+        resp = self.answer(combined, conv_id, orders_json_path, orders_data)
+        resp.diagnostic["merged_messages"] = max(1, len(messages))
+        return resp
 
     def answer(
         self,
@@ -38,6 +145,22 @@ class ShipFeeService:
         conversation_id: Optional[str] = None,
         orders_json_path: Optional[str] = None,
         orders_data: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> ShipFeeResponse:
+        # Latency budget for the whole answer; the LLM only gets what is left of it
+        deadline = deadline or Deadline(get_latency_budget_ms())
+        with stage("ship_fee", "answer"):
+            resp = self._answer(user_text, conversation_id, orders_json_path, orders_data, deadline)
+        ANSWERS.inc(case=resp.case, picked_reason=str(resp.diagnostic.get("picked_reason")))
+        return resp
+
+    def _answer(
+        self,
+        user_text: str,
+        conversation_id: Optional[str],
+        orders_json_path: Optional[str],
+        orders_data: Optional[Dict[str, Any]],
+        deadline: Deadline,
     ) -> ShipFeeResponse:
         conv_id = conversation_id or get_default_conversation_id()
         key = _counter_key(conv_id)
@@ -62,12 +185,13 @@ class ShipFeeService:
                 },
             )
 
-        if orders_data is not None:
-            data = orders_data
-        else:
-            orders_path = orders_json_path or get_orders_json_path()
-            data = load_orders(orders_path)
-        order = pick_latest_active_order(data)
+        with stage("ship_fee", "order_load"):
+            if orders_data is not None:
+                data = orders_data
+            else:
+                orders_path = orders_json_path or get_orders_json_path()
+                data = load_orders(orders_path)
+            order = pick_latest_active_order(data)
 
         if not order:
             return ShipFeeResponse(
@@ -104,7 +228,10 @@ class ShipFeeService:
                 },
             )
 
-        signals = classify_intent(user_text)
+        # May raise admission.Overloaded when SHIPFEE_SHED_MODE=reject
+        signals = classify_intent(user_text, deadline, self.admission)
+        # True when the LLM ran out of budget (or was shed) and the regex result was used
+        degraded = bool(signals.get("degraded"))
 
         # Case selection per plan
         # If intent is smalltalk, return LLM smalltalk reply without counting
@@ -120,6 +247,7 @@ class ShipFeeService:
                     "order_id": order_id,
                     "status": status,
                     "picked_reason": "smalltalk",
+                    "degraded": degraded,
                 },
             )
 
@@ -137,6 +265,7 @@ class ShipFeeService:
                     "order_id": order_id,
                     "status": status,
                     "picked_reason": "cancel_threat_tag_agent",
+                    "degraded": degraded,
                 },
             )
 
@@ -153,6 +282,7 @@ class ShipFeeService:
                     "order_id": order_id,
                     "status": status,
                     "picked_reason": "fee_complaint_priority",
+                    "degraded": degraded,
                 },
             )
 
@@ -169,6 +299,7 @@ class ShipFeeService:
                     "order_id": order_id,
                     "status": status,
                     "picked_reason": "explicit_fee_question",
+                    "degraded": degraded,
                 },
             )
 
@@ -187,6 +318,7 @@ class ShipFeeService:
                     "order_id": order_id,
                     "status": status,
                     "picked_reason": "first_time_ask",
+                    "degraded": degraded,
                 },
             )
 
@@ -207,6 +339,7 @@ class ShipFeeService:
                         "order_id": order_id,
                         "status": status,
                         "picked_reason": "ask_free_first_time",
+                        "degraded": degraded,
                     },
                 )
             # second time or more
@@ -226,6 +359,7 @@ class ShipFeeService:
                     "order_id": order_id,
                     "status": status,
                     "picked_reason": "ask_free_repeat",
+                    "degraded": degraded,
                 },
             )
 
@@ -241,6 +375,7 @@ class ShipFeeService:
                 "order_id": order_id,
                 "status": status,
                 "picked_reason": "fallback_first_time",
+                "degraded": degraded,
             },
         )
 
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+from product_qa.answer_cache import snapshot_key
+from product_qa.pipeline import _cacheable
+
+
+def _answer(**overrides):
+    out = {
+        "intent": "product_query",
+        "keywords": ["nồi ủ"],
+        "candidates": [{"display_id": "1", "score": 0.9}],
+        "reranked": {"selections": [{"keyword": "nồi ủ", "display_ids": ["1"]}]},
+        "final_product": {"keyword": "nồi ủ", "product": {"display_id": "1"}},
+        "catalog_version": 1,
+    }
+    out.update(overrides)
+    return out
+
+
+def test_answer_with_product_is_cached():
+    assert _cacheable(_answer())
+
+
+def test_keyword_error_is_not_cached():
+    assert not _cacheable(_answer(keyword_error="Malformed JSON"))
+
+
+def test_rerank_error_is_not_cached():
+    assert not _cacheable(_answer(reranked={"error": "Malformed JSON", "raw": "x"}))
+
+
+def test_no_selected_product_is_not_cached():
+    assert not _cacheable(_answer(final_product={"keyword": None, "product": None}))
+    assert not _cacheable({"intent": "product_query", "keywords": [], "results": []})
+
+
+def _snapshot(partitions=None):
+    return SimpleNamespace(fingerprint="f" * 40, idx=None, lexical=None, phrases=None, partitions=partitions)
+
+
+def test_snapshot_key_covers_ranking_settings(monkeypatch):
+    snap = _snapshot(partitions=object())
+    base = snapshot_key(snap, min_final_score=0.6)
+    assert snapshot_key(snap, min_final_score=0.7) != base
+    monkeypatch.setenv("PRODUCT_QA_RERANK_TOKEN_BUDGET", "123")
+    assert snapshot_key(snap, min_final_score=0.6) != base
+    monkeypatch.delenv("PRODUCT_QA_RERANK_TOKEN_BUDGET")
+    monkeypatch.setenv("PRODUCT_QA_PARTITION_MIN_SCORE", "0.9")
+    assert snapshot_key(snap, min_final_score=0.6) != base
+    monkeypatch.delenv("PRODUCT_QA_PARTITION_MIN_SCORE")
+    monkeypatch.setenv("PRODUCT_QA_PARTITION_MIN_COSINE", "0.9")
+    assert snapshot_key(snap, min_final_score=0.6) != base